@@ -1,22 +1,25 @@
 ﻿import asyncio
+import json
 import logging
 import re
 import time
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager, nullcontext
 from datetime import datetime
-from collections import defaultdict, deque
 from pathlib import Path
+from typing import Literal
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 import config
-from utils.model_fetcher import fetch_free_models, resolve_model
+from utils.model_fetcher import failover_chain, fetch_free_models, resolve_model
 from utils.novel_workflow import (
     build_expand_prompt,
     build_continue_prompt,
@@ -26,9 +29,58 @@ from utils.novel_workflow import (
     build_rewrite_prompt,
     get_default_workflow_questions,
 )
-from utils.openrouter_api import check_model_connection, generate_content
-from utils.fanqie_publisher import publish_chapter_via_cdp, probe_cdp_endpoint
-from utils.content_quality import audit_chapters, clean_chapter_content, ensure_unique_titles
+from utils.openrouter_api import (
+    breakers,
+    check_model_connection,
+    generate_content,
+    generate_flight,
+    generate_with_failover,
+    hedger,
+    model_key,
+    model_stats,
+    stream_with_failover,
+    upstream_limiter,
+)
+from utils.fanqie_publisher import CdpBrowserPool, publish_chapter_via_cdp, probe_cdp_endpoint
+from utils.http_pool import http_pool
+from utils.model_health import ModelHealthMonitor
+from utils.model_router import ModelRouter, Route
+from utils.loop_monitor import LoopWatchdog
+from utils.offload import CpuOffload
+from utils.shared_state import LeaseManager, SharedRateLimiter, create_backend, lock_single_process
+from utils.postprocess import chapters_size, clean_and_audit, extract_single_continue_chapter, parse_expanded, parse_generated
+from utils.tracing import OtlpJsonFileExporter, begin_trace, current_trace, detach, record_span, span
+from utils.metrics import (
+    cache_hit_ratio,
+    cache_lookups,
+    generate_in_use,
+    generate_wait_seconds,
+    generate_waiting,
+    generated_calls,
+    generated_chapters,
+    http_request_seconds,
+    publish_attempts,
+    publish_seconds,
+    publish_success,
+    queue_depth,
+    registry as metrics_registry,
+)
+from utils.cache import response_cache
+from utils.prompt_cache import NearDupCache, canonical, scope_key
+from utils.publish_store import PublishStore
+from utils.story_memory import build_story_context
+from utils.book_engine import ACTIVE_STATUSES, BookJobStore, BookStages, job_summary, run_book_job
+from utils.content_quality import (
+    CHAPTER_HEADING_PATTERN,
+    NOVEL_TITLE_PATTERN,
+    AuditTotals,
+    BookAuditRegistry,
+    audit_chapters,
+    clean_chapter_content,
+    default_auditor,
+    extract_title_and_chapters,
+)
+from utils.quality_batch import chapters_from_json, stream_book_audit
 
 # Ensure .env is loaded from project root regardless of process cwd.
 load_dotenv(Path(__file__).parent / ".env")
@@ -51,6 +103,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["x-request-id", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy", "Retry-After"],
 )
 
 
@@ -74,6 +127,7 @@ class GenerateRequest(BaseModel):
     existing_chapters: list | None = None
     novel_title: str | None = None
     style_strength: str | None = None
+    debug_timings: bool = False
 
 
 class FanqiePublishRequest(BaseModel):
@@ -85,6 +139,7 @@ class FanqiePublishRequest(BaseModel):
     dry_run: bool = False
     auto_publish: bool = True
     timeout_ms: int = 45000
+    fill_mode: Literal["auto", "type"] = "auto"
 
 
 class FanqieScheduleRequest(BaseModel):
@@ -97,6 +152,7 @@ class FanqieScheduleRequest(BaseModel):
     retry_delay_sec: int = 120
     selectors: dict | None = None
     timeout_ms: int = 45000
+    fill_mode: Literal["auto", "type"] = "auto"
 
 
 class FanqieCdpProbeRequest(BaseModel):
@@ -104,33 +160,150 @@ class FanqieCdpProbeRequest(BaseModel):
     timeout_ms: int = 8000
 
 
-class InMemoryRateLimiter:
-    def __init__(self, limit_per_minute: int):
-        self.limit_per_minute = limit_per_minute
-        self._hits: dict[str, deque] = defaultdict(deque)
-
-    def allow(self, key: str) -> bool:
-        now = time.time()
-        bucket = self._hits[key]
-        window_start = now - 60
-        while bucket and bucket[0] < window_start:
-            bucket.popleft()
-        if len(bucket) >= self.limit_per_minute:
-            return False
-        bucket.append(now)
-        return True
+class BookJobRequest(BaseModel):
+    prompt: str = Field(min_length=1)
+    chapter_count: int = Field(default=10, ge=1)
+    model: str | None = None
+    custom_model: dict | None = None
+    genre: str | None = None
+    workflow_answers: dict | None = None
+    style_prompt: str | None = None
+    custom_prompt: str | None = None
+    style_strength: str | None = None
+    chapter_min_words: int | None = None
+    chapter_max_words: int | None = None
+    role_cards: list | None = None
+    org_cards: list | None = None
+    profession_system: dict | None = None
+    foreshadows: list | None = None
+
+
+class QualityAuditRequest(BaseModel):
+    title: str | None = None
+    chapters: list | None = None
+    text: str | None = None
+
+
+class CachePurgeRequest(BaseModel):
+    expired_only: bool = False
+    cache_model_id: str | None = None
+
+
+shared = create_backend(
+    config.SHARED_BACKEND,
+    sqlite_path=config.SHARED_DB_PATH,
+    redis_url=config.SHARED_REDIS_URL,
+    max_rate_keys=config.RATE_LIMIT_MAX_KEYS,
+)
+rate_limiter = SharedRateLimiter(
+    shared,
+    config.RATE_LIMIT_PER_MINUTE,
+    {
+        "gen": config.RATE_LIMIT_GEN_PER_MINUTE,
+        "health": config.RATE_LIMIT_HEALTH_PER_MINUTE,
+        "publish": config.RATE_LIMIT_PUBLISH_PER_MINUTE,
+    },
+)
+leases = LeaseManager(shared, config.LEADER_LEASE_SEC)
+LEADER_LEASE = "publish-scheduler"
+
 
+def _worker_lease(owner: str) -> str:
+    """Held by every live worker; publish jobs it claimed are orphaned once it expires."""
+    return f"worker:{owner}"
 
-rate_limiter = InMemoryRateLimiter(config.RATE_LIMIT_PER_MINUTE)
+
+PUBLISH_WORKER_TASKS: list[asyncio.Task] = []
+lease_task: asyncio.Task | None = None
+_last_book_sweep = 0.0
+_shutting_down = False
+_memory_backend_lock = None  # held while this process serves DATA_DIR with the memory backend
 generate_semaphore = asyncio.Semaphore(config.MAX_GENERATE_CONCURRENCY)
-PUBLISH_TASKS: list[dict] = []
-DASHBOARD_STATS = {
-    "generated_calls": 0,
-    "generated_chapters": 0,
-    "published_attempts": 0,
-    "published_success": 0,
-}
-PUBLISH_QUEUE: list[dict] = []
+publish_store = PublishStore(
+    config.PUBLISH_DB_PATH,
+    job_retention=config.PUBLISH_JOB_RETENTION,
+    task_retention=config.PUBLISH_TASK_RETENTION,
+)
+publish_wakeup = asyncio.Event()
+browser_pool = CdpBrowserPool(max_idle_pages=config.PUBLISH_PAGE_POOL_SIZE)
+book_store = BookJobStore(config.BOOK_DIR)
+BOOK_TASKS: dict[str, asyncio.Task] = {}
+audit_pool: ProcessPoolExecutor | None = None
+book_audits = BookAuditRegistry(default_auditor, max_books=config.QUALITY_BOOK_CACHE_SIZE)
+near_dup_cache = NearDupCache(
+    modes=config.CACHE_NEAR_DUP_MODES if config.CACHE_ENABLED else set(),
+    threshold=config.CACHE_NEAR_DUP_THRESHOLD,
+    ttl_sec=config.CACHE_NEAR_DUP_TTL_SEC,
+    max_entries=config.CACHE_NEAR_DUP_MAX_ENTRIES,
+)
+health_task: asyncio.Task | None = None
+offload = CpuOffload(
+    config.POSTPROCESS_EXECUTOR,
+    workers=config.POSTPROCESS_WORKERS,
+    max_pending=config.POSTPROCESS_MAX_PENDING,
+    inline_chars=config.POSTPROCESS_INLINE_CHARS,
+)
+loop_watchdog = LoopWatchdog(config.LOOP_BLOCK_WARN_MS / 1000)
+loop_watchdog_task: asyncio.Task | None = None
+trace_exporter = OtlpJsonFileExporter(config.TRACE_EXPORT_PATH, config.APP_NAME) if config.TRACE_EXPORT_PATH else None
+
+
+def _health_to_breaker(model: dict, ok: bool, detail: str) -> None:
+    # A failed probe opens the model's breaker so live traffic fails over right away.
+    if ok:
+        breakers.record_success(model_key(model))
+    else:
+        breakers.record_failure(model_key(model), detail, trip=True)
+
+
+model_health = ModelHealthMonitor(
+    check_model_connection,
+    key=model_key,
+    ttl=config.MODEL_HEALTH_TTL_SEC,
+    timeout=config.MODEL_HEALTH_TIMEOUT,
+    concurrency=config.MODEL_HEALTH_CONCURRENCY,
+    on_result=_health_to_breaker,
+)
+model_router = ModelRouter(
+    model_stats,
+    key=model_key,
+    is_open=breakers.is_open,
+    is_unhealthy=lambda m: model_health.get(m).ok is False,
+    probe_latency=lambda m: model_health.get(m).latency.percentile(50),
+    prior_tokens_per_sec=config.ROUTER_PRIOR_TOKENS_PER_SEC,
+    explore_ratio=config.ROUTER_EXPLORE_RATIO,
+)
+RUNNING_BOOKS: dict[str, dict] = {}
+
+
+DASHBOARD_COUNTERS = ("generated_calls", "generated_chapters", "published_attempts", "published_success")
+
+
+async def _dashboard_stats() -> dict:
+    # Shared counters, so every worker reports the same totals (metrics stay per process).
+    return await shared.counters(list(DASHBOARD_COUNTERS))
+
+
+@asynccontextmanager
+async def _generate_slot():
+    """generate_semaphore, with wait time and queue depth recorded for /metrics."""
+    started = time.monotonic()
+    started_ns = time.time_ns()
+    generate_waiting.inc()
+    try:
+        await generate_semaphore.acquire()
+    finally:
+        generate_waiting.dec()
+    waited = time.monotonic() - started
+    generate_wait_seconds.observe(waited)
+    if waited >= 0.001:
+        record_span("generate_slot_wait", started_ns)
+    generate_in_use.inc()
+    try:
+        yield
+    finally:
+        generate_in_use.dec()
+        generate_semaphore.release()
 
 
 def _client_ip(request: Request) -> str:
@@ -140,6 +313,23 @@ def _client_ip(request: Request) -> str:
     return request.client.host if request.client else "unknown"
 
 
+async def _rate_limited(request: Request, route_class: str, key: str) -> JSONResponse | None:
+    """Count the request against its route class; a 429 response if over the limit.
+
+    The decision is kept on request.state so the middleware adds RateLimit-* headers to
+    the normal response too.
+    """
+    decision = await rate_limiter.check(route_class, key)
+    request.state.rate_limit = decision
+    if decision.allowed:
+        return None
+    return JSONResponse(
+        status_code=429,
+        content={"success": False, "error": "rate limit exceeded"},
+        headers=decision.headers(),
+    )
+
+
 def _api_key_ok(request: Request) -> bool:
     if not config.SERVICE_API_KEY:
         return True
@@ -147,31 +337,57 @@ def _api_key_ok(request: Request) -> bool:
     return key == config.SERVICE_API_KEY
 
 
-def extract_title_and_chapters(content: str) -> tuple[str, list[dict]]:
-    title_match = re.search(r"《([^》]+)》", content)
-    title = title_match.group(1) if title_match else "未命名小说"
-
-    chapter_pattern = re.compile(r"(?m)^(第\s*[一二三四五六七八九十百千万\d]+\s*[章节卷]\s*[^\n]*)")
-    matches = list(chapter_pattern.finditer(content))
-
-    chapters = []
-    if matches:
-        for idx, m in enumerate(matches):
-            start = m.end()
-            end = matches[idx + 1].start() if idx + 1 < len(matches) else len(content)
-            body = content[start:end].strip()
-            if body:
-                chapters.append({"title": m.group(1).strip(), "content": body})
-
-    if not chapters:
-        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", content.strip()) if p.strip()]
-        if len(paragraphs) >= 2:
-            for i, p in enumerate(paragraphs[:10], 1):
-                chapters.append({"title": f"第{i}章", "content": p})
-        elif content.strip():
-            chapters.append({"title": "第1章", "content": content.strip()})
-
-    return title, chapters
+class IncrementalChapterParser:
+    """Detect novel title and chapter boundaries while tokens are still streaming in.
+
+    Uses the same heading pattern as extract_title_and_chapters, but only scans complete
+    lines so a half-received heading is never reported. A chapter is emitted once the
+    next heading arrives (or on finish()).
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.title: str | None = None
+        self._scanned = 0
+        self._heading: re.Match | None = None
+        self.emitted = 0
+
+    def feed(self, delta: str) -> list[dict]:
+        self.buffer += delta
+        events: list[dict] = []
+        complete = self.buffer.rfind("\n") + 1
+        if complete <= self._scanned:
+            return events
+        if self.title is None:
+            title_match = NOVEL_TITLE_PATTERN.search(self.buffer, 0, complete)
+            if title_match:
+                self.title = title_match.group(1)
+                events.append({"event": "title", "title": self.title})
+        # _scanned always sits just after a newline, so (?m)^ still anchors at the slice start.
+        for m in CHAPTER_HEADING_PATTERN.finditer(self.buffer, self._scanned, complete):
+            chapter = self._close_current(m.start())
+            if chapter:
+                events.append(chapter)
+            self._heading = m
+            events.append({"event": "chapter_start", "index": self.emitted + 1, "title": m.group(1).strip()})
+        self._scanned = complete
+        return events
+
+    def _close_current(self, end: int) -> dict | None:
+        if self._heading is None:
+            return None
+        body = self.buffer[self._heading.end():end].strip()
+        heading = self._heading.group(1).strip()
+        self._heading = None
+        if not body:
+            return None
+        self.emitted += 1
+        return {"event": "chapter", "index": self.emitted, "title": heading, "content": clean_chapter_content(body)}
+
+    def finish(self) -> list[dict]:
+        self.feed("\n")
+        chapter = self._close_current(len(self.buffer))
+        return [chapter] if chapter else []
 
 
 def _net_word_count(text: str) -> int:
@@ -179,27 +395,6 @@ def _net_word_count(text: str) -> int:
     return len(re.sub(r"[\s\W_]+", "", text or "", flags=re.UNICODE))
 
 
-def _extract_single_continue_chapter(content: str, next_idx: int) -> dict:
-    text = (content or "").strip()
-    if not text:
-        return {"title": f"第{next_idx}章", "content": ""}
-
-    # Prefer explicit chapter heading.
-    m = re.search(rf"(?m)^\s*第\s*{next_idx}\s*[章节卷]\s*[^\n]*", text)
-    if m:
-        title = m.group(0).strip()
-        body = text[m.end():].strip()
-        return {"title": title or f"第{next_idx}章", "content": body}
-
-    # Fallback: use first line as title only if it looks like a chapter heading.
-    first_line, _, rest = text.partition("\n")
-    if re.search(r"^\s*第\s*[一二三四五六七八九十百千万\d]+\s*[章节卷]", first_line):
-        return {"title": first_line.strip(), "content": rest.strip()}
-
-    # Hard fallback: force correct next-chapter title and keep full body.
-    return {"title": f"第{next_idx}章", "content": text}
-
-
 def _looks_like_outline(chapters: list[dict], min_words: int) -> bool:
     if not chapters:
         return False
@@ -213,6 +408,47 @@ def _looks_like_outline(chapters: list[dict], min_words: int) -> bool:
     return len(chapters) >= 4 and short >= max(3, int(len(chapters) * 0.7))
 
 
+OUTLINE_ONLY_ERROR = "模型输出为章节摘要，未达到正文长度。请切换更大上下文模型，或先生成少量章节再批量续写。"
+TOO_SHORT_ERROR = "模型多次生成仍偏短。建议换模型/提高上下文容量后重试。"
+CONTINUE_SHORT_ERROR = "续写结果过短或格式异常，请重试或切换模型"
+
+
+def _continue_too_short(chapters: list[dict], min_words: int) -> bool:
+    # Too short continue outputs usually indicate provider formatting drift; fail fast instead of polluting chapter list.
+    return _net_word_count(chapters[0]["content"]) < max(200, int(min_words * 0.25))
+
+
+async def _outline_fallback(model_dict: dict, body: GenerateRequest, title: str, min_words: int) -> list[dict] | None:
+    """Regenerate an outline-only answer as one full first chapter; None if that is short too."""
+    fallback_prompt = build_continue_prompt(
+        novel_title=title or "未命名小说",
+        existing_chapters_text="",
+        next_chapter_index=1,
+        genre=body.genre,
+        style_prompt=body.style_prompt,
+        chapter_min_words=body.chapter_min_words,
+        chapter_max_words=body.chapter_max_words,
+        style_strength=body.style_strength,
+    )
+    with span("outline_fallback"):
+        async with _generate_slot():
+            fallback_content = await asyncio.wait_for(
+                generate_content(model_dict, fallback_prompt),
+                timeout=config.REQUEST_TIMEOUT + 10,
+            )
+    if not fallback_content:
+        return None
+    _, (one,) = await offload.run("parse", parse_generated, fallback_content, "continue", 1, size=len(fallback_content))
+    return [one] if _net_word_count(one["content"]) >= max(200, int(min_words * 0.25)) else None
+
+
+def _still_too_short(chapters: list[dict], min_words: int, mode: str, expand_timed_out: bool) -> bool:
+    """Final guard after expansion. After an expansion deadline the best-so-far chapters
+    are returned instead."""
+    too_short = [c for c in chapters if _net_word_count(c.get("content", "")) < max(300, int(min_words * 0.5))]
+    return bool(too_short) and not expand_timed_out and mode in {"generate", "continue", "expand"}
+
+
 async def _auto_expand_short_chapter(
     model_dict: dict,
     chapter: dict,
@@ -221,31 +457,207 @@ async def _auto_expand_short_chapter(
     style_strength: str | None,
     chapter_min_words: int,
     max_rounds: int = 2,
+    progress: dict | None = None,
 ) -> dict:
-    cur = {"title": chapter.get("title", "章节"), "content": chapter.get("content", "")}
+    with span("expand_chapter", title=str(chapter.get("title", ""))[:60]) as sp:
+        cur = {"title": chapter.get("title", "章节"), "content": chapter.get("content", "")}
+        target_floor = max(300, int(chapter_min_words * 0.8))
+        for round_idx in range(max_rounds):
+            if _net_word_count(cur.get("content", "")) >= target_floor:
+                return cur
+            if sp is not None:
+                sp.set(rounds=round_idx + 1)
+            expand_input = f"{cur.get('title','章节')}\n\n{cur.get('content','')}"
+            expand_prompt = build_expand_prompt(chapter_text=expand_input, genre=genre, style_strength=style_strength)
+            async with _generate_slot():
+                expanded = await asyncio.wait_for(
+                    generate_content(model_dict, expand_prompt),
+                    timeout=config.REQUEST_TIMEOUT + 10,
+                )
+            if not expanded:
+                return cur
+            cur = await offload.run("parse_expanded", parse_expanded, expanded, cur["title"], size=len(expanded))
+            if progress is not None:
+                # Expose the best-so-far version so a deadline can still return it.
+                progress["best"] = cur
+        return cur
+
+
+async def _expand_short_chapters(
+    model_dict: dict,
+    chapters: list[dict],
+    *,
+    genre: str | None,
+    style_strength: str | None,
+    chapter_min_words: int,
+    max_rounds: int = 2,
+) -> tuple[list[dict], bool]:
+    """Expand short chapters concurrently; return (chapters, timed_out).
+
+    Each upstream call still goes through generate_semaphore; EXPAND_CONCURRENCY caps how
+    many chapters one request may fan out at once. When EXPAND_DEADLINE_SEC elapses the
+    unfinished expansions are cancelled and their best-so-far versions are kept.
+    """
     target_floor = max(300, int(chapter_min_words * 0.8))
-    for _ in range(max_rounds):
-        if _net_word_count(cur.get("content", "")) >= target_floor:
-            return cur
-        expand_input = f"{cur.get('title','章节')}\n\n{cur.get('content','')}"
-        expand_prompt = build_expand_prompt(chapter_text=expand_input, genre=genre, style_strength=style_strength)
-        expanded = await asyncio.wait_for(
-            generate_content(model_dict, expand_prompt),
-            timeout=config.REQUEST_TIMEOUT + 10,
+    budget = asyncio.Semaphore(max(1, config.EXPAND_CONCURRENCY))
+    progress: list[dict] = [{"best": ch} for ch in chapters]
+
+    async def _run(idx: int, ch: dict) -> dict:
+        async with budget:
+            return await _auto_expand_short_chapter(
+                model_dict,
+                ch,
+                genre=genre,
+                style_strength=style_strength,
+                chapter_min_words=chapter_min_words,
+                max_rounds=max_rounds,
+                progress=progress[idx],
+            )
+
+    tasks = {
+        idx: asyncio.create_task(_run(idx, ch))
+        for idx, ch in enumerate(chapters)
+        if _net_word_count(ch.get("content", "")) < target_floor
+    }
+    timed_out = False
+    if tasks:
+        _, pending = await asyncio.wait(tasks.values(), timeout=config.EXPAND_DEADLINE_SEC)
+        if pending:
+            timed_out = True
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning("Chapter expansion deadline hit: %s/%s unfinished", len(pending), len(tasks))
+
+    out = []
+    for idx, ch in enumerate(chapters):
+        cur = ch
+        task = tasks.get(idx)
+        if task is not None:
+            if task.cancelled():
+                cur = progress[idx]["best"]
+            elif task.exception() is not None:
+                logger.warning("Chapter expansion failed idx=%s: %s", idx, task.exception())
+                cur = progress[idx]["best"]
+            else:
+                cur = task.result()
+        out.append({"title": cur.get("title", ch.get("title", "章节")), "content": clean_chapter_content(cur.get("content", ""))})
+    return out, timed_out
+
+
+async def _book_llm(model_dict: dict, prompt: str) -> str | None:
+    async with _generate_slot():
+        content, _ = await generate_with_failover(_model_chain(model_dict), prompt, candidate_timeout=config.REQUEST_TIMEOUT + 10)
+        return content
+
+
+async def _book_expand(model_dict: dict, chapter: dict, req: dict) -> dict:
+    return await _auto_expand_short_chapter(
+        model_dict,
+        chapter,
+        genre=req.get("genre"),
+        style_strength=req.get("style_strength"),
+        chapter_min_words=int(req.get("chapter_min_words") or 3000),
+        max_rounds=2,
+    )
+
+
+BOOK_STAGES = BookStages(
+    llm=_book_llm,
+    expand=_book_expand,
+    parse_chapter=extract_single_continue_chapter,
+    clean_and_audit=lambda title, content: offload.run("clean_audit", clean_and_audit, title, content, size=len(content)),
+    audit_book=lambda chapters: offload.run("audit", audit_chapters, chapters, size=chapters_size(chapters)),
+)
+
+
+def _start_book_job(job: dict) -> None:
+    task = asyncio.create_task(
+        run_book_job(
+            job,
+            store=book_store,
+            stages=BOOK_STAGES,
+            post_concurrency=config.BOOK_POST_CONCURRENCY,
+            memory_budget=config.STORY_MEMORY_BUDGET,
         )
-        if not expanded:
-            return cur
-        _, parsed = extract_title_and_chapters(expanded)
-        if parsed:
-            nxt = parsed[0]
-            cur = {"title": nxt.get("title") or cur["title"], "content": clean_chapter_content(nxt.get("content", ""))}
-        else:
-            cur = {"title": cur["title"], "content": clean_chapter_content(expanded)}
-    return cur
+    )
+    BOOK_TASKS[job["job_id"]] = task
+    RUNNING_BOOKS[job["job_id"]] = job
+    task.add_done_callback(lambda _t, jid=job["job_id"]: _book_job_done(jid))
+
+
+def _book_job_done(job_id: str) -> None:
+    BOOK_TASKS.pop(job_id, None)
+    RUNNING_BOOKS.pop(job_id, None)
+    if not _shutting_down:
+        # On shutdown release_all() drops the lease, so another worker can resume the job.
+        asyncio.get_running_loop().create_task(leases.release(f"book:{job_id}"))
+
+
+async def _sweep_book_jobs() -> None:
+    """Start active book jobs nobody holds a lease on (new process, or a dead worker's)."""
+    global _last_book_sweep
+    _last_book_sweep = time.monotonic()
+    for job in await asyncio.to_thread(book_store.list_jobs):
+        jid = job["job_id"]
+        if job.get("status") in ACTIVE_STATUSES and jid not in BOOK_TASKS and await leases.acquire(f"book:{jid}"):
+            logger.info("Resuming book job id=%s status=%s worker=%s", jid, job.get("status"), leases.owner)
+            _start_book_job(job)
+
+
+async def _requeue_orphaned_publish_jobs() -> None:
+    """Re-queue running publish jobs whose owner no longer holds its worker lease. A
+    previous leader that is still alive keeps its jobs until it stops them itself."""
+    dead = set()
+    for owner in await asyncio.to_thread(publish_store.running_owners):
+        if owner != leases.owner and (not owner or await shared.owner(_worker_lease(owner)) != owner):
+            dead.add(owner)
+    if dead:
+        requeued = await asyncio.to_thread(publish_store.requeue_running, dead)
+        if requeued:
+            logger.warning("Re-queued %s publish jobs left running by a stopped worker", requeued)
+
+
+def _lease_lost(name: str) -> None:
+    """Another worker took over `name`: stop the book job it guarded without saving."""
+    if name.startswith("book:"):
+        jid = name.removeprefix("book:")
+        task = BOOK_TASKS.get(jid)
+        if task is not None:
+            RUNNING_BOOKS[jid]["lease_lost"] = True
+            task.cancel()
+
+
+async def _lease_tick() -> None:
+    """Every LEADER_LEASE_SEC/3: leader election for the publish scheduler, orphaned
+    publish and book jobs, and cancels requested through other workers."""
+    if not leases.holds(_worker_lease(leases.owner)):
+        await leases.acquire(_worker_lease(leases.owner))
+    if await leases.acquire(LEADER_LEASE):
+        await _requeue_orphaned_publish_jobs()
+        if not PUBLISH_WORKER_TASKS:
+            logger.info("Worker %s is the publish scheduler leader", leases.owner)
+            for idx in range(max(1, config.PUBLISH_WORKERS)):
+                PUBLISH_WORKER_TASKS.append(asyncio.create_task(_publish_queue_worker(idx)))
+        if not _last_book_sweep or (shared.multi_process and time.monotonic() - _last_book_sweep >= config.BOOK_SWEEP_SEC):
+            await _sweep_book_jobs()
+    elif PUBLISH_WORKER_TASKS:
+        logger.warning("Worker %s lost publish scheduler leadership", leases.owner)
+        for task in PUBLISH_WORKER_TASKS:
+            task.cancel()
+        PUBLISH_WORKER_TASKS.clear()
+    if shared.multi_process:
+        for jid, job in list(RUNNING_BOOKS.items()):
+            if not job.get("cancel_requested") and await shared.owner(f"book-cancel:{jid}"):
+                job["cancel_requested"] = True
+                BOOK_TASKS[jid].cancel()
+                await shared.release(f"book-cancel:{jid}", "cancel")
 
 
 async def _execute_publish_job(job: dict) -> dict:
-    DASHBOARD_STATS["published_attempts"] += 1
+    publish_attempts.inc(source="queue")
+    await shared.incr("published_attempts")
+    started = time.monotonic()
     result = await publish_chapter_via_cdp(
         cdp_url=job["cdp_url"],
         chapter_title=job["chapter_title"],
@@ -255,7 +667,10 @@ async def _execute_publish_job(job: dict) -> dict:
         dry_run=False,
         auto_publish=True,
         timeout_ms=job.get("timeout_ms", 45000),
+        pool=browser_pool,
+        fill_mode=job.get("fill_mode", "auto"),
     )
+    publish_seconds.observe(time.monotonic() - started, source="queue", outcome="success" if result.success else "failed")
     task = {
         "task_id": str(uuid.uuid4()),
         "created_at": datetime.utcnow().isoformat() + "Z",
@@ -264,39 +679,64 @@ async def _execute_publish_job(job: dict) -> dict:
         "detail": result.detail,
         "url": result.url,
         "screenshot": result.screenshot,
+        "fill_mode": result.fill_mode,
+        "fill_ms": result.fill_ms,
         "dry_run": False,
     }
-    PUBLISH_TASKS.append(task)
+    await asyncio.to_thread(publish_store.save_task, task)
     if result.success:
-        DASHBOARD_STATS["published_success"] += 1
+        publish_success.inc(source="queue")
+        await shared.incr("published_success")
     return task
 
 
-async def _publish_queue_worker():
+async def _run_publish_job(job: dict) -> None:
+    try:
+        task = await _execute_publish_job(job)
+        if task["status"] == "success":
+            job["status"] = "success"
+            job["last_detail"] = task["detail"]
+        else:
+            raise RuntimeError(task.get("detail") or "publish failed")
+    except asyncio.CancelledError:
+        # Leadership lost or shutting down: hand the job back rather than leave it running.
+        job["status"] = "queued"
+        job.pop("owner", None)
+        await asyncio.to_thread(publish_store.save_job, job)
+        raise
+    except Exception as exc:
+        job["attempts"] += 1
+        job["last_detail"] = str(exc)
+        if job["attempts"] > job["max_retries"]:
+            job["status"] = "failed"
+        else:
+            job["status"] = "retry_wait"
+            job["next_run_at"] = int(time.time()) + job["retry_delay_sec"]
+    await asyncio.to_thread(publish_store.save_job, job)
+
+
+async def _publish_queue_worker(worker_idx: int = 0):
     while True:
-        now = int(time.time())
-        for job in PUBLISH_QUEUE:
-            if job["status"] not in {"queued", "retry_wait"}:
+        # Clear before looking so a job scheduled while we check still wakes us.
+        publish_wakeup.clear()
+        try:
+            job = await asyncio.to_thread(publish_store.claim_due_job, int(time.time()), leases.owner)
+            if job is not None:
+                await _run_publish_job(job)
                 continue
-            if job.get("next_run_at", 0) > now:
-                continue
-            job["status"] = "running"
-            try:
-                task = await _execute_publish_job(job)
-                if task["status"] == "success":
-                    job["status"] = "success"
-                    job["last_detail"] = task["detail"]
-                else:
-                    raise RuntimeError(task.get("detail") or "publish failed")
-            except Exception as exc:
-                job["attempts"] += 1
-                job["last_detail"] = str(exc)
-                if job["attempts"] > job["max_retries"]:
-                    job["status"] = "failed"
-                else:
-                    job["status"] = "retry_wait"
-                    job["next_run_at"] = int(time.time()) + job["retry_delay_sec"]
-        await asyncio.sleep(2)
+            next_at = await asyncio.to_thread(publish_store.next_run_at)
+        except Exception as exc:
+            logger.exception("Publish queue worker %s error: %s", worker_idx, exc)
+            next_at = int(time.time()) + 5
+        # Sleep until the next job is due, or until a new job is scheduled. Jobs scheduled
+        # through another worker cannot set our event, so shared backends poll as well.
+        timeout = None if next_at is None else max(0.0, next_at - time.time())
+        if shared.multi_process:
+            timeout = min(timeout if timeout is not None else config.LEADER_LEASE_SEC, config.LEADER_LEASE_SEC / 3)
+        try:
+            await asyncio.wait_for(publish_wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
 
 
 @app.middleware("http")
@@ -304,6 +744,7 @@ async def request_middleware(request: Request, call_next):
     request_id = str(uuid.uuid4())
     request.state.request_id = request_id
     start = time.time()
+    trace, trace_token = begin_trace(request_id, f"{request.method} {request.url.path}") if config.TRACE_ENABLED else (None, None)
     try:
         response = await call_next(request)
     except BaseException as exc:
@@ -319,14 +760,108 @@ async def request_middleware(request: Request, call_next):
     response.headers["x-content-type-options"] = "nosniff"
     response.headers["x-frame-options"] = "DENY"
     response.headers["referrer-policy"] = "strict-origin-when-cross-origin"
+    rate_limit = getattr(request.state, "rate_limit", None)
+    if rate_limit is not None:
+        response.headers.update(rate_limit.headers())
     elapsed_ms = int((time.time() - start) * 1000)
     logger.info("%s %s -> %s (%sms) rid=%s", request.method, request.url.path, response.status_code, elapsed_ms, request_id)
+    if trace_token is not None:
+        detach(trace_token)
+        trace.root.set(route=getattr(request.scope.get("route"), "path", ""), status=response.status_code)
+    _time_response_body(request, response, start, trace)
     return response
 
 
+def _finish_trace(trace) -> None:
+    if trace is None:
+        return
+    trace.close()
+    if trace_exporter is not None:
+        asyncio.get_running_loop().run_in_executor(None, trace_exporter.export, trace)
+
+
+def _debug_timings(body: GenerateRequest) -> dict | None:
+    trace = current_trace()
+    return trace.timings() if body.debug_timings and trace is not None else None
+
+
+def _time_response_body(request: Request, response, start: float, trace=None) -> None:
+    """Observe request latency (and close the trace) once the body has been sent, so
+    SSE/NDJSON streams count in full."""
+    route = request.scope.get("route")
+    labels = {
+        # Route templates keep label cardinality bounded (no raw ids in paths).
+        "route": getattr(route, "path", "unmatched"),
+        "method": request.method,
+        "status": str(response.status_code),
+        "mode": getattr(request.state, "mode", ""),
+    }
+    body = getattr(response, "body_iterator", None)
+    if body is None:
+        http_request_seconds.observe(time.time() - start, **labels)
+        _finish_trace(trace)
+        return
+
+    async def _timed():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            http_request_seconds.observe(time.time() - start, **labels)
+            _finish_trace(trace)
+
+    response.body_iterator = _timed()
+
+
 @app.on_event("startup")
 async def _startup():
-    asyncio.create_task(_publish_queue_worker())
+    global health_task, loop_watchdog_task, lease_task, _memory_backend_lock
+    if not shared.multi_process:
+        # Every process would elect itself publish leader and take every book lease,
+        # running publish and book jobs twice (gunicorn -w N, uvicorn --workers N, or
+        # two instances sharing DATA_DIR).
+        _memory_backend_lock = lock_single_process(config.DATA_DIR / "memory-backend.lock")
+        if _memory_backend_lock is None:
+            raise RuntimeError(
+                f"Another process already serves {config.DATA_DIR} with SHARED_BACKEND=memory; "
+                "set SHARED_BACKEND=sqlite or redis to run several workers"
+            )
+    await http_pool.start()
+    loop_watchdog_task = asyncio.create_task(loop_watchdog.run())
+    if config.MODEL_HEALTH_INTERVAL_SEC > 0:
+        health_task = asyncio.create_task(model_health.run(fetch_free_models, config.MODEL_HEALTH_INTERVAL_SEC))
+    if shared.multi_process:
+        logger.info("Worker %s using the %s shared backend", leases.owner, shared.kind)
+    # The first tick runs now: elects the publish leader and resumes unowned book jobs.
+    await _lease_tick()
+    lease_task = asyncio.create_task(leases.run(_lease_tick, _lease_lost))
+
+
+@app.on_event("shutdown")
+async def _shutdown():
+    global _shutting_down
+    _shutting_down = True
+    if lease_task is not None:
+        lease_task.cancel()
+    for task in [*PUBLISH_WORKER_TASKS, *BOOK_TASKS.values()]:
+        task.cancel()
+    await asyncio.gather(*PUBLISH_WORKER_TASKS, *BOOK_TASKS.values(), return_exceptions=True)
+    PUBLISH_WORKER_TASKS.clear()
+    await leases.release_all()
+    if health_task is not None:
+        health_task.cancel()
+    if loop_watchdog_task is not None:
+        loop_watchdog_task.cancel()
+    await http_pool.close()
+    response_cache.close()
+    await browser_pool.close()
+    publish_store.close()
+    await shared.close()
+    if _memory_backend_lock is not None:
+        _memory_backend_lock.close()
+    if audit_pool is not None:
+        audit_pool.shutdown(wait=False, cancel_futures=True)
+    offload.shutdown()
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -342,8 +877,24 @@ async def healthz():
 @app.get("/readyz")
 async def readyz():
     try:
-        _ = fetch_free_models()
-        return {"success": True, "status": "ready"}
+        models = fetch_free_models()
+        if not config.READYZ_REQUIRE_UPSTREAM:
+            return {"success": True, "status": "ready"}
+        # Only the cached probe results are read: probes are real generation calls, left to
+        # the background prober (MODEL_HEALTH_INTERVAL_SEC) and /models/health?refresh=true.
+        checked = sum(1 for m in models if model_health.get(m).ok is not None)
+        healthy = sum(1 for m in models if model_health.is_healthy(m))
+        if not healthy:
+            return JSONResponse(
+                status_code=503,
+                content={
+                    "success": False,
+                    "status": "not_ready",
+                    "error": "no_healthy_model" if checked else "no_probe_results",
+                    "models": len(models),
+                },
+            )
+        return {"success": True, "status": "ready", "healthy_models": healthy, "models": len(models)}
     except Exception as exc:
         logger.exception("Readiness check failed: %s", exc)
         return JSONResponse(status_code=503, content={"success": False, "status": "not_ready", "error": str(exc)})
@@ -371,16 +922,146 @@ async def runtime_status(request: Request):
         "newapi_base_configured": bool((__import__("os").getenv("NEWAPI_BASE_URL") or "").strip()),
         "google_configured": bool((__import__("os").getenv("GOOGLE_API_KEY") or "").strip()),
         "anthropic_configured": bool((__import__("os").getenv("ANTHROPIC_API_KEY") or "").strip()),
+        "http_pool": http_pool.metrics(),
+        "single_flight": generate_flight.stats(),
+        "upstream_limits": upstream_limiter.stats(),
+        "circuit_breakers": breakers.stats(),
+        "hedging": hedger.stats(),
+        "model_stats": model_stats.stats(),
+        "model_health_probes": model_health.probes,
+        "postprocess": offload.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "worker": {**leases.stats(), "publish_leader": leases.holds(LEADER_LEASE), "workers": config.WORKERS},
+        "event_loop": loop_watchdog.stats(),
+        "max_generate_concurrency": config.MAX_GENERATE_CONCURRENCY,
     }
 
 
+def _metrics_auth_ok(request: Request) -> bool:
+    # Prometheus can only send a bearer token, so accept it alongside x-api-key.
+    auth = request.headers.get("authorization", "")
+    return _api_key_ok(request) or (bool(config.SERVICE_API_KEY) and auth == f"Bearer {config.SERVICE_API_KEY}")
+
+
+async def _refresh_metrics() -> None:
+    counters = response_cache.counters
+    hits = counters["memory_hits"] + counters["disk_hits"]
+    lookups = hits + counters["misses"]
+    for result in ("memory_hits", "disk_hits", "misses"):
+        # The cache keeps its own running totals; advance the counter to match them.
+        cache_lookups.inc(counters[result] - cache_lookups.value(result=result), result=result)
+    cache_hit_ratio.set(hits / lookups if lookups else 0.0)
+    queue_depth.clear()
+    for status, count in (await asyncio.to_thread(publish_store.job_counts)).items():
+        queue_depth.set(count, queue="publish", state=status)
+    queue_depth.set(len(BOOK_TASKS), queue="books", state="running")
+    upstream = upstream_limiter.stats()["models"].values()
+    queue_depth.set(sum(m["queued"] for m in upstream), queue="upstream", state="queued")
+    queue_depth.set(sum(m["in_flight"] for m in upstream), queue="upstream", state="in_flight")
+
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """Prometheus text exposition; histograms also carry a <name>_quantile p50/p90/p99 gauge."""
+    if not _metrics_auth_ok(request):
+        return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
+    await _refresh_metrics()
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/dashboard/summary")
 async def dashboard_summary(request: Request):
     if not _api_key_ok(request):
         return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
-    recent = sorted(PUBLISH_TASKS, key=lambda x: x["created_at"], reverse=True)[:10]
-    queue_recent = sorted(PUBLISH_QUEUE, key=lambda x: x["created_at"], reverse=True)[:20]
-    return {"success": True, "stats": DASHBOARD_STATS, "recent_publish_tasks": recent, "publish_queue": queue_recent}
+    recent = await asyncio.to_thread(publish_store.recent_tasks, 10)
+    queue_recent = await asyncio.to_thread(publish_store.list_jobs, 20)
+    queue_counts = await asyncio.to_thread(publish_store.job_counts)
+    return {
+        "success": True,
+        "stats": await _dashboard_stats(),
+        "recent_publish_tasks": recent,
+        "publish_queue": queue_recent,
+        "publish_queue_counts": queue_counts,
+        "browser_pool": browser_pool.stats(),
+    }
+
+
+@app.get("/admin/cache")
+async def admin_cache(request: Request, limit: int = 50):
+    if not _api_key_ok(request):
+        return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
+    try:
+        stats = await response_cache.stats()
+        entries = await response_cache.list_entries(max(0, min(limit, 500)))
+        return {"success": True, "stats": {**stats, "near_duplicate": near_dup_cache.stats()}, "entries": entries}
+    except Exception as exc:
+        logger.exception("Cache inspect failed: %s", exc)
+        return JSONResponse(status_code=500, content={"success": False, "error": f"缓存查询失败: {exc}"})
+
+
+@app.post("/admin/cache/purge")
+async def admin_cache_purge(request: Request, body: CachePurgeRequest):
+    if not _api_key_ok(request):
+        return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
+    try:
+        removed = await response_cache.purge(expired_only=body.expired_only, model_id=body.cache_model_id)
+        if not body.expired_only:
+            near_dup_cache.clear()
+        return {"success": True, "removed": removed, "stats": await response_cache.stats()}
+    except Exception as exc:
+        logger.exception("Cache purge failed: %s", exc)
+        return JSONResponse(status_code=500, content={"success": False, "error": f"缓存清理失败: {exc}"})
+
+
+def _audit_pool() -> ProcessPoolExecutor:
+    global audit_pool
+    if audit_pool is None:
+        audit_pool = ProcessPoolExecutor(max_workers=max(1, config.AUDIT_WORKERS))
+    return audit_pool
+
+
+def _ndjson(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+@app.post("/quality/audit")
+async def quality_audit(request: Request, body: QualityAuditRequest):
+    if not _api_key_ok(request):
+        return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
+
+    ip = _client_ip(request)
+    limited = await _rate_limited(request, "gen", f"audit:{ip}")
+    if limited is not None:
+        return limited
+
+    if body.chapters is not None:
+        title, chapters = chapters_from_json({"title": body.title, "chapters": body.chapters})
+    elif body.text and body.text.strip():
+        title, chapters = await offload.run("parse", extract_title_and_chapters, body.text, size=len(body.text))
+    else:
+        return JSONResponse(status_code=400, content={"success": False, "error": "请提供 chapters 或 text"})
+    if not chapters:
+        return JSONResponse(status_code=400, content={"success": False, "error": "未解析到任何章节"})
+    title = body.title or title or "未命名小说"
+
+    async def _events():
+        yield _ndjson({"type": "book", "title": title, "chapter_count": len(chapters)})
+        totals = AuditTotals()
+        try:
+            async for row in stream_book_audit(
+                chapters,
+                _audit_pool(),
+                chunk_size=config.AUDIT_CHUNK_CHAPTERS,
+                window=max(1, config.AUDIT_WORKERS) * 2,
+            ):
+                totals.add(row)
+                yield _ndjson({"type": "chapter", **row})
+            yield _ndjson({"type": "summary", **totals.summary()})
+        except Exception as exc:
+            logger.exception("Batch audit failed: %s", exc)
+            yield _ndjson({"type": "error", "error": f"质量审查失败: {str(exc).strip() or exc.__class__.__name__}"})
+
+    return StreamingResponse(_events(), media_type="application/x-ndjson")
 
 
 @app.get("/workflow/questions")
@@ -389,24 +1070,25 @@ async def workflow_questions():
 
 
 @app.get("/models/health")
-async def model_health(request: Request):
+async def models_health(request: Request, refresh: bool = False):
     if not _api_key_ok(request):
         return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
 
     ip = _client_ip(request)
-    if not rate_limiter.allow(f"health:{ip}"):
-        return JSONResponse(status_code=429, content={"success": False, "error": "rate limit exceeded"})
+    limited = await _rate_limited(request, "health", f"health:{ip}")
+    if limited is not None:
+        return limited
 
     try:
         models = fetch_free_models()
-        results = []
-        for model in models:
-            try:
-                ok, detail = await asyncio.wait_for(check_model_connection(model), timeout=config.MODEL_HEALTH_TIMEOUT)
-            except Exception as inner:
-                ok, detail = False, str(inner)
-            results.append({"uid": model.get("uid"), "provider": model.get("provider"), "id": model.get("id"), "ok": ok, "detail": detail})
-        return {"success": True, "results": results}
+        # Cached results come back instantly; refresh=true (the UI's 检测 button) re-probes all
+        # models concurrently, otherwise only never-checked or expired ones are probed.
+        await model_health.refresh(models, force=refresh)
+        results = model_health.results(models)
+        for item, model in zip(results, models):
+            item["circuit"] = breakers.get(model_key(model)).state
+        fastest = model_health.fastest_healthy(models)
+        return {"success": True, "results": results, "fastest_uid": fastest.get("uid") if fastest else None}
     except Exception as exc:
         logger.exception("Model health check failed: %s", exc)
         return JSONResponse(status_code=500, content={"success": False, "error": f"模型检查失败: {exc}"})
@@ -417,10 +1099,13 @@ async def publish_fanqie(request: Request, body: FanqiePublishRequest):
     if not _api_key_ok(request):
         return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
     ip = _client_ip(request)
-    if not rate_limiter.allow(f"publish:{ip}"):
-        return JSONResponse(status_code=429, content={"success": False, "error": "rate limit exceeded"})
+    limited = await _rate_limited(request, "publish", f"publish:{ip}")
+    if limited is not None:
+        return limited
 
-    DASHBOARD_STATS["published_attempts"] += 1
+    publish_attempts.inc(source="direct")
+    await shared.incr("published_attempts")
+    started = time.monotonic()
     task = {
         "task_id": str(uuid.uuid4()),
         "created_at": datetime.utcnow().isoformat() + "Z",
@@ -428,7 +1113,7 @@ async def publish_fanqie(request: Request, body: FanqiePublishRequest):
         "title": body.chapter_title[:60],
         "dry_run": body.dry_run,
     }
-    PUBLISH_TASKS.append(task)
+    await asyncio.to_thread(publish_store.save_task, task)
     try:
         result = await publish_chapter_via_cdp(
             cdp_url=body.cdp_url,
@@ -439,17 +1124,26 @@ async def publish_fanqie(request: Request, body: FanqiePublishRequest):
             dry_run=body.dry_run,
             auto_publish=body.auto_publish,
             timeout_ms=body.timeout_ms,
+            pool=browser_pool,
+            fill_mode=body.fill_mode,
         )
         task["status"] = "success" if result.success else "failed"
         task["detail"] = result.detail
         task["url"] = result.url
         task["screenshot"] = result.screenshot
+        task["fill_mode"] = result.fill_mode
+        task["fill_ms"] = result.fill_ms
+        publish_seconds.observe(time.monotonic() - started, source="direct", outcome=task["status"])
+        await asyncio.to_thread(publish_store.save_task, task)
         if result.success:
-            DASHBOARD_STATS["published_success"] += 1
+            publish_success.inc(source="direct")
+            await shared.incr("published_success")
         return {"success": result.success, "task": task}
     except Exception as exc:
+        publish_seconds.observe(time.monotonic() - started, source="direct", outcome="error")
         task["status"] = "failed"
         task["detail"] = str(exc)
+        await asyncio.to_thread(publish_store.save_task, task)
         return JSONResponse(status_code=500, content={"success": False, "error": f"发布失败: {exc}", "task": task})
 
 
@@ -458,8 +1152,9 @@ async def publish_fanqie_schedule(request: Request, body: FanqieScheduleRequest)
     if not _api_key_ok(request):
         return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
     ip = _client_ip(request)
-    if not rate_limiter.allow(f"publish_sched:{ip}"):
-        return JSONResponse(status_code=429, content={"success": False, "error": "rate limit exceeded"})
+    limited = await _rate_limited(request, "publish", f"publish_sched:{ip}")
+    if limited is not None:
+        return limited
 
     now = int(time.time())
     run_at = body.run_at_epoch if body.run_at_epoch and body.run_at_epoch > now else now
@@ -472,6 +1167,7 @@ async def publish_fanqie_schedule(request: Request, body: FanqieScheduleRequest)
         "chapter_content": body.chapter_content,
         "selectors": body.selectors,
         "timeout_ms": body.timeout_ms,
+        "fill_mode": body.fill_mode,
         "status": "queued",
         "attempts": 0,
         "max_retries": max(0, body.max_retries),
@@ -479,15 +1175,18 @@ async def publish_fanqie_schedule(request: Request, body: FanqieScheduleRequest)
         "next_run_at": run_at,
         "last_detail": "",
     }
-    PUBLISH_QUEUE.append(job)
+    await asyncio.to_thread(publish_store.add_job, job)
+    publish_wakeup.set()
     return {"success": True, "job": job}
 
 
 @app.get("/publish/fanqie/queue")
-async def publish_fanqie_queue(request: Request):
+async def publish_fanqie_queue(request: Request, limit: int = 200):
     if not _api_key_ok(request):
         return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
-    return {"success": True, "queue": sorted(PUBLISH_QUEUE, key=lambda x: x["created_at"], reverse=True)}
+    queue = await asyncio.to_thread(publish_store.list_jobs, max(1, min(limit, 2000)))
+    counts = await asyncio.to_thread(publish_store.job_counts)
+    return {"success": True, "queue": queue, "counts": counts}
 
 
 @app.post("/publish/fanqie/probe")
@@ -495,8 +1194,9 @@ async def publish_fanqie_probe(request: Request, body: FanqieCdpProbeRequest):
     if not _api_key_ok(request):
         return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
     ip = _client_ip(request)
-    if not rate_limiter.allow(f"publish_probe:{ip}"):
-        return JSONResponse(status_code=429, content={"success": False, "error": "rate limit exceeded"})
+    limited = await _rate_limited(request, "publish", f"publish_probe:{ip}")
+    if limited is not None:
+        return limited
     try:
         result = await probe_cdp_endpoint(cdp_url=body.cdp_url, timeout_ms=body.timeout_ms)
         return {
@@ -509,99 +1209,312 @@ async def publish_fanqie_probe(request: Request, body: FanqieCdpProbeRequest):
         return JSONResponse(status_code=500, content={"success": False, "error": f"CDP检测失败: {exc}"})
 
 
-@app.post("/generate")
-async def generate(request: Request, body: GenerateRequest):
+@app.post("/books")
+async def create_book_job(request: Request, body: BookJobRequest):
+    if not _api_key_ok(request):
+        return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
+    ip = _client_ip(request)
+    limited = await _rate_limited(request, "gen", f"gen:{ip}")
+    if limited is not None:
+        return limited
+
+    prompt_text = (body.prompt or "").strip()
+    if len(prompt_text) < config.MIN_PROMPT_LENGTH:
+        return JSONResponse(status_code=400, content={"success": False, "error": f"提示词太短，至少 {config.MIN_PROMPT_LENGTH} 字"})
+    if len(prompt_text) > config.MAX_PROMPT_LENGTH:
+        return JSONResponse(status_code=400, content={"success": False, "error": f"提示词太长，请控制在 {config.MAX_PROMPT_LENGTH} 字以内"})
+    if body.chapter_count > config.BOOK_MAX_CHAPTERS:
+        return JSONResponse(status_code=400, content={"success": False, "error": f"章数过多，单本最多 {config.BOOK_MAX_CHAPTERS} 章"})
+
+    model_dict, route = _resolve_request_model(body, prompt_text)
+    if model_dict is None:
+        return JSONResponse(status_code=400, content={"success": False, "error": "自定义模型参数无效"})
+
+    now = datetime.utcnow().isoformat() + "Z"
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "created_at": now,
+        "updated_at": now,
+        "status": "queued",
+        "error": "",
+        "title": None,
+        "model": model_dict,
+        "request": {**body.model_dump(exclude={"model", "custom_model"}), "prompt": prompt_text},
+        "outline": [],
+        "chapters": [],
+        "quality_report": None,
+    }
+    await book_store.save(job)
+    await leases.acquire(f"book:{job['job_id']}")
+    _start_book_job(job)
+    return {"success": True, "job": job_summary(job), "routing": route.as_dict() if route else None}
+
+
+@app.get("/books")
+async def list_book_jobs(request: Request):
+    if not _api_key_ok(request):
+        return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
+    jobs = await asyncio.to_thread(book_store.list_jobs)
+    return {"success": True, "jobs": [job_summary(j) for j in jobs]}
+
+
+@app.get("/books/{job_id}")
+async def get_book_job(request: Request, job_id: str):
+    if not _api_key_ok(request):
+        return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
+    job = RUNNING_BOOKS.get(job_id) or await asyncio.to_thread(book_store.load, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": "任务不存在"})
+    return {"success": True, "job": {**job, **job_summary(job)}}
+
+
+@app.post("/books/{job_id}/resume")
+async def resume_book_job(request: Request, job_id: str):
+    if not _api_key_ok(request):
+        return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
+    if job_id in BOOK_TASKS:
+        return JSONResponse(status_code=409, content={"success": False, "error": "任务正在运行"})
+    job = await asyncio.to_thread(book_store.load, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": "任务不存在"})
+    if job.get("status") == "completed":
+        return JSONResponse(status_code=409, content={"success": False, "error": "任务已完成"})
+    if not await leases.acquire(f"book:{job_id}"):
+        return JSONResponse(status_code=409, content={"success": False, "error": "任务正在其他工作进程中运行"})
+    job["status"] = "queued"
+    job["error"] = ""
+    job.pop("cancel_requested", None)
+    await book_store.save(job)
+    _start_book_job(job)
+    return {"success": True, "job": job_summary(job)}
+
+
+@app.post("/books/{job_id}/cancel")
+async def cancel_book_job(request: Request, job_id: str):
+    if not _api_key_ok(request):
+        return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
+    task = BOOK_TASKS.get(job_id)
+    if task is None:
+        if shared.multi_process and await shared.owner(f"book:{job_id}"):
+            # Running in another worker: leave a flag its lease tick picks up.
+            await shared.acquire(f"book-cancel:{job_id}", "cancel", config.LEADER_LEASE_SEC * 4)
+            return {"success": True, "job_id": job_id, "pending": True}
+        return JSONResponse(status_code=409, content={"success": False, "error": "任务未在运行"})
+    RUNNING_BOOKS[job_id]["cancel_requested"] = True
+    task.cancel()
+    return {"success": True, "job_id": job_id}
+
+
+GENERATE_MODES = {"generate", "continue", "expand", "pad", "inspiration", "rewrite"}
+
+
+def _mode_label(mode: str) -> str:
+    """Metric label for a request mode; `mode` is free-form, so unknown values share one."""
+    return mode if mode in GENERATE_MODES else "other"
+
+
+async def _check_generate_request(request: Request, body: GenerateRequest) -> JSONResponse | None:
     if not _api_key_ok(request):
         return JSONResponse(status_code=401, content={"success": False, "error": "unauthorized"})
 
     ip = _client_ip(request)
-    if not rate_limiter.allow(f"gen:{ip}"):
-        return JSONResponse(status_code=429, content={"success": False, "error": "rate limit exceeded"})
+    limited = await _rate_limited(request, "gen", f"gen:{ip}")
+    if limited is not None:
+        return limited
 
     prompt_text = (body.prompt or "").strip()
     if len(prompt_text) < config.MIN_PROMPT_LENGTH:
         return JSONResponse(status_code=400, content={"success": False, "error": f"提示词太短，至少 {config.MIN_PROMPT_LENGTH} 字"})
     if len(prompt_text) > config.MAX_PROMPT_LENGTH:
         return JSONResponse(status_code=400, content={"success": False, "error": f"提示词太长，请控制在 {config.MAX_PROMPT_LENGTH} 字以内"})
+    request.state.mode = _mode_label(body.mode)
+    return None
+
+
+def _resolve_request_model(body: GenerateRequest, prompt: str = "") -> tuple[dict | None, Route | None]:
+    """Return (model dict, route) for a request; model is None when custom_model is invalid.
+
+    route is only set for model="auto", where the router picks from the catalogue.
+    """
+    if body.custom_model:
+        provider = (body.custom_model.get("provider") or "").strip()
+        model_id = (body.custom_model.get("id") or "").strip()
+        if provider not in {"openrouter", "newapi", "google", "anthropic"} or not model_id:
+            return None, None
+        return {
+            "provider": provider,
+            "id": model_id,
+            "api_base": (body.custom_model.get("api_base") or "").strip(),
+            "uid": f"custom::{provider}::{model_id}",
+        }, None
+    if body.model == "auto":
+        route = model_router.route(fetch_free_models(), prompt, config.MAX_TOKENS)
+        return route.model, route
+    return resolve_model(body.model), None
+
+
+def _model_chain(model_dict: dict, route: Route | None = None) -> list[dict]:
+    """The requested model plus catalogue fallbacks; custom models never fail over.
+
+    Routed requests fall back along the router's ranking instead of MODEL_FAILOVER_ORDER.
+    """
+    if not config.MODEL_FAILOVER or str(model_dict.get("uid", "")).startswith("custom::"):
+        return [model_dict]
+    if route is not None:
+        return route.ranked[: max(1, config.MODEL_FAILOVER_MAX_MODELS)]
+    return failover_chain(model_dict, config.MODEL_FAILOVER_ORDER, config.MODEL_FAILOVER_MAX_MODELS)
+
+
+# Builder inputs that only shape the rendered prompt; canonicalized for generate/inspiration.
+CANONICAL_MODES = {"generate", "inspiration"}
+CANONICAL_FIELDS = (
+    "genre", "workflow_answers", "style_prompt", "custom_prompt", "role_cards",
+    "org_cards", "profession_system", "foreshadows", "style_strength",
+)
+
+
+def _canonical_request(body: GenerateRequest, prompt_text: str) -> tuple[GenerateRequest, str]:
+    """Whitespace- and key-order-insensitive inputs, so equivalent requests render the same
+    prompt and share the response cache and single-flight."""
+    if not config.CACHE_NORMALIZE_INPUTS or body.mode not in CANONICAL_MODES:
+        return body, prompt_text
+    update = {name: canonical(getattr(body, name)) for name in CANONICAL_FIELDS}
+    return body.model_copy(update=update), canonical(prompt_text)
+
+
+def _near_dup_scope(body: GenerateRequest) -> str | None:
+    """Everything but the free text must match for a near-duplicate hit."""
+    if not near_dup_cache.enabled_for(body.mode):
+        return None
+    return scope_key(body.model_dump(exclude={"prompt", "debug_timings", "existing_chapters"}))
+
+
+async def _replay(content: str):
+    yield content
+
+
+def _build_llm_prompt(body: GenerateRequest, prompt_text: str) -> str:
+    body, prompt_text = _canonical_request(body, prompt_text)
+    if body.mode == "expand":
+        return build_expand_prompt(chapter_text=prompt_text, genre=body.genre, style_strength=body.style_strength)
+    if body.mode == "pad":
+        lines = prompt_text.splitlines()
+        chapter_title = lines[0].strip() if lines else "章节"
+        chapter_body = "\n".join(lines[1:]).strip() if len(lines) > 1 else prompt_text
+        return build_pad_prompt(
+            chapter_title=chapter_title,
+            chapter_content=chapter_body,
+            target_min_words=body.chapter_min_words or 3000,
+            target_max_words=body.chapter_max_words or 5000,
+            genre=body.genre,
+            style_prompt=body.style_prompt,
+            style_strength=body.style_strength,
+        )
+    if body.mode == "continue":
+        existing = body.existing_chapters or []
+        next_idx = len(existing) + 1 if existing else 1
+        story_context = build_story_context(
+            [c for c in existing if isinstance(c, dict)],
+            role_cards=body.role_cards,
+            foreshadows=body.foreshadows,
+            budget_chars=config.STORY_MEMORY_BUDGET,
+        )
+        return build_continue_prompt(
+            novel_title=body.novel_title or "未命名小说",
+            existing_chapters_text=story_context,
+            next_chapter_index=next_idx,
+            genre=body.genre,
+            style_prompt=body.style_prompt,
+            chapter_min_words=body.chapter_min_words,
+            chapter_max_words=body.chapter_max_words,
+            style_strength=body.style_strength,
+        )
+    if body.mode == "inspiration":
+        return build_inspiration_prompt(
+            topic=prompt_text,
+            genre=body.genre,
+            style_prompt=body.style_prompt,
+            style_strength=body.style_strength,
+        )
+    if body.mode == "rewrite":
+        return build_rewrite_prompt(
+            source_text=prompt_text,
+            analysis_notes=(body.analysis_notes or "请提升节奏与可读性"),
+            genre=body.genre,
+            style_prompt=body.style_prompt,
+            style_strength=body.style_strength,
+        )
+    return build_generate_prompt(
+        user_prompt=prompt_text,
+        genre=body.genre,
+        workflow_answers=body.workflow_answers,
+        style_prompt=body.style_prompt,
+        custom_prompt=body.custom_prompt,
+        chapter_min_words=body.chapter_min_words,
+        chapter_max_words=body.chapter_max_words,
+        role_cards=body.role_cards,
+        org_cards=body.org_cards,
+        profession_system=body.profession_system,
+        foreshadows=body.foreshadows,
+        style_strength=body.style_strength,
+    )
+
+
+async def _quality_report(request: Request, body: GenerateRequest, chapters: list[dict]) -> dict:
+    """Whole-book report when the request carries the book, otherwise a report on `chapters`.
+
+    continue appends to existing_chapters; expand/pad with chapter_id (0-based index into
+    existing_chapters) replace that chapter's content. Only changed chapters are re-audited.
+    """
+    existing = [c for c in (body.existing_chapters or []) if isinstance(c, dict)]
+    if existing and body.mode == "continue":
+        book = existing + chapters
+    elif existing and chapters and body.mode in {"expand", "pad"} and body.chapter_id is not None and 0 <= body.chapter_id < len(existing):
+        book = list(existing)
+        book[body.chapter_id] = {"title": existing[body.chapter_id].get("title"), "content": chapters[0].get("content", "")}
+    else:
+        with span("audit", chapters=len(chapters)):
+            return await offload.run("audit", audit_chapters, chapters, size=chapters_size(chapters))
+    book = [{"title": str(c.get("title") or ""), "content": str(c.get("content") or "")} for c in book]
+    key = f"{_client_ip(request)}:{body.novel_title or ''}"
+    with span("audit", chapters=len(book), incremental=True):
+        # Incremental state lives in this process, so it always runs on the thread pool.
+        return await offload.run("audit", book_audits.audit, key, book, size=chapters_size(book), stateful=True)
+
+
+@app.post("/generate")
+async def generate(request: Request, body: GenerateRequest):
+    rejected = await _check_generate_request(request, body)
+    if rejected is not None:
+        return rejected
+    prompt_text = (body.prompt or "").strip()
 
     try:
-        if body.custom_model:
-            provider = (body.custom_model.get("provider") or "").strip()
-            model_id = (body.custom_model.get("id") or "").strip()
-            if provider not in {"openrouter", "newapi", "google", "anthropic"} or not model_id:
-                return JSONResponse(status_code=400, content={"success": False, "error": "自定义模型参数无效"})
-            model_dict = {
-                "provider": provider,
-                "id": model_id,
-                "api_base": (body.custom_model.get("api_base") or "").strip(),
-                "uid": f"custom::{provider}::{model_id}",
-            }
-        else:
-            model_dict = resolve_model(body.model)
-        if body.mode == "expand":
-            llm_prompt = build_expand_prompt(chapter_text=prompt_text, genre=body.genre, style_strength=body.style_strength)
-        elif body.mode == "pad":
-            lines = prompt_text.splitlines()
-            chapter_title = lines[0].strip() if lines else "章节"
-            chapter_body = "\n".join(lines[1:]).strip() if len(lines) > 1 else prompt_text
-            llm_prompt = build_pad_prompt(
-                chapter_title=chapter_title,
-                chapter_content=chapter_body,
-                target_min_words=body.chapter_min_words or 3000,
-                target_max_words=body.chapter_max_words or 5000,
-                genre=body.genre,
-                style_prompt=body.style_prompt,
-                style_strength=body.style_strength,
-            )
-        elif body.mode == "continue":
-            existing = body.existing_chapters or []
-            next_idx = len(existing) + 1 if existing else 1
-            existing_text = "\n\n".join(
-                [f"{c.get('title','')}\\n{c.get('content','')}" for c in existing if isinstance(c, dict)]
-            )
-            llm_prompt = build_continue_prompt(
-                novel_title=body.novel_title or "未命名小说",
-                existing_chapters_text=existing_text[-20000:],
-                next_chapter_index=next_idx,
-                genre=body.genre,
-                style_prompt=body.style_prompt,
-                chapter_min_words=body.chapter_min_words,
-                chapter_max_words=body.chapter_max_words,
-                style_strength=body.style_strength,
-            )
-        elif body.mode == "inspiration":
-            llm_prompt = build_inspiration_prompt(
-                topic=prompt_text,
-                genre=body.genre,
-                style_prompt=body.style_prompt,
-                style_strength=body.style_strength,
-            )
-        elif body.mode == "rewrite":
-            llm_prompt = build_rewrite_prompt(
-                source_text=prompt_text,
-                analysis_notes=(body.analysis_notes or "请提升节奏与可读性"),
-                genre=body.genre,
-                style_prompt=body.style_prompt,
-                style_strength=body.style_strength,
-            )
+        with span("prompt_build", mode=body.mode):
+            llm_prompt = _build_llm_prompt(body, prompt_text)
+        with span("route", requested=body.model):
+            model_dict, route = _resolve_request_model(body, llm_prompt)
+        if model_dict is None:
+            return JSONResponse(status_code=400, content={"success": False, "error": "自定义模型参数无效"})
+        requested_uid = model_dict.get("uid")
+
+        near_scope = _near_dup_scope(body)
+        reused = near_dup_cache.get(near_scope, prompt_text) if near_scope else None
+        if reused is not None:
+            content = reused[0]
+            logger.info("Reusing a near-duplicate %s result (similarity %.2f)", body.mode, reused[1])
         else:
-            llm_prompt = build_generate_prompt(
-                user_prompt=prompt_text,
-                genre=body.genre,
-                workflow_answers=body.workflow_answers,
-                style_prompt=body.style_prompt,
-                custom_prompt=body.custom_prompt,
-                chapter_min_words=body.chapter_min_words,
-                chapter_max_words=body.chapter_max_words,
-                role_cards=body.role_cards,
-                org_cards=body.org_cards,
-                profession_system=body.profession_system,
-                foreshadows=body.foreshadows,
-                style_strength=body.style_strength,
-            )
-
-        async with generate_semaphore:
-            content = await asyncio.wait_for(generate_content(model_dict, llm_prompt), timeout=config.REQUEST_TIMEOUT + 10)
+            with span("upstream", model=requested_uid) as sp:
+                async with _generate_slot():
+                    # Timed per candidate: one slow model must not use up the fallback's budget.
+                    content, model_dict = await generate_with_failover(
+                        _model_chain(model_dict, route), llm_prompt, candidate_timeout=config.REQUEST_TIMEOUT + 10
+                    )
+                if sp is not None:
+                    sp.set(model_used=model_dict.get("uid"), chars=len(content or ""))
+            if near_scope and content:
+                near_dup_cache.put(near_scope, prompt_text, content)
+        near_duplicate = round(reused[1], 3) if reused is not None else None
 
         if not content:
             return JSONResponse(
@@ -613,90 +1526,67 @@ async def generate(request: Request, body: GenerateRequest):
             )
 
         if body.mode == "inspiration":
-            return {"success": True, "title": "灵感模式结果", "chapters": [{"title": "灵感清单", "content": content}]}
+            return {
+                "success": True,
+                "title": "灵感模式结果",
+                "chapters": [{"title": "灵感清单", "content": content}],
+                "near_duplicate": near_duplicate,
+            }
 
+        existing = body.existing_chapters or []
+        next_idx = len(existing) + 1 if existing else 1
+        with span("parse"):
+            title, chapters = await offload.run("parse", parse_generated, content, body.mode, next_idx, size=len(content))
         if body.mode == "continue":
-            existing = body.existing_chapters or []
-            next_idx = len(existing) + 1 if existing else 1
-            one = _extract_single_continue_chapter(content, next_idx)
-            one = {"title": one["title"], "content": clean_chapter_content(one.get("content", ""))}
-            min_words = int(body.chapter_min_words or 3000)
-            # Too short continue outputs usually indicate provider formatting drift; fail fast instead of polluting chapter list.
-            if _net_word_count(one["content"]) < max(200, int(min_words * 0.25)):
-                return JSONResponse(status_code=500, content={"success": False, "error": "续写结果过短或格式异常，请重试或切换模型"})
-            chapters = [one]
+            if _continue_too_short(chapters, int(body.chapter_min_words or 3000)):
+                return JSONResponse(status_code=500, content={"success": False, "error": CONTINUE_SHORT_ERROR})
             title = body.novel_title or "未命名小说"
-        else:
-            title, chapters = extract_title_and_chapters(content)
-            if not chapters:
-                return JSONResponse(status_code=500, content={"success": False, "error": "内容解析失败"})
-
-        chapters = ensure_unique_titles(chapters)
-        chapters = [{"title": c["title"], "content": clean_chapter_content(c.get("content", ""))} for c in chapters]
+        elif not chapters:
+            return JSONResponse(status_code=500, content={"success": False, "error": "内容解析失败"})
 
         # Guard against "outline-only" responses (many chapters but each only one sentence).
         if body.mode == "generate":
             min_words = int(body.chapter_min_words or 3000)
             if _looks_like_outline(chapters, min_words):
-                fallback_prompt = build_continue_prompt(
-                    novel_title=title or "未命名小说",
-                    existing_chapters_text="",
-                    next_chapter_index=1,
-                    genre=body.genre,
-                    style_prompt=body.style_prompt,
-                    chapter_min_words=body.chapter_min_words,
-                    chapter_max_words=body.chapter_max_words,
-                    style_strength=body.style_strength,
-                )
-                fallback_content = await asyncio.wait_for(
-                    generate_content(model_dict, fallback_prompt),
-                    timeout=config.REQUEST_TIMEOUT + 10,
-                )
-                if fallback_content:
-                    one = _extract_single_continue_chapter(fallback_content, 1)
-                    one = {"title": one["title"], "content": clean_chapter_content(one.get("content", ""))}
-                    if _net_word_count(one["content"]) >= max(200, int(min_words * 0.25)):
-                        chapters = [one]
-                    else:
-                        return JSONResponse(
-                            status_code=422,
-                            content={"success": False, "error": "模型输出为章节摘要，未达到正文长度。请切换更大上下文模型，或先生成少量章节再批量续写。"},
-                        )
-                else:
-                    return JSONResponse(
-                        status_code=422,
-                        content={"success": False, "error": "模型输出为章节摘要，未达到正文长度。请切换更大上下文模型，或先生成少量章节再批量续写。"},
-                    )
+                chapters = await _outline_fallback(model_dict, body, title, min_words)
+                if chapters is None:
+                    return JSONResponse(status_code=422, content={"success": False, "error": OUTLINE_ONLY_ERROR})
 
         # Auto-expand short chapters to reduce one-line outputs.
         min_words = int(body.chapter_min_words or 3000)
-        normalized = []
-        for ch in chapters:
-            ch2 = await _auto_expand_short_chapter(
+        with span("expand", chapters=len(chapters)):
+            chapters, expand_timed_out = await _expand_short_chapters(
                 model_dict,
-                ch,
+                chapters,
                 genre=body.genre,
                 style_strength=body.style_strength,
                 chapter_min_words=min_words,
                 max_rounds=2,
             )
-            normalized.append({"title": ch2.get("title", ch.get("title", "章节")), "content": clean_chapter_content(ch2.get("content", ""))})
-        chapters = normalized
 
         # Final guard: if still too short, return explicit error instead of weak content.
-        too_short = [c for c in chapters if _net_word_count(c.get("content", "")) < max(300, int(min_words * 0.5))]
-        if too_short and body.mode in {"generate", "continue", "expand"}:
-            return JSONResponse(
-                status_code=422,
-                content={"success": False, "error": "模型多次生成仍偏短。建议换模型/提高上下文容量后重试。"},
-            )
+        if _still_too_short(chapters, min_words, body.mode, expand_timed_out):
+            return JSONResponse(status_code=422, content={"success": False, "error": TOO_SHORT_ERROR})
 
-        quality_report = audit_chapters(chapters)
+        quality_report = await _quality_report(request, body, chapters)
 
-        DASHBOARD_STATS["generated_calls"] += 1
-        DASHBOARD_STATS["generated_chapters"] += len(chapters)
+        generated_calls.inc(mode=_mode_label(body.mode))
+        generated_chapters.inc(len(chapters), mode=_mode_label(body.mode))
+        await shared.incr("generated_calls")
+        await shared.incr("generated_chapters", len(chapters))
 
-        return {"success": True, "title": title, "chapters": chapters, "quality_report": quality_report}
+        return {
+            "success": True,
+            "title": title,
+            "chapters": chapters,
+            "quality_report": quality_report,
+            "expand_timed_out": expand_timed_out,
+            "model_used": model_dict.get("uid"),
+            "failed_over": model_dict.get("uid") != requested_uid,
+            "routing": route.as_dict() if route else None,
+            "near_duplicate": near_duplicate,
+            "debug_timings": _debug_timings(body),
+        }
     except asyncio.TimeoutError:
         return JSONResponse(status_code=504, content={"success": False, "error": "上游模型响应超时"})
     except RuntimeError as exc:
@@ -709,8 +1599,173 @@ async def generate(request: Request, body: GenerateRequest):
         return JSONResponse(status_code=500, content={"success": False, "error": f"生成异常: {err_text}"})
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/generate/stream")
+async def generate_stream(request: Request, body: GenerateRequest):
+    """Stream provider tokens as Server-Sent Events.
+
+    Events: ``delta`` (raw text), ``title``, ``chapter_start``, ``chapter`` (a finished,
+    cleaned chapter), ``stage`` when an outline-only answer is regenerated or short chapters
+    are being auto-expanded, then ``done`` with the parsed result and quality report, or
+    ``error``. The same outline fallback and length guards as /generate apply.
+    """
+    rejected = await _check_generate_request(request, body)
+    if rejected is not None:
+        return rejected
+    prompt_text = (body.prompt or "").strip()
+
+    try:
+        with span("prompt_build", mode=body.mode):
+            llm_prompt = _build_llm_prompt(body, prompt_text)
+    except Exception as exc:
+        logger.exception("Stream prompt build error: %s", exc)
+        return JSONResponse(status_code=500, content={"success": False, "error": f"生成异常: {exc}"})
+    with span("route", requested=body.model):
+        model_dict, route = _resolve_request_model(body, llm_prompt)
+    if model_dict is None:
+        return JSONResponse(status_code=400, content={"success": False, "error": "自定义模型参数无效"})
+    near_scope = _near_dup_scope(body)
+    reused = near_dup_cache.get(near_scope, prompt_text) if near_scope else None
+
+    async def event_source():
+        parser = IncrementalChapterParser()
+        chosen = {"model": model_dict}
+        try:
+            # Spans are recorded after the fact here: a `with span()` must not straddle a yield.
+            upstream_ns = time.time_ns()
+            first_token_ns = 0
+            if reused is not None:
+                deltas, slot = _replay(reused[0]), nullcontext()
+            else:
+                deltas, slot = stream_with_failover(_model_chain(model_dict, route), llm_prompt, chosen), _generate_slot()
+            async with slot:
+                async for delta in deltas:
+                    first_token_ns = first_token_ns or time.time_ns()
+                    yield _sse("delta", {"text": delta})
+                    if body.mode == "inspiration":
+                        # No chapters to detect; just collect the text.
+                        parser.buffer += delta
+                    else:
+                        for evt in parser.feed(delta):
+                            yield _sse(evt.pop("event"), evt)
+            if body.mode != "inspiration":
+                for evt in parser.finish():
+                    yield _sse(evt.pop("event"), evt)
+            record_span(
+                "upstream",
+                upstream_ns,
+                model=model_dict.get("uid"),
+                model_used=chosen["model"].get("uid"),
+                chars=len(parser.buffer),
+                ttft_ms=round((first_token_ns - upstream_ns) / 1e6, 1) if first_token_ns else -1,
+            )
+
+            content = parser.buffer.strip()
+            if not content:
+                yield _sse("error", {"success": False, "error": "上游模型未返回有效内容，请切换模型后重试"})
+                return
+            if near_scope and reused is None:
+                near_dup_cache.put(near_scope, prompt_text, content)
+            near_duplicate = round(reused[1], 3) if reused is not None else None
+
+            if body.mode == "inspiration":
+                yield _sse(
+                    "done",
+                    {
+                        "success": True,
+                        "title": "灵感模式结果",
+                        "chapters": [{"title": "灵感清单", "content": content}],
+                        "near_duplicate": near_duplicate,
+                    },
+                )
+                return
+            existing = body.existing_chapters or []
+            next_idx = len(existing) + 1 if existing else 1
+            with span("parse"):
+                title, chapters = await offload.run("parse", parse_generated, content, body.mode, next_idx, size=len(content))
+            min_words = int(body.chapter_min_words or 3000)
+            if body.mode == "continue":
+                if _continue_too_short(chapters, min_words):
+                    yield _sse("error", {"success": False, "error": CONTINUE_SHORT_ERROR})
+                    return
+                title = body.novel_title or "未命名小说"
+            elif not chapters:
+                yield _sse("error", {"success": False, "error": "内容解析失败"})
+                return
+            if body.mode == "generate" and _looks_like_outline(chapters, min_words):
+                yield _sse("stage", {"stage": "outline_fallback"})
+                chapters = await _outline_fallback(chosen["model"], body, title, min_words)
+                if chapters is None:
+                    yield _sse("error", {"success": False, "error": OUTLINE_ONLY_ERROR})
+                    return
+
+            expand_timed_out = False
+            if body.mode in {"generate", "continue", "expand"}:
+                target_floor = max(300, int(min_words * 0.8))
+                if any(_net_word_count(c.get("content", "")) < target_floor for c in chapters):
+                    yield _sse("stage", {"stage": "expand"})
+                    with span("expand", chapters=len(chapters)):
+                        chapters, expand_timed_out = await _expand_short_chapters(
+                            chosen["model"],
+                            chapters,
+                            genre=body.genre,
+                            style_strength=body.style_strength,
+                            chapter_min_words=min_words,
+                            max_rounds=2,
+                        )
+            if _still_too_short(chapters, min_words, body.mode, expand_timed_out):
+                yield _sse("error", {"success": False, "error": TOO_SHORT_ERROR})
+                return
+            quality_report = await _quality_report(request, body, chapters)
+
+            generated_calls.inc(mode=_mode_label(body.mode))
+            generated_chapters.inc(len(chapters), mode=_mode_label(body.mode))
+            await shared.incr("generated_calls")
+            await shared.incr("generated_chapters", len(chapters))
+            yield _sse(
+                "done",
+                {
+                    "success": True,
+                    "title": title,
+                    "chapters": chapters,
+                    "quality_report": quality_report,
+                    "expand_timed_out": expand_timed_out,
+                    "model_used": chosen["model"].get("uid"),
+                    "failed_over": chosen["model"].get("uid") != model_dict.get("uid"),
+                    "routing": route.as_dict() if route else None,
+                    "near_duplicate": near_duplicate,
+                    "debug_timings": _debug_timings(body),
+                },
+            )
+        except asyncio.TimeoutError:
+            yield _sse("error", {"success": False, "error": "上游模型响应超时"})
+        except RuntimeError as exc:
+            yield _sse("error", {"success": False, "error": f"上游模型错误: {exc}"})
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.exception("Stream generation error: %s", exc)
+            err_text = str(exc).strip() or repr(exc) or exc.__class__.__name__
+            yield _sse("error", {"success": False, "error": f"生成异常: {err_text}"})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host=config.APP_HOST, port=config.APP_PORT)
+    if config.WORKERS > 1:
+        if not shared.multi_process:
+            raise SystemExit(f"WORKERS={config.WORKERS} needs SHARED_BACKEND=sqlite or redis, not memory")
+        # Workers import the app themselves, so uvicorn needs the import string.
+        uvicorn.run("app:app", host=config.APP_HOST, port=config.APP_PORT, workers=config.WORKERS)
+    else:
+        uvicorn.run(app, host=config.APP_HOST, port=config.APP_PORT)
 
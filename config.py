@@ -21,18 +21,117 @@ MAX_PROMPT_LENGTH = int(os.getenv("MAX_PROMPT_LENGTH", "2000"))
 
 CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
 CACHE_DIR = Path(os.getenv("CACHE_DIR", "cache"))
+CACHE_TTL_SEC = int(os.getenv("CACHE_TTL_SEC", str(7 * 24 * 3600)))
+CACHE_MEMORY_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))
+CACHE_DISK_MAX_BYTES = int(os.getenv("CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_NORMALIZE_INPUTS = os.getenv("CACHE_NORMALIZE_INPUTS", "true").lower() == "true"
+# Modes whose results are reused for near-duplicate prompts, e.g. "inspiration"; empty disables.
+CACHE_NEAR_DUP_MODES = {m.strip() for m in os.getenv("CACHE_NEAR_DUP_MODES", "").split(",") if m.strip()}
+CACHE_NEAR_DUP_THRESHOLD = float(os.getenv("CACHE_NEAR_DUP_THRESHOLD", "0.8"))
+CACHE_NEAR_DUP_TTL_SEC = int(os.getenv("CACHE_NEAR_DUP_TTL_SEC", "3600"))
+CACHE_NEAR_DUP_MAX_ENTRIES = int(os.getenv("CACHE_NEAR_DUP_MAX_ENTRIES", "512"))
+
+DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
+PUBLISH_DB_PATH = Path(os.getenv("PUBLISH_DB_PATH", str(DATA_DIR / "publish.sqlite3")))
+PUBLISH_JOB_RETENTION = int(os.getenv("PUBLISH_JOB_RETENTION", "1000"))
+PUBLISH_TASK_RETENTION = int(os.getenv("PUBLISH_TASK_RETENTION", "1000"))
+BOOK_DIR = Path(os.getenv("BOOK_DIR", str(DATA_DIR / "books")))
+BOOK_MAX_CHAPTERS = int(os.getenv("BOOK_MAX_CHAPTERS", "200"))
+BOOK_POST_CONCURRENCY = int(os.getenv("BOOK_POST_CONCURRENCY", "2"))
+PUBLISH_WORKERS = int(os.getenv("PUBLISH_WORKERS", "2"))
+PUBLISH_PAGE_POOL_SIZE = int(os.getenv("PUBLISH_PAGE_POOL_SIZE", str(max(1, PUBLISH_WORKERS))))
+WORKERS = int(os.getenv("WORKERS", "1"))  # uvicorn worker processes when started via `python app.py`
+SHARED_BACKEND = os.getenv("SHARED_BACKEND", "memory" if WORKERS <= 1 else "sqlite").strip().lower()  # memory | sqlite | redis
+SHARED_DB_PATH = Path(os.getenv("SHARED_DB_PATH", str(DATA_DIR / "shared.sqlite3")))
+SHARED_REDIS_URL = os.getenv("SHARED_REDIS_URL", "").strip()
+LEADER_LEASE_SEC = float(os.getenv("LEADER_LEASE_SEC", "15"))
+BOOK_SWEEP_SEC = float(os.getenv("BOOK_SWEEP_SEC", "60"))
 
 LOG_DIR = Path(os.getenv("LOG_DIR", "logs"))
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "").strip()  # OTLP/JSON lines, e.g. logs/traces.jsonl
 
 # Production hardening
 CORS_ORIGINS = [x.strip() for x in os.getenv("CORS_ORIGINS", "*").split(",") if x.strip()]
 SERVICE_API_KEY = os.getenv("SERVICE_API_KEY", "").strip()
 MAX_GENERATE_CONCURRENCY = int(os.getenv("MAX_GENERATE_CONCURRENCY", "5"))
 RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+# Per route class; each falls back to RATE_LIMIT_PER_MINUTE.
+RATE_LIMIT_GEN_PER_MINUTE = int(os.getenv("RATE_LIMIT_GEN_PER_MINUTE", str(RATE_LIMIT_PER_MINUTE)))
+RATE_LIMIT_HEALTH_PER_MINUTE = int(os.getenv("RATE_LIMIT_HEALTH_PER_MINUTE", str(RATE_LIMIT_PER_MINUTE)))
+RATE_LIMIT_PUBLISH_PER_MINUTE = int(os.getenv("RATE_LIMIT_PUBLISH_PER_MINUTE", str(RATE_LIMIT_PER_MINUTE)))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))  # memory backend only
 MODEL_HEALTH_TIMEOUT = int(os.getenv("MODEL_HEALTH_TIMEOUT", "20"))
+MODEL_HEALTH_TTL_SEC = float(os.getenv("MODEL_HEALTH_TTL_SEC", "180"))
+MODEL_HEALTH_INTERVAL_SEC = float(os.getenv("MODEL_HEALTH_INTERVAL_SEC", "0"))  # 0 disables the background prober
+MODEL_HEALTH_CONCURRENCY = int(os.getenv("MODEL_HEALTH_CONCURRENCY", "8"))
+READYZ_REQUIRE_UPSTREAM = os.getenv("READYZ_REQUIRE_UPSTREAM", "false").lower() == "true"
+STORY_MEMORY_BUDGET = int(os.getenv("STORY_MEMORY_BUDGET", "6000"))
+AUDIT_WORKERS = int(os.getenv("AUDIT_WORKERS", str(max(1, min(4, os.cpu_count() or 1)))))
+AUDIT_CHUNK_CHAPTERS = int(os.getenv("AUDIT_CHUNK_CHAPTERS", "16"))
+POSTPROCESS_EXECUTOR = os.getenv("POSTPROCESS_EXECUTOR", "thread").strip().lower()  # thread | process | inline
+POSTPROCESS_WORKERS = int(os.getenv("POSTPROCESS_WORKERS", "2"))
+POSTPROCESS_MAX_PENDING = int(os.getenv("POSTPROCESS_MAX_PENDING", "32"))
+POSTPROCESS_INLINE_CHARS = int(os.getenv("POSTPROCESS_INLINE_CHARS", "20000"))
+LOOP_BLOCK_WARN_MS = float(os.getenv("LOOP_BLOCK_WARN_MS", "200"))  # 0 disables the watchdog thread
+QUALITY_BOOK_CACHE_SIZE = int(os.getenv("QUALITY_BOOK_CACHE_SIZE", "32"))
+EXPAND_CONCURRENCY = int(os.getenv("EXPAND_CONCURRENCY", "3"))
+EXPAND_DEADLINE_SEC = float(os.getenv("EXPAND_DEADLINE_SEC", str(REQUEST_TIMEOUT + 10)))
+
+
+
+def _provider_limits(raw: str) -> dict[str, float]:
+    """Parse "openrouter=20,newapi=60,*=0" into {provider: limit}; 0 means unlimited."""
+    limits = {}
+    for item in raw.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            limits[name.strip()] = float(value)
+    return limits
+
+
+# Upstream rate limiting (per provider RPM/TPM, adaptive per-model concurrency)
+UPSTREAM_RPM = _provider_limits(os.getenv("UPSTREAM_RPM", ""))
+UPSTREAM_TPM = _provider_limits(os.getenv("UPSTREAM_TPM", ""))
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", str(MAX_GENERATE_CONCURRENCY)))
+UPSTREAM_MIN_CONCURRENCY = int(os.getenv("UPSTREAM_MIN_CONCURRENCY", "1"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "1"))
+UPSTREAM_BACKOFF_CAP = float(os.getenv("UPSTREAM_BACKOFF_CAP", "60"))
+
+# Circuit breakers and model failover
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_OPEN_SEC = float(os.getenv("CIRCUIT_OPEN_SEC", "30"))
+CIRCUIT_MAX_OPEN_SEC = float(os.getenv("CIRCUIT_MAX_OPEN_SEC", "300"))
+MODEL_FAILOVER = os.getenv("MODEL_FAILOVER", "true").lower() == "true"
+MODEL_FAILOVER_ORDER = [x.strip() for x in os.getenv("MODEL_FAILOVER_ORDER", "newapi,openrouter,google,anthropic").split(",") if x.strip()]
+MODEL_FAILOVER_MAX_MODELS = int(os.getenv("MODEL_FAILOVER_MAX_MODELS", "3"))
+MODEL_FAILOVER_ATTEMPTS = int(os.getenv("MODEL_FAILOVER_ATTEMPTS", "1"))
+
+# model="auto": route by live latency, tokens/sec, error rate and context length
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+ROUTER_PRIOR_TOKENS_PER_SEC = float(os.getenv("ROUTER_PRIOR_TOKENS_PER_SEC", "20"))
+ROUTER_EXPLORE_RATIO = float(os.getenv("ROUTER_EXPLORE_RATIO", "0.05"))
+
+# Hedged requests: duplicate a slow call after a learned latency percentile
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_TARGET = os.getenv("HEDGE_TARGET", "same").lower()  # same | alternate
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_SEC = float(os.getenv("HEDGE_MIN_DELAY_SEC", "2"))
+HEDGE_DEFAULT_DELAY_SEC = float(os.getenv("HEDGE_DEFAULT_DELAY_SEC", "30"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", "5"))
+HEDGE_MAX_INFLIGHT = int(os.getenv("HEDGE_MAX_INFLIGHT", "2"))
+
+# Upstream HTTP connection pool
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", str(max(10, MAX_GENERATE_CONCURRENCY * 2))))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))
 
 LOG_DIR.mkdir(exist_ok=True)
+DATA_DIR.mkdir(exist_ok=True)
 if CACHE_ENABLED:
     CACHE_DIR.mkdir(exist_ok=True)
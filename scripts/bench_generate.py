@@ -0,0 +1,467 @@
+"""Load benchmark for POST /generate against a local mock provider.
+
+By default it starts scripts/mock_llm.py and the app (uvicorn, one worker) as child
+processes on free ports, with every provider pointed at the mock. It then replays a
+generate/continue/expand/pad mix and reports p50/p95/p99 latency per mode, throughput
+and the server's RSS. Each run is saved as JSON under --out-dir, so runs can be compared
+over time (--compare latest, or a path).
+
+    python scripts/bench_generate.py --requests 300 --concurrency 16
+    python scripts/bench_generate.py --rate 5 --duration 60 --ttft lognormal:1.5,0.6 --label slow-upstream
+    python scripts/bench_generate.py --target http://127.0.0.1:8000 --pid 1234 --api-key ...
+
+--rate drives an open loop (Poisson arrivals, so a slow server cannot slow down the
+arrival rate and hide its queueing); without it, --concurrency workers send back to back.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+import aiohttp
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from scripts.mock_llm import add_mock_arguments  # noqa: E402
+
+DEFAULT_MIX = "generate=0.4,continue=0.3,expand=0.2,pad=0.1"
+MOCK_MODELS = {"newapi": "mock-openai", "google": "mock-gemini", "anthropic": "mock-claude"}
+GENRES = ["玄幻", "都市", "科幻", "悬疑", "历史"]
+FILLER = "夜色沉沉，城门外的风裹着沙砾扑在脸上。他握紧了腰间的刀，却迟迟没有拔出来。"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _parse_mix(spec: str) -> list[tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        mode, _, weight = part.partition("=")
+        if mode.strip():
+            mix.append((mode.strip(), float(weight or 1)))
+    if not mix or sum(w for _, w in mix) <= 0:
+        raise ValueError(f"bad --mix: {spec!r}")
+    return mix
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float | None:
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100
+    lo = int(rank)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (rank - lo)
+
+
+def _rss_mb(pid: int | None) -> float | None:
+    if not pid:
+        return None
+    try:
+        import psutil  # optional
+
+        return psutil.Process(pid).memory_info().rss / 1048576
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+class PayloadFactory:
+    """Builds /generate bodies shaped like the UI's requests for each mode."""
+
+    def __init__(self, rng: random.Random, models: list[str], chapter_min_words: int, repeat_ratio: float):
+        self.rng = rng
+        self.models = models
+        self.chapter_min_words = chapter_min_words
+        self.repeat_ratio = repeat_ratio
+        self.seq = 0
+
+    def _nonce(self) -> str:
+        # Unique prompts defeat the response cache unless --repeat-ratio asks for repeats.
+        if self.rng.random() < self.repeat_ratio:
+            return f"#{self.rng.randint(0, 9)}"
+        self.seq += 1
+        return f"#{os.getpid()}-{self.seq}"
+
+    def _chapter(self, idx: int, chars: int) -> dict:
+        body = (FILLER * (chars // len(FILLER) + 1))[:chars]
+        return {"title": f"第{idx}章 风起", "content": body}
+
+    def build(self, mode: str) -> dict:
+        genre = self.rng.choice(GENRES)
+        body = {
+            "mode": mode,
+            "model": self.rng.choice(self.models),
+            "genre": genre,
+            "chapter_min_words": self.chapter_min_words,
+            "chapter_max_words": self.chapter_min_words * 2,
+        }
+        if mode == "continue":
+            existing = [self._chapter(i, self.chapter_min_words) for i in range(1, self.rng.randint(2, 6))]
+            body.update(prompt=f"继续写下一章{self._nonce()}", existing_chapters=existing, novel_title="基准测试之书")
+        elif mode in {"expand", "pad"}:
+            short = self._chapter(self.rng.randint(1, 30), max(200, self.chapter_min_words // 4))
+            body["prompt"] = f"{short['title']}\n{short['content']}{self._nonce()}"
+        else:
+            body["prompt"] = f"写一部{genre}小说，主角在乱世中崛起{self._nonce()}"
+        return body
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: list[dict] = []
+
+    def add(self, mode: str, status: int, seconds: float, ok: bool, error: str = "") -> None:
+        self.samples.append({"mode": mode, "status": status, "sec": seconds, "ok": ok, "error": error})
+
+    @staticmethod
+    def _summary(samples: list[dict]) -> dict:
+        ok = sorted(s["sec"] for s in samples if s["ok"])
+        every = sorted(s["sec"] for s in samples)
+
+        def ms(v: float | None) -> float | None:
+            return round(v * 1000, 1) if v is not None else None
+
+        return {
+            "count": len(samples),
+            "ok": len(ok),
+            "errors": len(samples) - len(ok),
+            "error_rate": round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+            # Percentiles of successful requests; fast failures would flatter them.
+            "p50_ms": ms(_percentile(ok, 50)),
+            "p95_ms": ms(_percentile(ok, 95)),
+            "p99_ms": ms(_percentile(ok, 99)),
+            "mean_ms": ms(sum(ok) / len(ok)) if ok else None,
+            "max_ms": ms(every[-1]) if every else None,
+        }
+
+    def report(self, elapsed: float) -> dict:
+        by_mode = {}
+        for mode in sorted({s["mode"] for s in self.samples}):
+            by_mode[mode] = self._summary([s for s in self.samples if s["mode"] == mode])
+        overall = self._summary(self.samples)
+        overall["rps"] = round(len(self.samples) / elapsed, 2) if elapsed > 0 else None
+        overall["ok_rps"] = round(overall["ok"] / elapsed, 2) if elapsed > 0 else None
+        errors = Counter(s["error"] for s in self.samples if s["error"])
+        return {
+            "elapsed_sec": round(elapsed, 2),
+            "overall": overall,
+            "by_mode": by_mode,
+            "status_codes": dict(sorted(Counter(str(s["status"]) for s in self.samples).items())),
+            "top_errors": dict(errors.most_common(5)),
+        }
+
+
+async def _send(session: aiohttp.ClientSession, url: str, body: dict, headers: dict, timeout: float, rec: Recorder | None) -> None:
+    started = time.perf_counter()
+    status, ok, error = 0, False, ""
+    try:
+        async with session.post(f"{url}/generate", json=body, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            status = resp.status
+            data = await resp.json(content_type=None)
+            ok = status == 200 and bool(data.get("success"))
+            if not ok:
+                error = str(data.get("error") or f"HTTP {status}")[:120]
+    except asyncio.TimeoutError:
+        error = "client timeout"
+    except Exception as exc:
+        error = f"{exc.__class__.__name__}: {exc}"[:120]
+    if rec is not None:
+        rec.add(body["mode"], status, time.perf_counter() - started, ok, error)
+
+
+async def _sample_memory(pid: int | None, out: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        rss = _rss_mb(pid)
+        if rss is not None:
+            out.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(args: argparse.Namespace, url: str, pid: int | None) -> dict:
+    rng = random.Random(args.seed)
+    mix = _parse_mix(args.mix)
+    modes, weights = [m for m, _ in mix], [w for _, w in mix]
+    factory = PayloadFactory(rng, args.models, args.chapter_min_words, args.repeat_ratio)
+    headers = {"x-api-key": args.api_key} if args.api_key else {}
+    connector = aiohttp.TCPConnector(limit=0)
+    rec = Recorder()
+    rss: list[float] = []
+    stop = asyncio.Event()
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        for _ in range(args.warmup):
+            await _send(session, url, factory.build(rng.choices(modes, weights)[0]), headers, args.timeout, None)
+
+        rss_start = _rss_mb(pid)
+        sampler = asyncio.create_task(_sample_memory(pid, rss, stop))
+        deadline = time.perf_counter() + args.duration if args.duration else None
+        budget = {"left": args.requests if not args.duration else None}
+
+        def next_body() -> dict | None:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            if budget["left"] is not None:
+                if budget["left"] <= 0:
+                    return None
+                budget["left"] -= 1
+            return factory.build(rng.choices(modes, weights)[0])
+
+        started = time.perf_counter()
+        if args.rate:
+            inflight: set[asyncio.Task] = set()
+            sem = asyncio.Semaphore(args.max_inflight)
+            while (body := next_body()) is not None:
+                await sem.acquire()
+                task = asyncio.create_task(_send(session, url, body, headers, args.timeout, rec))
+                inflight.add(task)
+                task.add_done_callback(lambda t: (inflight.discard(t), sem.release()))
+                await asyncio.sleep(rng.expovariate(args.rate))
+            if inflight:
+                await asyncio.gather(*inflight)
+        else:
+            async def worker() -> None:
+                while (body := next_body()) is not None:
+                    await _send(session, url, body, headers, args.timeout, rec)
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        await sampler
+        server_status = None
+        try:
+            async with session.get(f"{url}/runtime/status", headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+                if resp.status == 200:
+                    server_status = await resp.json(content_type=None)
+        except Exception:
+            pass
+
+    result = rec.report(elapsed)
+    result["memory"] = {
+        "rss_start_mb": round(rss_start, 1) if rss_start is not None else None,
+        "rss_peak_mb": round(max(rss), 1) if rss else None,
+        "rss_end_mb": round(rss[-1], 1) if rss else None,
+    }
+    result["server_status"] = server_status
+    return result
+
+
+def _wait_ready(url: str, proc: subprocess.Popen | None, timeout: float = 60) -> None:
+    import urllib.request
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise SystemExit(f"server exited early with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/healthz", timeout=2) as resp:
+                if resp.status == 200:
+                    return
+        except Exception:
+            time.sleep(0.3)
+    raise SystemExit(f"{url} not ready after {timeout:.0f}s")
+
+
+def _spawn(args: argparse.Namespace, workdir: Path) -> tuple[str, list[subprocess.Popen], int]:
+    mock_port, app_port = _free_port(), _free_port()
+    mock_cmd = [
+        sys.executable, str(ROOT / "scripts" / "mock_llm.py"), "--port", str(mock_port),
+        "--ttft", args.ttft, "--chars-per-sec", str(args.chars_per_sec), "--chapter-chars", args.chapter_chars,
+        "--chapters", str(args.chapters), "--error-rate", str(args.error_rate),
+        "--rate-limit-rate", str(args.rate_limit_rate),
+    ]
+    if args.seed is not None:
+        mock_cmd += ["--seed", str(args.seed)]
+    mock_base = f"http://127.0.0.1:{mock_port}"
+    env = dict(os.environ)
+    env.update({
+        "NEWAPI_BASE_URL": f"{mock_base}/v1",
+        "NEWAPI_API_KEY": "bench",
+        "NEWAPI_MODELS": MOCK_MODELS["newapi"],
+        "GOOGLE_API_BASE": f"{mock_base}/v1beta",
+        "GOOGLE_API_KEY": "bench",
+        "GOOGLE_MODELS": MOCK_MODELS["google"],
+        "ANTHROPIC_API_BASE": f"{mock_base}/v1",
+        "ANTHROPIC_API_KEY": "bench",
+        "ANTHROPIC_MODELS": MOCK_MODELS["anthropic"],
+        "OPENROUTER_API_KEY": "",
+        "SERVICE_API_KEY": args.api_key or "",
+        # Isolate state and keep the app's own guards from skewing the numbers.
+        "CACHE_DIR": str(workdir / "cache"),
+        "DATA_DIR": str(workdir / "data"),
+        "LOG_DIR": str(workdir / "logs"),
+        "RATE_LIMIT_PER_MINUTE": "1000000",
+        "MODEL_HEALTH_INTERVAL_SEC": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    log = open(workdir / "server.log", "w", encoding="utf-8")
+    mock = subprocess.Popen(mock_cmd, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{app_port}"
+    _wait_ready(url, app)
+    return url, [app, mock], app.pid
+
+
+def _load_previous(out_dir: Path, ref: str, exclude: Path) -> dict | None:
+    if ref == "latest":
+        runs = sorted(p for p in out_dir.glob("*.json") if p != exclude)
+        if not runs:
+            return None
+        path = runs[-1]
+    else:
+        path = Path(ref)
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data.setdefault("file", str(path))
+    return data
+
+
+def _print_report(run: dict) -> None:
+    res = run["result"]
+    o = res["overall"]
+    print(f"\n{run['label'] or 'run'} @ {run['git_rev'] or '?'}: {o['count']} requests in {res['elapsed_sec']}s, "
+          f"{o['rps']} req/s ({o['ok_rps']} ok/s), error rate {o['error_rate']:.1%}")
+    print(f"{'mode':<10}{'count':>7}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for mode, s in [*res["by_mode"].items(), ("ALL", o)]:
+        print(f"{mode:<10}{s['count']:>7}{s['errors']:>6}{s['p50_ms'] or '-':>10}{s['p95_ms'] or '-':>10}"
+              f"{s['p99_ms'] or '-':>10}{s['max_ms'] or '-':>10}")
+    mem = res["memory"]
+    if mem["rss_peak_mb"] is not None:
+        print(f"server RSS: start {mem['rss_start_mb']} MB, peak {mem['rss_peak_mb']} MB, end {mem['rss_end_mb']} MB")
+    print(f"status codes: {res['status_codes']}")
+    if res["top_errors"]:
+        print(f"top errors: {res['top_errors']}")
+
+
+def _print_compare(prev: dict, cur: dict) -> None:
+    print(f"\ncompared with {prev.get('file')} ({prev.get('label') or 'run'} @ {prev.get('git_rev') or '?'}):")
+    rows = [("rps", "rps"), ("ok_rps", "ok_rps"), ("p50_ms", "p50_ms"), ("p95_ms", "p95_ms"), ("p99_ms", "p99_ms"), ("error_rate", "error_rate")]
+    before, after = prev["result"]["overall"], cur["result"]["overall"]
+    for label, key in rows:
+        a, b = before.get(key), after.get(key)
+        if a is None or b is None:
+            continue
+        change = f"{(b - a) / a:+.1%}" if a else "n/a"
+        print(f"  {label:<11}{a:>10}  ->{b:>10}  ({change})")
+    a_mem, b_mem = prev["result"]["memory"].get("rss_peak_mb"), cur["result"]["memory"].get("rss_peak_mb")
+    if a_mem is not None and b_mem is not None:
+        print(f"  {'rss_peak_mb':<11}{a_mem:>10}  ->{b_mem:>10}  ({(b_mem - a_mem) / a_mem:+.1%})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", help="benchmark a running server instead of spawning app + mock")
+    parser.add_argument("--pid", type=int, help="server pid for RSS sampling with --target")
+    parser.add_argument("--api-key", default="", help="SERVICE_API_KEY (sent as x-api-key)")
+    parser.add_argument("--models", default=",".join(f"{p}::{m}" for p, m in MOCK_MODELS.items()),
+                        help="comma-separated model uids to spread requests over (auto works too)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="mode weights, e.g. generate=0.4,continue=0.3,expand=0.2,pad=0.1")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=0, help="run for N seconds instead of --requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="closed-loop workers")
+    parser.add_argument("--rate", type=float, default=0, help="open-loop arrival rate (req/s, Poisson)")
+    parser.add_argument("--max-inflight", type=int, default=512, help="open-loop cap on outstanding requests")
+    parser.add_argument("--warmup", type=int, default=5, help="requests sent before measuring")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--chapter-min-words", type=int, default=2000)
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="share of prompts drawn from a 10-prompt pool (exercises the cache)")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE", help="extra env for the spawned app")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--out-dir", default=str(ROOT / "data" / "bench"))
+    parser.add_argument("--compare", help="'latest' or a previous run's JSON file")
+    parser.add_argument("--keep-server-log", action="store_true")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    args.models = [m.strip() for m in args.models.split(",") if m.strip()]
+    _parse_mix(args.mix)
+
+    procs: list[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        try:
+            if args.target:
+                url, pid = args.target.rstrip("/"), args.pid
+            else:
+                url, procs, pid = _spawn(args, Path(tmp))
+            result = asyncio.run(run_load(args, url, pid))
+        finally:
+            for proc in procs:
+                proc.terminate()
+            for proc in procs:
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+            if args.keep_server_log and (Path(tmp) / "server.log").exists():
+                print((Path(tmp) / "server.log").read_text(encoding="utf-8", errors="replace")[-4000:])
+
+    settings = {k: v for k, v in vars(args).items() if k not in {"api_key", "compare", "keep_server_log", "out_dir"}}
+    run = {
+        "label": args.label,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "target": args.target or "spawned",
+        "settings": settings,
+        "result": result,
+    }
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = out_dir / f"{stamp}{'-' + args.label if args.label else ''}.json"
+    path.write_text(json.dumps(run, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    _print_report(run)
+    print(f"saved: {path}")
+    if args.compare:
+        prev = _load_previous(out_dir, args.compare, path)
+        if prev is None:
+            print("no previous run to compare with")
+        else:
+            _print_compare(prev, run)
+
+
+if __name__ == "__main__":
+    main()
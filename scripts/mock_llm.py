@@ -0,0 +1,262 @@
+"""Local mock LLM provider for benchmarks: no tokens are spent.
+
+Speaks the three wire formats used by `_build_endpoint`:
+
+    POST /v1/chat/completions                      OpenAI / OpenRouter / NewAPI
+    POST /v1beta/models/{model}:generateContent    Google (:streamGenerateContent?alt=sse)
+    POST /v1/messages                              Anthropic
+
+Each call waits a sampled time-to-first-token, then "writes" a sampled number of
+characters at --chars-per-sec (streamed in chunks when the request asks for a stream).
+Failures are injected at --error-rate (HTTP 500) and --rate-limit-rate (HTTP 429 with
+Retry-After). Output is Chinese chapter text the app's parsers accept: several chapters
+for a fresh book, one chapter for continue/expand/pad prompts.
+
+Distribution specs (seconds or characters): ``0.5`` or ``const:0.5``, ``uniform:a,b``,
+``normal:mean,sd``, ``lognormal:median,sigma``, ``exp:mean``.
+
+    python scripts/mock_llm.py --port 18900 --ttft lognormal:0.8,0.5 --chars-per-sec 300
+
+Point the app at it with NEWAPI_BASE_URL=http://127.0.0.1:18900/v1,
+GOOGLE_API_BASE=http://127.0.0.1:18900/v1beta, ANTHROPIC_API_BASE=http://127.0.0.1:18900/v1
+(and any non-empty *_API_KEY).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Callable
+
+from aiohttp import web
+
+CJK_START, CJK_END = 0x4E00, 0x9FA5
+SENTENCE_END = "。。。！？……"
+SINGLE_CHAPTER_MARKERS = ("目标章节：", "扩写")
+
+
+def parse_dist(spec: str) -> Callable[[random.Random], float]:
+    """Parse a distribution spec into a sampler returning non-negative floats."""
+    spec = str(spec).strip()
+    kind, _, args = spec.partition(":")
+    if not args:
+        kind, args = "const", spec
+    nums = [float(x) for x in args.split(",") if x.strip()]
+    if kind == "const" and len(nums) == 1:
+        return lambda rng: max(0.0, nums[0])
+    if kind == "uniform" and len(nums) == 2:
+        return lambda rng: max(0.0, rng.uniform(nums[0], nums[1]))
+    if kind == "normal" and len(nums) == 2:
+        return lambda rng: max(0.0, rng.gauss(nums[0], nums[1]))
+    if kind == "lognormal" and len(nums) == 2:
+        mu = math.log(max(nums[0], 1e-9))
+        return lambda rng: rng.lognormvariate(mu, nums[1])
+    if kind == "exp" and len(nums) == 1:
+        return lambda rng: rng.expovariate(1.0 / nums[0]) if nums[0] > 0 else 0.0
+    raise ValueError(f"bad distribution spec: {spec!r}")
+
+
+@dataclass
+class MockConfig:
+    ttft: str = "lognormal:0.5,0.4"
+    chars_per_sec: float = 400.0  # 0 = the whole output arrives with the first token
+    chapter_chars: str = "uniform:1500,3000"
+    chapters: int = 2
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    chunk_chars: int = 40
+    seed: int | None = None
+    stats: dict = field(default_factory=lambda: {"requests": 0, "errors": 0, "rate_limited": 0, "streams": 0, "chars": 0})
+
+
+class MockProvider:
+    def __init__(self, cfg: MockConfig):
+        self.cfg = cfg
+        self.rng = random.Random(cfg.seed)
+        self._ttft = parse_dist(cfg.ttft)
+        self._chapter_chars = parse_dist(cfg.chapter_chars)
+        # A fixed sentence pool keeps text generation cheap next to the simulated latency.
+        self._sentences = [
+            "".join(chr(self.rng.randint(CJK_START, CJK_END)) for _ in range(self.rng.randint(6, 24)))
+            + self.rng.choice(SENTENCE_END)
+            for _ in range(2000)
+        ]
+
+    # -- text -------------------------------------------------------------------------
+
+    def _paragraphs(self, size: int) -> str:
+        out, length, para = [], 0, []
+        while length < size:
+            sentence = self.rng.choice(self._sentences)
+            para.append(sentence)
+            length += len(sentence)
+            if len(para) >= self.rng.randint(3, 6):
+                out.append("".join(para))
+                para = []
+        if para:
+            out.append("".join(para))
+        return "\n\n".join(out)
+
+    def _chapter(self, idx: int) -> str:
+        size = int(self._chapter_chars(self.rng))
+        return f"第{idx}章 {self.rng.choice(self._sentences)[:6]}\n\n{self._paragraphs(size)}"
+
+    def compose(self, prompt: str) -> str:
+        if prompt.strip() in {"ping", ""}:
+            return "pong"
+        if any(marker in prompt[:200] for marker in SINGLE_CHAPTER_MARKERS):
+            numbers = [int(n) for n in re.findall(r"第(\d+)章", prompt)]
+            return self._chapter(max(numbers) if numbers else 1)
+        chapters = [self._chapter(i) for i in range(1, self.cfg.chapters + 1)]
+        return "《基准测试之书》\n\n" + "\n\n".join(chapters)
+
+    # -- request handling ---------------------------------------------------------------
+
+    def _inject_failure(self) -> web.Response | None:
+        roll = self.rng.random()
+        if roll < self.cfg.rate_limit_rate:
+            self.cfg.stats["rate_limited"] += 1
+            return web.json_response({"error": {"message": "mock rate limited"}}, status=429, headers={"Retry-After": "1"})
+        if roll < self.cfg.rate_limit_rate + self.cfg.error_rate:
+            self.cfg.stats["errors"] += 1
+            return web.json_response({"error": {"message": "mock upstream error"}}, status=500)
+        return None
+
+    def _write_seconds(self, text: str) -> float:
+        return len(text) / self.cfg.chars_per_sec if self.cfg.chars_per_sec > 0 else 0.0
+
+    async def _respond(self, request: web.Request, prompt: str, stream: bool, fmt: str) -> web.StreamResponse:
+        self.cfg.stats["requests"] += 1
+        failure = self._inject_failure()
+        await asyncio.sleep(self._ttft(self.rng))
+        if failure is not None:
+            return failure
+        text = self.compose(prompt)
+        self.cfg.stats["chars"] += len(text)
+        if not stream:
+            await asyncio.sleep(self._write_seconds(text))
+            return web.json_response(_full_body(fmt, text, prompt))
+
+        self.cfg.stats["streams"] += 1
+        resp = web.StreamResponse(headers={"content-type": "text/event-stream"})
+        await resp.prepare(request)
+        chunks = [text[i:i + self.cfg.chunk_chars] for i in range(0, len(text), self.cfg.chunk_chars)]
+        per_chunk = self._write_seconds(text) / max(1, len(chunks))
+        if fmt == "anthropic":
+            await resp.write(b'event: message_start\ndata: {"type":"message_start"}\n\n')
+        for i, chunk in enumerate(chunks):
+            if i and per_chunk:
+                await asyncio.sleep(per_chunk)
+            await resp.write(_stream_event(fmt, chunk))
+        if fmt == "anthropic":
+            await resp.write(b'event: message_stop\ndata: {"type":"message_stop"}\n\n')
+        elif fmt == "openai":
+            await resp.write(b"data: [DONE]\n\n")
+        await resp.write_eof()
+        return resp
+
+    async def openai(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = "".join(str(m.get("content", "")) for m in body.get("messages") or [])
+        return await self._respond(request, prompt, bool(body.get("stream")), "openai")
+
+    async def google(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        parts = [p for c in body.get("contents") or [] for p in (c.get("parts") or [])]
+        prompt = "".join(str(p.get("text", "")) for p in parts)
+        stream = request.match_info["action"].endswith(":streamGenerateContent")
+        return await self._respond(request, prompt, stream, "google")
+
+    async def anthropic(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = "".join(str(m.get("content", "")) for m in body.get("messages") or [])
+        return await self._respond(request, prompt, bool(body.get("stream")), "anthropic")
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.cfg.stats)
+
+
+def _full_body(fmt: str, text: str, prompt: str) -> dict:
+    # Rough token counts (~1.5 CJK chars per token) so the app's TPM accounting has usage data.
+    tokens_in, tokens_out = len(prompt) * 2 // 3, len(text) * 2 // 3
+    if fmt == "google":
+        return {
+            "candidates": [{"content": {"parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": tokens_in, "candidatesTokenCount": tokens_out, "totalTokenCount": tokens_in + tokens_out},
+        }
+    if fmt == "anthropic":
+        return {"content": [{"type": "text", "text": text}], "usage": {"input_tokens": tokens_in, "output_tokens": tokens_out}}
+    return {
+        "choices": [{"message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": tokens_in, "completion_tokens": tokens_out, "total_tokens": tokens_in + tokens_out},
+    }
+
+
+def _stream_event(fmt: str, chunk: str) -> bytes:
+    if fmt == "google":
+        return f"data: {json.dumps({'candidates': [{'content': {'parts': [{'text': chunk}]}}]}, ensure_ascii=False)}\r\n\r\n".encode()
+    if fmt == "anthropic":
+        data = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": chunk}}
+        return f"event: content_block_delta\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+    return f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]}, ensure_ascii=False)}\n\n".encode()
+
+
+def make_app(cfg: MockConfig) -> web.Application:
+    provider = MockProvider(cfg)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", provider.openai)
+    app.router.add_post("/api/v1/chat/completions", provider.openai)
+    app.router.add_post("/v1beta/models/{action}", provider.google)
+    app.router.add_post("/v1/messages", provider.anthropic)
+    app.router.add_get("/stats", provider.stats)
+    return app
+
+
+async def start(cfg: MockConfig, host: str = "127.0.0.1", port: int = 18900) -> web.AppRunner:
+    runner = web.AppRunner(make_app(cfg), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = MockConfig()
+    parser.add_argument("--ttft", default=defaults.ttft, help="time-to-first-token distribution (seconds)")
+    parser.add_argument("--chars-per-sec", type=float, default=defaults.chars_per_sec, help="output speed; 0 = instant")
+    parser.add_argument("--chapter-chars", default=defaults.chapter_chars, help="characters per chapter distribution")
+    parser.add_argument("--chapters", type=int, default=defaults.chapters, help="chapters in a fresh-book response")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="share of calls answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate, help="share answered with HTTP 429")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    for spec in (args.ttft, args.chapter_chars):
+        parse_dist(spec)  # fail fast on typos
+    return MockConfig(
+        ttft=args.ttft,
+        chars_per_sec=args.chars_per_sec,
+        chapter_chars=args.chapter_chars,
+        chapters=args.chapters,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18900)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(make_app(config_from_args(args)), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
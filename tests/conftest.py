@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# config.py creates its directories at import time; keep test runs out of the checkout.
+_TMP = Path(tempfile.mkdtemp(prefix="novel-tests-"))
+for name in ("DATA_DIR", "CACHE_DIR", "LOG_DIR"):
+    os.environ.setdefault(name, str(_TMP / name.lower()))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,38 @@
+import asyncio
+
+import httpx
+import pytest
+
+import app
+
+PROMPT = "一个关于星际旅行与失落文明的故事开头"
+BAD_MODEL = {"provider": "nope", "id": "x"}
+
+
+async def _post(path: str, body: dict) -> httpx.Response:
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(path, json=body)
+
+
+@pytest.mark.parametrize("path", ["/generate", "/generate/stream", "/books"])
+def test_invalid_custom_model_is_rejected_with_400(path):
+    resp = asyncio.run(_post(path, {"prompt": PROMPT, "mode": "generate", "custom_model": BAD_MODEL}))
+
+    assert resp.status_code == 400
+    assert resp.json() == {"success": False, "error": "自定义模型参数无效"}
+
+
+def test_cache_lookups_are_exported_as_a_counter(monkeypatch):
+    monkeypatch.setitem(app.response_cache.counters, "misses", 7)
+
+    async def scrape() -> str:
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.get("/metrics")
+            return (await client.get("/metrics")).text
+
+    text = asyncio.run(scrape())
+
+    assert "# TYPE response_cache_lookups_total counter" in text
+    assert 'response_cache_lookups_total{result="misses"} 7' in text.splitlines()
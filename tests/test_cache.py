@@ -0,0 +1,119 @@
+import asyncio
+
+from utils.cache import MemoryLRU, ResponseCache, SqliteStore, get_cache_key
+
+
+def _disk_sum(store: SqliteStore) -> int:
+    return SqliteStore._total(store._db())
+
+
+def test_memory_lru_evicts_least_recently_used_by_bytes():
+    lru = MemoryLRU(max_bytes=10)
+    lru.put("a", "m", "aaaa", 0, 4)
+    lru.put("b", "m", "bbbb", 0, 4)
+    assert lru.get("a", now=1) == "aaaa"  # a is now the most recent
+
+    lru.put("c", "m", "cccc", 0, 4)
+    assert lru.get("b", now=1) is None
+    assert lru.get("a", now=1) == "aaaa" and lru.get("c", now=1) == "cccc"
+    assert lru.bytes == 8 and lru.evictions == 1
+
+
+def test_memory_lru_skips_oversized_entries_and_accounts_replacements():
+    lru = MemoryLRU(max_bytes=10)
+    lru.put("big", "m", "x" * 11, 0, 11)
+    assert len(lru) == 0 and lru.bytes == 0
+
+    lru.put("k", "m", "abc", 0, 3)
+    lru.put("k", "m", "abcdef", 0, 6)
+    assert lru.bytes == 6 and len(lru) == 1
+
+
+def test_memory_lru_expires_entries():
+    lru = MemoryLRU(max_bytes=100)
+    lru.put("k", "m", "v", expires_at=10.0, size=1)
+    lru.put("forever", "m", "v", expires_at=0.0, size=1)
+
+    assert lru.get("k", now=9.0) == "v"
+    assert lru.get("k", now=10.0) is None
+    assert lru.get("forever", now=1e12) == "v"
+    assert lru.bytes == 1
+
+
+def test_memory_lru_drops_one_models_keys():
+    lru = MemoryLRU(max_bytes=100)
+    lru.put("a", "m1", "v", 0, 1)
+    lru.put("b", "m2", "v", 0, 1)
+    assert lru.drop_model("m1") == 1
+    assert lru.get("a", now=0) is None and lru.get("b", now=0) == "v"
+    assert lru.bytes == 1
+
+
+def test_sqlite_running_bytes_match_table_sum(tmp_path):
+    store = SqliteStore(tmp_path / "r.sqlite3", max_bytes=1000, resync_every=1000)
+
+    store.put("a", "m1", "p", "x" * 100, 100, now=0, expires_at=0)
+    store.put("b", "m1", "p", "x" * 200, 200, now=0, expires_at=50)
+    assert store._bytes == _disk_sum(store) == 300
+
+    store.put("a", "m1", "p", "x" * 40, 40, now=1, expires_at=0)  # replace
+    assert store._bytes == _disk_sum(store) == 240
+
+    assert store.get("b", now=60) is None  # expired on read
+    assert store._bytes == _disk_sum(store) == 40
+
+    store.put("c", "m2", "p", "x" * 300, 300, now=2, expires_at=0)
+    store.purge(expired_only=False, model_id="m1", now=3)
+    assert store._bytes == _disk_sum(store) == 300
+
+    store.purge(expired_only=False, model_id=None, now=4)
+    assert store._bytes == _disk_sum(store) == 0
+
+
+def test_sqlite_evicts_lru_rows_when_over_budget(tmp_path):
+    store = SqliteStore(tmp_path / "r.sqlite3", max_bytes=500, resync_every=1000)
+    for i in range(5):
+        store.put(f"k{i}", "m", "p", "x" * 200, 200, now=i, expires_at=0)
+
+    assert store._bytes == _disk_sum(store) <= 500
+    assert store.get("k4", now=10) is not None
+    assert store.get("k0", now=10) is None
+    assert store.evictions == 3
+
+
+def test_sqlite_resync_picks_up_other_writers_and_sweeps_expired_rows(tmp_path):
+    path = tmp_path / "r.sqlite3"
+    store = SqliteStore(path, max_bytes=10_000, resync_every=3)
+    other = SqliteStore(path, max_bytes=10_000)
+
+    store.put("a", "m", "p", "x" * 100, 100, now=0, expires_at=5)
+    other.put("b", "m", "p", "x" * 300, 300, now=0, expires_at=0)
+    store.put("c", "m", "p", "x" * 10, 10, now=1, expires_at=0)
+    assert store._bytes == 110  # not yet aware of the other process's row
+
+    store.put("d", "m", "p", "x" * 10, 10, now=10, expires_at=0)  # third write: resync
+    assert store._bytes == _disk_sum(store) == 320  # "a" expired and swept
+    other.close()
+    store.close()
+
+
+def test_response_cache_purge_by_model_keeps_other_models_in_memory(tmp_path):
+    async def scenario():
+        cache = ResponseCache(
+            enabled=True,
+            db_path=tmp_path / "r.sqlite3",
+            ttl_sec=3600,
+            memory_max_bytes=10_000,
+            disk_max_bytes=10_000,
+        )
+        await cache.put("prompt", "m1", "one")
+        await cache.put("prompt", "m2", "two")
+
+        assert await cache.purge(model_id="m1") == 1
+        assert cache.memory.get(get_cache_key("prompt", "m1"), now=0) is None
+        assert await cache.get("prompt", "m2") == "two"
+        assert cache.counters["memory_hits"] == 1
+        assert cache.disk._bytes == _disk_sum(cache.disk) == 3
+        cache.close()
+
+    asyncio.run(scenario())
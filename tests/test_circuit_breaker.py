@@ -0,0 +1,52 @@
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def test_opens_after_threshold_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, open_sec=10, max_open_sec=60)
+    breaker.record_failure(0.0)
+    breaker.record_failure(1.0)
+    assert breaker.state == CLOSED and breaker.allow(1.0)
+
+    breaker.record_failure(2.0)
+    assert breaker.state == OPEN
+    assert not breaker.allow(5.0)
+    assert breaker.counters["rejected"] == 1
+
+
+def test_success_resets_the_failure_streak():
+    breaker = CircuitBreaker(failure_threshold=2, open_sec=10, max_open_sec=60)
+    breaker.record_failure(0.0)
+    breaker.record_success()
+    breaker.record_failure(1.0)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, open_sec=10, max_open_sec=60)
+    breaker.record_failure(0.0)
+
+    assert breaker.allow(10.0)
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow(10.5)
+
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow(11.0)
+
+
+def test_failed_probe_reopens_with_doubled_cooldown():
+    breaker = CircuitBreaker(failure_threshold=1, open_sec=10, max_open_sec=15)
+    breaker.record_failure(0.0)
+    assert breaker.allow(10.0)
+
+    breaker.record_failure(10.0)
+    assert breaker.state == OPEN and breaker.open_sec == 15
+    assert not breaker.allow(20.0)
+    assert breaker.allow(25.0)
+
+
+def test_stale_probe_expires():
+    breaker = CircuitBreaker(failure_threshold=1, open_sec=10, max_open_sec=60)
+    breaker.record_failure(0.0)
+    assert breaker.allow(10.0)
+    # The probe's caller never reported back; another probe is allowed after open_sec.
+    assert breaker.allow(20.0)
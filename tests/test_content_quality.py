@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+from utils.content_quality import (
+    IncrementalAudit,
+    KeywordAutomaton,
+    QualityAuditor,
+    SensitiveLexicon,
+    check_hook,
+    coherence_score,
+    count_net_words,
+    detect_sensitive,
+    readability_score,
+)
+
+WORDS = ["洗钱", "毒品", "毒品交易", "品交", "恐怖袭击", "袭击", "ab", "abc", "bcd"]
+
+
+def _positions(text: str, word: str) -> list[int]:
+    """Every start offset, overlapping ones included."""
+    out, start = [], text.find(word)
+    while start != -1:
+        out.append(start)
+        start = text.find(word, start + 1)
+    return out
+
+
+def _naive_audit(chapters: list[dict]) -> list[dict]:
+    rows, prev = [], None
+    for ch in chapters:
+        content = ch["content"]
+        hook_ok, hook_reason = check_hook(content)
+        rows.append({
+            "title": ch["title"],
+            "word_count_net": count_net_words(content),
+            "sensitive_hits": detect_sensitive(content, WORDS),
+            "readability_score": readability_score(content),
+            "coherence_score": coherence_score(content, prev),
+            "hook_ok": hook_ok,
+            "hook_reason": hook_reason,
+        })
+        prev = content
+    return rows
+
+
+def _chapter(rng: random.Random, i: int) -> dict:
+    pieces = WORDS + ["然后", "之后", "主角", "城市", "夜色", "abcd", "。", "！", "\n\n", "，", " ", "42"]
+    content = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 80)))
+    return {"title": f"第{i}章", "content": content}
+
+
+@pytest.fixture
+def lexicon(tmp_path):
+    path = tmp_path / "words.txt"
+    path.write_text("\n".join(["# comment", *WORDS, "洗钱"]), encoding="utf-8")
+    return SensitiveLexicon(path)
+
+
+def test_automaton_finds_every_overlapping_occurrence():
+    text = "毒品交易里的毒品交易abcdabc"
+    found = KeywordAutomaton(WORDS).find_all(text)
+    for pid, word in enumerate(WORDS):
+        assert sorted(found.get(pid, [])) == _positions(text, word), word
+
+
+def test_compiled_auditor_matches_the_naive_scan(lexicon):
+    rng = random.Random(7)
+    auditor = QualityAuditor(lexicon)
+    for _ in range(30):
+        chapters = [_chapter(rng, i) for i in range(1, rng.randint(1, 6))]
+        result = auditor.audit(chapters)
+        for got, want, ch in zip(result["chapters"], _naive_audit(chapters), chapters):
+            assert {k: got[k] for k in want} == want
+            for hit in got["sensitive_positions"]:
+                assert hit["positions"] == _positions(ch["content"], hit["word"])
+        assert result["summary"]["sensitive_word_count"] == len(WORDS)
+
+
+def _book() -> list[dict]:
+    return [
+        {"title": "第1章", "content": "主角走进城市。夜色很深。\n\n然后他看到了毒品交易！"},
+        {"title": "第2章", "content": "城市的夜色依旧。主角继续前行。"},
+        {"title": "第3章", "content": "主角离开城市，夜色散去。"},
+        {"title": "第4章", "content": "新的一天开始了？"},
+    ]
+
+
+def test_incremental_audit_recomputes_the_edited_chapter_and_its_successor(lexicon):
+    auditor = QualityAuditor(lexicon)
+    incremental = IncrementalAudit(auditor)
+    chapters = _book()
+    incremental.update(chapters)
+    assert incremental.last_recomputed == 4
+
+    chapters[1] = {"title": "第2章", "content": "完全不同的内容，洗钱的故事。没有任何重合！"}
+    result = incremental.update(chapters)
+
+    assert incremental.last_recomputed == 2
+    assert result == auditor.audit(chapters)
+    assert result["chapters"][1]["sensitive_hits"] == ["洗钱"]
+
+
+def test_incremental_audit_handles_appends_truncation_and_renames(lexicon):
+    auditor = QualityAuditor(lexicon)
+    incremental = IncrementalAudit(auditor)
+    chapters = _book()
+    incremental.update(chapters[:2])
+
+    assert incremental.update(chapters) == auditor.audit(chapters)
+    assert incremental.last_recomputed == 2
+
+    assert incremental.update(chapters[:3]) == auditor.audit(chapters[:3])
+    assert incremental.last_recomputed == 0
+
+    renamed = [dict(ch) for ch in chapters[:3]]
+    renamed[2]["title"] = "第3章 改名"
+    assert incremental.update(renamed) == auditor.audit(renamed)
+    assert incremental.last_recomputed == 1
@@ -0,0 +1,145 @@
+import asyncio
+
+from utils.hedging import Hedger
+
+
+def _hedger(**overrides) -> Hedger:
+    options = dict(
+        percentile=95,
+        min_delay=0.01,
+        default_delay=0.02,
+        min_samples=100,
+        budget_ratio=0,
+        budget_burst=1,
+        max_inflight=2,
+    )
+    options.update(overrides)
+    return Hedger(**options)
+
+
+def test_hedge_wins_cancels_the_primary_and_charges_the_budget():
+    async def scenario():
+        hedger = _hedger()
+        primary_cancelled = asyncio.Event()
+        winners = []
+
+        async def slow_primary():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                primary_cancelled.set()
+                raise
+            return "slow"
+
+        async def fast_hedge():
+            return "fast"
+
+        result = await hedger.call("m", slow_primary, fast_hedge, on_winner=winners.append)
+        await asyncio.wait_for(primary_cancelled.wait(), timeout=1)
+
+        assert result == "fast"
+        assert winners == [1]
+        stats = hedger.stats()
+        assert stats["hedges_fired"] == 1 and stats["hedge_wins"] == 1
+        assert stats["budget"] == 0 and stats["inflight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_no_hedge_without_budget():
+    async def scenario():
+        hedger = _hedger(budget_burst=0)
+        hedge_calls = []
+
+        async def primary():
+            await asyncio.sleep(0.05)
+            return "primary"
+
+        async def hedge():
+            hedge_calls.append(1)
+            return "hedge"
+
+        assert await hedger.call("m", primary, hedge) == "primary"
+        assert not hedge_calls
+        assert hedger.counters["budget_denied"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_empty_hedge_result_falls_back_to_the_primary():
+    async def scenario():
+        hedger = _hedger()
+
+        async def primary():
+            await asyncio.sleep(0.05)
+            return "primary"
+
+        async def empty_hedge():
+            return None
+
+        winners = []
+        assert await hedger.call("m", primary, empty_hedge, on_winner=winners.append) == "primary"
+        assert winners == [0]
+        assert hedger.counters["primary_wins"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_stream_hedge_closes_the_losing_stream():
+    async def scenario():
+        hedger = _hedger()
+        closed = asyncio.Event()
+
+        async def slow_primary():
+            try:
+                await asyncio.sleep(5)
+                yield "slow"
+            finally:
+                closed.set()
+
+        async def fast_hedge():
+            yield "a"
+            yield "b"
+
+        winners = []
+        deltas = [d async for d in hedger.stream("m", slow_primary, fast_hedge, on_winner=winners.append)]
+
+        assert deltas == ["a", "b"]
+        assert winners == [1]
+        assert closed.is_set()
+        assert hedger.stats()["inflight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_the_request_while_closing_the_loser_propagates():
+    async def scenario():
+        hedger = _hedger()
+        go = asyncio.Event()
+        closing = asyncio.Event()
+
+        async def primary():
+            await go.wait()
+            yield "primary"
+
+        async def hedge():
+            await go.wait()
+            try:
+                yield "hedge"
+            finally:
+                closing.set()
+                await asyncio.sleep(5)  # slow cleanup of the losing stream
+
+        async def consume():
+            return [d async for d in hedger.stream("m", primary, hedge)]
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)  # past the hedge delay: both streams are running
+        go.set()  # both produce a first delta together; the primary wins
+        await asyncio.wait_for(closing.wait(), timeout=1)
+        task.cancel()
+        done, _ = await asyncio.wait({task}, timeout=1)
+
+        assert task in done and task.cancelled()
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+from utils.model_router import ModelRouter, ModelStatsRegistry
+
+
+def _router(stats: ModelStatsRegistry) -> ModelRouter:
+    return ModelRouter(
+        stats,
+        key=lambda m: m["uid"],
+        is_open=lambda key: False,
+        is_unhealthy=lambda m: False,
+        probe_latency=lambda m: None,
+        prior_tokens_per_sec=20,
+    )
+
+
+def test_error_only_model_ranks_after_healthy_measured_model():
+    stats = ModelStatsRegistry(alpha=0.2)
+    for _ in range(3):
+        stats.record_error("failing")
+    stats.record_success("healthy", 10.0, 300)  # 30 tok/s
+
+    models = [{"uid": "failing"}, {"uid": "healthy"}]
+    route = _router(stats).route(models, "prompt", 4000)
+
+    assert route.model["uid"] == "healthy"
+    assert [m["uid"] for m in route.ranked] == ["healthy", "failing"]
+
+
+def test_unmeasured_and_failed_models_share_the_prior_throughput():
+    stats = ModelStatsRegistry(alpha=0.2)
+    stats.record_error("failing")
+
+    models = [{"uid": "failing"}, {"uid": "fresh"}]
+    route = _router(stats).route(models, "prompt", 4000)
+
+    scores = {c["model"]: c["score_sec"] for c in route.candidates}
+    assert scores["fresh"] == 200.0
+    assert scores["failing"] > scores["fresh"]
+    assert route.model["uid"] == "fresh"
@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+import pytest
+
+import utils.openrouter_api as api
+
+
+class _Content:
+    def __init__(self, events: list[dict]):
+        self._lines = [f"data: {json.dumps(e)}\n".encode() for e in events]
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for line in self._lines:
+            yield line
+
+
+class _Response:
+    status = 200
+    headers: dict = {}
+
+    def __init__(self, events: list[dict]):
+        self.content = _Content(events)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _Session:
+    def __init__(self, *responses: list[dict]):
+        self._responses = list(responses)
+        self.posts = 0
+
+    def post(self, *args, **kwargs):
+        self.posts += 1
+        return _Response(self._responses.pop(0))
+
+
+def _text(text: str) -> dict:
+    return {"type": "content_block_delta", "delta": {"type": "text_delta", "text": text}}
+
+
+OVERLOADED = {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}}
+
+
+@pytest.fixture
+def anthropic(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setattr(api.upstream_limiter, "retry_delay", lambda attempt: 0)
+    lookups = []
+
+    async def no_cache(prompt, model_id):
+        lookups.append(model_id)
+        return None
+
+    async def no_store(prompt, model_id, content):
+        return None
+
+    monkeypatch.setattr(api, "get_cached_response", no_cache)
+    monkeypatch.setattr(api, "cache_response", no_store)
+    model = {"provider": "anthropic", "id": "claude-test", "uid": "anthropic-test"}
+    return model, lookups
+
+
+def _use(monkeypatch, session: _Session) -> None:
+    async def get_session():
+        return session
+
+    monkeypatch.setattr(api.http_pool, "get_session", get_session)
+
+
+async def _collect(stream) -> list[str]:
+    return [delta async for delta in stream]
+
+
+def test_stream_error_event_is_recorded_and_retried(monkeypatch, anthropic):
+    model, lookups = anthropic
+    session = _Session([OVERLOADED], [_text("你好"), _text("世界")])
+    _use(monkeypatch, session)
+
+    deltas = asyncio.run(_collect(api._measured_stream(model, "prompt", max_attempts=2)))
+
+    assert deltas == ["你好", "世界"]
+    assert session.posts == 2
+    assert lookups == [api.model_key(model)]  # one cache lookup per request
+    assert api.breakers.get(api.model_key(model)).counters["failures"] == 1
+    counters = api.upstream_limiter.stats()["models"]["anthropic:claude-test"]
+    assert counters["overloaded"] == 1 and counters["ok"] == 1
+
+
+def test_stream_error_after_first_delta_is_not_retried(monkeypatch, anthropic):
+    model, _ = anthropic
+    model = {**model, "id": "claude-test-2", "uid": "anthropic-test-2"}
+    session = _Session([_text("部分"), {"type": "error", "error": {"type": "api_error"}}], [_text("unused")])
+    _use(monkeypatch, session)
+
+    seen = []
+
+    async def scenario():
+        async for delta in api.stream_content(model, "prompt", max_attempts=3):
+            seen.append(delta)
+
+    with pytest.raises(RuntimeError, match="anthropic_stream_error"):
+        asyncio.run(scenario())
+    assert seen == ["部分"] and session.posts == 1
+    assert api.upstream_limiter.stats()["models"]["anthropic:claude-test-2"]["failed"] == 1
@@ -0,0 +1,30 @@
+from utils.prompt_cache import NearDupCache, canonical, normalize_text
+
+
+def test_normalize_keeps_paragraph_indentation_and_wording():
+    text = "　　第一段，  有多余   空格。  \r\n\r\n\r\n\r\n　　第二段　保留全角空格。\n    缩进的行\n"
+    assert normalize_text(text) == "　　第一段， 有多余 空格。\n\n　　第二段　保留全角空格。\n    缩进的行"
+
+
+def test_normalize_is_idempotent_and_trims_only_blank_edge_lines():
+    text = "\n\n  \n　　正文\t\t结束  \n \n"
+    once = normalize_text(text)
+    assert once == "　　正文 结束"
+    assert normalize_text(once) == once
+
+
+def test_canonical_sorts_dicts_and_drops_empty_values():
+    a = {"name": "林  舟 ", "traits": ["冷静 ", "果断"], "notes": "", "age": None}
+    b = {"traits": ["冷静", "果断"], "name": "林 舟"}
+    assert canonical(a) == canonical(b)
+    assert list(canonical(a)) == ["name", "traits"]
+
+
+def test_near_duplicate_lookup_respects_scope_and_threshold():
+    cache = NearDupCache(modes={"inspiration"}, threshold=0.8)
+    cache.put("scope-a", "一个关于星际旅行与失落文明的故事开头，主角是年轻的领航员", "灵感")
+
+    hit = cache.get("scope-a", "一个关于星际旅行与失落文明的故事开头，主角是年轻的领航员！")
+    assert hit is not None and hit[0] == "灵感" and hit[1] >= 0.8
+    assert cache.get("scope-b", "一个关于星际旅行与失落文明的故事开头，主角是年轻的领航员") is None
+    assert cache.get("scope-a", "完全不同的校园恋爱喜剧") is None
@@ -0,0 +1,38 @@
+from utils.publish_store import PublishStore
+
+
+def _task(i):
+    return {"task_id": f"t{i:03d}", "created_at": f"2024-01-01T00:00:{i:02d}"}
+
+
+def _count(store, table):
+    return store._db().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_tasks_are_compacted_every_n_writes(tmp_path):
+    store = PublishStore(tmp_path / "publish.db", job_retention=3, task_retention=3, compact_every=4)
+    for i in range(7):
+        store.save_task(_task(i))
+    assert _count(store, "publish_tasks") == 6  # compacted to 3 at write 4, then three more
+
+    store.save_task(_task(7))
+    assert _count(store, "publish_tasks") == 3
+    assert [t["task_id"] for t in store.recent_tasks(10)] == ["t007", "t006", "t005"]
+    store.close()
+
+
+def test_finished_jobs_are_compacted_every_n_terminal_writes(tmp_path):
+    store = PublishStore(tmp_path / "publish.db", job_retention=1, task_retention=1, compact_every=2)
+    jobs = [
+        {"job_id": f"j{i}", "created_at": f"2024-01-01T00:00:0{i}", "status": "queued", "next_run_at": 0}
+        for i in range(3)
+    ]
+    for job in jobs:
+        store.add_job(job)
+    store.save_job({**jobs[0], "status": "success"})
+    store.save_job({**jobs[1], "status": "running"})  # not terminal: does not count
+    assert store.job_counts() == {"success": 1, "running": 1, "queued": 1}
+
+    store.save_job({**jobs[1], "status": "failed"})
+    assert store.job_counts() == {"failed": 1, "queued": 1}
+    store.close()
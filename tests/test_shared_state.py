@@ -0,0 +1,27 @@
+import pytest
+
+from utils.shared_state import MemoryBackend, SharedBackend, SqliteBackend
+
+
+def test_backends_implement_every_operation(tmp_path):
+    MemoryBackend()
+    SqliteBackend(tmp_path / "shared.db")
+
+
+def test_backend_missing_an_operation_fails_at_instantiation():
+    class NoLeases(SharedBackend):
+        kind = "partial"
+
+        async def hit(self, key, limit, window, now):
+            return True, 1, 0
+
+        async def incr(self, name, amount=1):
+            return None
+
+        async def counters(self, names):
+            return {}
+
+    with pytest.raises(TypeError):
+        NoLeases()
+    with pytest.raises(TypeError):
+        SharedBackend()
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+import utils.openrouter_api as api
+from utils.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+        assert results == ["answer"] * 5
+        assert len(calls) == 1
+        assert flight.stats() == {"upstream_calls": 1, "coalesced_calls": 4, "inflight": 0}
+
+    asyncio.run(scenario())
+
+
+def test_exception_reaches_every_waiter():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.05)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(3)), return_exceptions=True)
+        assert [str(r) for r in results] == ["upstream down"] * 3
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    asyncio.run(scenario())
+
+
+def test_one_waiter_leaving_does_not_cancel_the_others():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        leaver = asyncio.create_task(flight.do("k", fn))
+        stayer = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        leaver.cancel()
+        assert await stayer == "answer"
+        assert leaver.cancelled()
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    calls = []
+
+    async def no_cache(prompt, model_id):
+        return None
+
+    async def upstream(model, prompt, key, attempts):
+        calls.append(attempts)
+        await asyncio.sleep(0.05)
+        return f"answer after up to {attempts} attempts"
+
+    monkeypatch.setattr(api, "get_cached_response", no_cache)
+    monkeypatch.setattr(api, "_generate_upstream", upstream)
+    monkeypatch.setattr(api.config, "HEDGE_ENABLED", False)
+    return calls
+
+
+def test_generate_content_coalesces_only_matching_retry_policies(fake_upstream):
+    model = {"provider": "openrouter", "id": "test/model", "uid": "test-model"}
+
+    async def scenario():
+        return await asyncio.gather(
+            api.generate_content(model, "same prompt", max_attempts=1),
+            api.generate_content(model, "same prompt", max_attempts=1),
+            api.generate_content(model, "same prompt", max_attempts=3),
+        )
+
+    results = asyncio.run(scenario())
+    assert sorted(fake_upstream) == [1, 3]
+    assert results == [
+        "answer after up to 1 attempts",
+        "answer after up to 1 attempts",
+        "answer after up to 3 attempts",
+    ]
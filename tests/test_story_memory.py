@@ -0,0 +1,42 @@
+from utils.story_memory import StoryMemory
+
+
+def _chapters(*contents):
+    return [{"title": f"第{i}章", "content": c} for i, c in enumerate(contents, 1)]
+
+
+def _memory():
+    return StoryMemory(role_cards=[{"name": "林舟"}, {"name": "苏晚"}], foreshadows=["青铜钥匙的来历"])
+
+
+def test_editing_a_chapter_replaces_its_mentions():
+    memory = _memory()
+    memory.update(_chapters("林舟醒来。林舟出门。", "苏晚在等林舟。"))
+    assert memory.characters["林舟"]["mentions"] == 3
+
+    memory.update(_chapters("林舟醒来。", "苏晚在等林舟。"))
+    assert memory.characters["林舟"]["mentions"] == 2
+    memory.update(_chapters("林舟醒来。", "苏晚在等林舟。"))  # unchanged: nothing re-added
+    assert memory.characters["林舟"]["mentions"] == 2
+    assert memory.characters["苏晚"]["mentions"] == 1
+
+
+def test_edit_that_drops_a_character_falls_back_to_the_earlier_sighting():
+    memory = _memory()
+    memory.update(_chapters("林舟握着青铜钥匙。", "苏晚推门而入，林舟抬头。"))
+    assert memory.characters["林舟"]["last_seen"] == 2
+    assert memory.threads[0]["last_seen"] == 1
+
+    memory.update(_chapters("林舟握着青铜钥匙。", "苏晚推门而入。"))
+    assert memory.characters["林舟"] == {"last_seen": 1, "mentions": 1, "state": "林舟握着青铜钥匙。"}
+    assert memory.characters["苏晚"]["last_seen"] == 2
+
+
+def test_dropped_chapters_are_subtracted():
+    memory = _memory()
+    memory.update(_chapters("林舟醒来。", "林舟握着青铜钥匙。"))
+    memory.update(_chapters("林舟醒来。"))
+
+    assert memory.characters["林舟"]["mentions"] == 1
+    assert memory.characters["林舟"]["last_seen"] == 1
+    assert memory.threads[0]["last_seen"] == 0
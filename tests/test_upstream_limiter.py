@@ -0,0 +1,85 @@
+import asyncio
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from utils.upstream_limiter import AimdLimit, parse_retry_after
+
+
+def test_aimd_halves_once_per_cooldown_and_grows_back():
+    aimd = AimdLimit(initial=8, minimum=1, maximum=8, decrease_cooldown=1.0)
+
+    aimd.on_overload(100.0)
+    aimd.on_overload(100.5)  # same burst of 429s
+    assert aimd.limit == 4
+
+    aimd.on_overload(101.0)
+    assert aimd.limit == 2
+
+    previous = aimd.limit
+    for _ in range(50):
+        aimd.on_success()
+        assert aimd.limit >= previous
+        previous = aimd.limit
+    assert aimd.limit == 8
+
+
+def test_aimd_never_drops_below_minimum():
+    aimd = AimdLimit(initial=2, minimum=2, maximum=8, decrease_cooldown=0)
+    for now in range(5):
+        aimd.on_overload(float(now))
+    assert aimd.limit == 2
+
+
+def test_parse_retry_after_seconds_ms_and_http_date():
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "9"}) == 1.5
+
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    delay = parse_retry_after({"retry-after": format_datetime(when, usegmt=True)})
+    assert 25 <= delay <= 30.5
+
+    past = datetime.now(timezone.utc) - timedelta(seconds=30)
+    assert parse_retry_after({"retry-after": format_datetime(past, usegmt=True)}) == 0.0
+
+
+@pytest.mark.parametrize("headers", [None, {}, {"retry-after": ""}, {"retry-after": "soon"}])
+def test_parse_retry_after_ignores_missing_or_garbage(headers):
+    assert parse_retry_after(headers) is None
+
+
+def test_cancelled_waiter_passes_its_wakeup_on():
+    async def scenario():
+        aimd = AimdLimit(initial=1, minimum=1, maximum=1)
+        await aimd.acquire()
+        first = asyncio.create_task(aimd.acquire())
+        second = asyncio.create_task(aimd.acquire())
+        await asyncio.sleep(0)
+        assert len(aimd._waiters) == 2
+
+        aimd.release()  # wakes `first` ...
+        first.cancel()  # ... which is cancelled before it can take the slot
+        await asyncio.wait_for(second, timeout=1)
+
+        assert first.cancelled()
+        assert aimd.in_flight == 1
+        assert not aimd._waiters
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_queued_waiter_leaves_the_queue():
+    async def scenario():
+        aimd = AimdLimit(initial=1, minimum=1, maximum=1)
+        await aimd.acquire()
+        waiter = asyncio.create_task(aimd.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert not aimd._waiters
+        aimd.release()
+        assert aimd.in_flight == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,260 @@
+"""Server-side long-form book jobs: outline once, then a pipelined chapter scheduler.
+
+Stages per chapter are draft -> expand -> clean -> audit. Drafting stays sequential because
+each chapter continues the previous one, but expand/clean/audit of chapter N run in the
+background while chapter N+1 is being drafted. Every stage transition is checkpointed to
+a JSON file so a crashed or restarted process resumes the job where it stopped.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from .content_quality import audit_chapters, clean_chapter_content
+from .novel_workflow import build_outline_chapter_prompt, build_outline_prompt
+from .story_memory import StoryMemory
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = {"queued", "outlining", "running"}
+OUTLINE_LINE_PATTERN = re.compile(r"(?m)^\s*第\s*[一二三四五六七八九十百千万\d]+\s*章\s*([^：:\n]*)[：:]\s*(.+?)\s*$")
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def parse_outline(text: str, chapter_count: int) -> tuple[str | None, list[dict[str, Any]]]:
+    title_match = re.search(r"《([^》]+)》", text or "")
+    entries = []
+    for m in OUTLINE_LINE_PATTERN.finditer(text or ""):
+        entries.append({"index": len(entries) + 1, "title": m.group(1).strip() or f"第{len(entries) + 1}章", "summary": m.group(2).strip()})
+        if len(entries) >= chapter_count:
+            break
+    return (title_match.group(1) if title_match else None), entries
+
+
+class BookJobStore:
+    """One JSON checkpoint file per job, written atomically (tmp file + rename)."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def _path(self, job_id: str) -> Path:
+        return self.root / f"{job_id}.json"
+
+    async def save(self, job: dict[str, Any]) -> None:
+        job["updated_at"] = _now()
+        # Serialize on the loop so concurrent pipeline stages never mutate the dict mid-dump.
+        payload = json.dumps(job, ensure_ascii=False)
+        lock = self._locks.setdefault(job["job_id"], asyncio.Lock())
+        async with lock:
+            await asyncio.to_thread(self._write, job["job_id"], payload)
+
+    def _write(self, job_id: str, payload: str) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(job_id)
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(payload, encoding="utf-8")
+        os.replace(tmp, path)
+
+    def load(self, job_id: str) -> dict[str, Any] | None:
+        if not re.fullmatch(r"[0-9a-f\-]{36}", job_id or ""):
+            return None
+        path = self._path(job_id)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def list_jobs(self) -> list[dict[str, Any]]:
+        if not self.root.exists():
+            return []
+        jobs = []
+        for path in self.root.glob("*.json"):
+            try:
+                jobs.append(json.loads(path.read_text(encoding="utf-8")))
+            except Exception as exc:
+                logger.warning("Skipping unreadable book checkpoint %s: %s", path, exc)
+        return sorted(jobs, key=lambda x: x.get("created_at", ""), reverse=True)
+
+
+def job_summary(job: dict[str, Any]) -> dict[str, Any]:
+    chapters = job.get("chapters") or []
+    return {
+        "job_id": job["job_id"],
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+        "status": job.get("status"),
+        "title": job.get("title"),
+        "error": job.get("error", ""),
+        "chapter_count": len(chapters),
+        "drafted": sum(1 for c in chapters if c.get("status") != "pending"),
+        "done": sum(1 for c in chapters if c.get("status") == "done"),
+        "quality_summary": (job.get("quality_report") or {}).get("summary"),
+    }
+
+
+@dataclass
+class BookStages:
+    """Callables supplied by the app so LLM calls share its semaphore, timeouts and parsing.
+
+    clean_and_audit and audit_book let the app move CPU-heavy work off the event loop.
+    """
+
+    llm: Callable[[dict, str], Awaitable[str | None]]
+    expand: Callable[[dict, dict, dict], Awaitable[dict]]
+    parse_chapter: Callable[[str, int], dict]
+    clean_and_audit: Callable[[str, str], Awaitable[tuple[str, dict[str, Any]]]] | None = None
+    audit_book: Callable[[list[dict[str, Any]]], Awaitable[dict[str, Any]]] | None = None
+
+
+async def run_book_job(
+    job: dict[str, Any],
+    *,
+    store: BookJobStore,
+    stages: BookStages,
+    post_concurrency: int,
+    memory_budget: int = 6000,
+) -> None:
+    req = job["request"]
+    # Rebuilt from the checkpoint on resume; unchanged chapters are skipped by content hash.
+    memory = StoryMemory(role_cards=req.get("role_cards") or [], foreshadows=req.get("foreshadows") or [])
+    post_tasks: list[asyncio.Task] = []
+    try:
+        if not job.get("outline"):
+            job["status"] = "outlining"
+            await store.save(job)
+            await _outline_stage(job, stages)
+
+        job["status"] = "running"
+        await store.save(job)
+
+        post_budget = asyncio.Semaphore(max(1, post_concurrency))
+        for ch in job["chapters"]:
+            if ch["status"] == "pending":
+                memory.update(job["chapters"][: ch["index"] - 1])
+                await _draft_stage(job, ch, stages, memory.render(memory_budget))
+                await store.save(job)
+            if ch["status"] != "done":
+                post_tasks.append(asyncio.create_task(_post_stages(job, ch, stages, store, post_budget)))
+
+        results = await asyncio.gather(*post_tasks, return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise errors[0]
+
+        book = [{"title": c["title"], "content": c["content"]} for c in job["chapters"]]
+        job["quality_report"] = await stages.audit_book(book) if stages.audit_book else audit_chapters(book)
+        job["status"] = "completed"
+        job["error"] = ""
+        await store.save(job)
+    except asyncio.CancelledError:
+        # Shutdown keeps the job active so it resumes on the next start; explicit cancels stop it.
+        # After a lost lease another worker owns the job, so nothing is saved over its progress.
+        await _cancel_tasks(post_tasks)
+        if job.get("cancel_requested"):
+            job["status"] = "cancelled"
+        if not job.get("lease_lost"):
+            await store.save(job)
+        raise
+    except Exception as exc:
+        logger.exception("Book job failed id=%s: %s", job["job_id"], exc)
+        await _cancel_tasks(post_tasks)
+        job["status"] = "failed"
+        job["error"] = str(exc).strip() or exc.__class__.__name__
+        await store.save(job)
+
+
+async def _cancel_tasks(tasks: list[asyncio.Task]) -> None:
+    """Stop in-flight post stages so none of them saves over the final status, or races
+    a resumed run of the same job."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _outline_stage(job: dict[str, Any], stages: BookStages) -> None:
+    req = job["request"]
+    prompt = build_outline_prompt(
+        user_prompt=req["prompt"],
+        chapter_count=req["chapter_count"],
+        genre=req.get("genre"),
+        workflow_answers=req.get("workflow_answers"),
+        style_prompt=req.get("style_prompt"),
+        custom_prompt=req.get("custom_prompt"),
+        role_cards=req.get("role_cards"),
+        org_cards=req.get("org_cards"),
+        profession_system=req.get("profession_system"),
+        foreshadows=req.get("foreshadows"),
+        style_strength=req.get("style_strength"),
+    )
+    content = await stages.llm(job["model"], prompt)
+    title, outline = parse_outline(content or "", req["chapter_count"])
+    if not outline:
+        raise RuntimeError("大纲解析失败，请切换模型后重试")
+    job["title"] = title or job.get("title") or "未命名小说"
+    job["outline"] = outline
+    job["chapters"] = [
+        {"index": o["index"], "title": f"第{o['index']}章 {o['title']}", "status": "pending", "content": "", "audit": None}
+        for o in outline
+    ]
+
+
+async def _draft_stage(job: dict[str, Any], ch: dict[str, Any], stages: BookStages, previous_context: str) -> None:
+    req = job["request"]
+    idx = ch["index"]
+    entry = job["outline"][idx - 1]
+    outline_text = "\n".join(f"第{o['index']}章 {o['title']}：{o['summary']}" for o in job["outline"])
+    prompt = build_outline_chapter_prompt(
+        novel_title=job.get("title") or "未命名小说",
+        outline_text=outline_text,
+        chapter_index=idx,
+        chapter_title=entry["title"],
+        chapter_summary=entry["summary"],
+        previous_context=previous_context,
+        genre=req.get("genre"),
+        style_prompt=req.get("style_prompt"),
+        style_strength=req.get("style_strength"),
+        chapter_min_words=req.get("chapter_min_words"),
+        chapter_max_words=req.get("chapter_max_words"),
+    )
+    content = await stages.llm(job["model"], prompt)
+    if not content:
+        raise RuntimeError(f"第{idx}章草稿生成失败：上游模型未返回有效内容")
+    parsed = stages.parse_chapter(content, idx)
+    ch["title"] = parsed.get("title") or ch["title"]
+    ch["content"] = parsed.get("content", "")
+    ch["status"] = "drafted"
+
+
+async def _post_stages(
+    job: dict[str, Any],
+    ch: dict[str, Any],
+    stages: BookStages,
+    store: BookJobStore,
+    budget: asyncio.Semaphore,
+) -> None:
+    async with budget:
+        if ch["status"] == "drafted":
+            expanded = await stages.expand(job["model"], {"title": ch["title"], "content": ch["content"]}, job["request"])
+            # Keep the drafted title: it follows the outline, expansion output may not.
+            ch["content"] = expanded.get("content", ch["content"])
+            ch["status"] = "expanded"
+            await store.save(job)
+        if ch["status"] == "expanded":
+            if stages.clean_and_audit is not None:
+                ch["content"], ch["audit"] = await stages.clean_and_audit(ch["title"], ch["content"])
+            else:
+                ch["content"] = clean_chapter_content(ch["content"])
+                ch["audit"] = audit_chapters([{"title": ch["title"], "content": ch["content"]}])["chapters"][0]
+            ch["status"] = "done"
+            await store.save(job)
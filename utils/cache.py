@@ -1,44 +1,319 @@
+"""Two-tier response cache: in-process LRU in front of a single-file SQLite store."""
+
+from __future__ import annotations
+
+import asyncio
 import hashlib
-import json
-import os
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
 
-CACHE_DIR = Path("cache")
-CACHE_DIR.mkdir(exist_ok=True)
 
 def get_cache_key(prompt: str, model_id: str) -> str:
     """Generate a cache key from prompt and model"""
-    content = f"{prompt}:{model_id}"
-    return hashlib.md5(content.encode()).hexdigest()
+    content = f"{model_id}\x00{prompt}"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class MemoryLRU:
+    """Byte-bounded LRU with per-entry expiry. Not thread-safe; used from the event loop only."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items: OrderedDict[str, tuple[str, float, int, str]] = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str, now: float) -> Optional[str]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        content, expires_at, size, _ = item
+        if expires_at and expires_at <= now:
+            self._drop(key)
+            return None
+        self._items.move_to_end(key)
+        return content
+
+    def put(self, key: str, model_id: str, content: str, expires_at: float, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        if key in self._items:
+            self._drop(key)
+        self._items[key] = (content, expires_at, size, model_id)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self._items:
+            oldest = next(iter(self._items))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _, _, size, _ = self._items.pop(key)
+        self.bytes -= size
+
+    def drop_model(self, model_id: str) -> int:
+        keys = [key for key, item in self._items.items() if item[3] == model_id]
+        for key in keys:
+            self._drop(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SqliteStore:
+    """Single-file disk tier. All methods are blocking and serialized by a lock.
+
+    The byte total is kept as a running sum instead of re-summing the table on every
+    put. Other processes may share the file, so it is re-read (and expired rows swept)
+    every `resync_every` writes and whenever the budget looks exceeded.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, resync_every: int = 256):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.resync_every = max(1, resync_every)
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._bytes = 0
+        self._writes = 0
+        self.evictions = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model_id TEXT NOT NULL,
+                    prompt_head TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_expires ON responses(expires_at)")
+            self._conn = conn
+            self._bytes = self._total(conn)
+        return self._conn
+
+    @staticmethod
+    def _total(db: sqlite3.Connection) -> int:
+        return db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str, now: float) -> Optional[tuple[str, float]]:
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT content, expires_at, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            content, expires_at, size = row
+            if expires_at and expires_at <= now:
+                cur = db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                if cur.rowcount:
+                    self._bytes -= size
+                return None
+            db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            return content, expires_at
+
+    def put(self, key: str, model_id: str, prompt_head: str, content: str, size: int, now: float, expires_at: float) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            db = self._db()
+            old = db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model_id, prompt_head, content, size, now, expires_at, now),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            self._writes += 1
+            if self._bytes > self.max_bytes or self._writes % self.resync_every == 0:
+                self._evict(db, now)
 
-def get_cached_response(prompt: str, model_id: str) -> Optional[str]:
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute("DELETE FROM responses WHERE expires_at > 0 AND expires_at <= ?", (now,))
+        total = self._bytes = self._total(db)
+        if total <= self.max_bytes:
+            return
+        # Drop least-recently-used rows until we are back under budget.
+        freed = 0
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            victims.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.evictions += len(victims)
+        self._bytes = total - freed
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            db = self._db()
+            count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        file_bytes = self.path.stat().st_size if self.path.exists() else 0
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes, "file_bytes": file_bytes}
+
+    def list_entries(self, limit: int) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT key, model_id, prompt_head, size, created_at, expires_at, last_access "
+                "FROM responses ORDER BY last_access DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        keys = ["key", "model_id", "prompt_head", "size", "created_at", "expires_at", "last_access"]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def purge(self, *, expired_only: bool, model_id: str | None, now: float) -> int:
+        with self._lock:
+            db = self._db()
+            if expired_only:
+                cur = db.execute("DELETE FROM responses WHERE expires_at > 0 AND expires_at <= ?", (now,))
+            elif model_id:
+                cur = db.execute("DELETE FROM responses WHERE model_id = ?", (model_id,))
+            else:
+                cur = db.execute("DELETE FROM responses")
+            removed = cur.rowcount
+            self._bytes = self._total(db)
+            if not expired_only and not model_id:
+                db.execute("VACUUM")
+            return removed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        *,
+        enabled: bool,
+        db_path: Path,
+        ttl_sec: int,
+        memory_max_bytes: int,
+        disk_max_bytes: int,
+    ):
+        self.enabled = enabled
+        self.ttl_sec = ttl_sec
+        self.memory = MemoryLRU(memory_max_bytes)
+        self.disk = SqliteStore(db_path, disk_max_bytes)
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "errors": 0}
+
+    def _expires_at(self, now: float) -> float:
+        return now + self.ttl_sec if self.ttl_sec > 0 else 0.0
+
+    async def get(self, prompt: str, model_id: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = get_cache_key(prompt, model_id)
+        now = time.time()
+        content = self.memory.get(key, now)
+        if content is not None:
+            self.counters["memory_hits"] += 1
+            return content
+        try:
+            row = await asyncio.to_thread(self.disk.get, key, now)
+        except Exception as exc:
+            self.counters["errors"] += 1
+            logger.warning("Cache read failed: %s", exc)
+            return None
+        if row is None:
+            self.counters["misses"] += 1
+            return None
+        content, expires_at = row
+        self.counters["disk_hits"] += 1
+        self.memory.put(key, model_id, content, expires_at, len(content.encode("utf-8")))
+        return content
+
+    async def put(self, prompt: str, model_id: str, content: str) -> None:
+        if not self.enabled or not content:
+            return
+        key = get_cache_key(prompt, model_id)
+        now = time.time()
+        expires_at = self._expires_at(now)
+        size = len(content.encode("utf-8"))
+        self.memory.put(key, model_id, content, expires_at, size)
+        try:
+            await asyncio.to_thread(self.disk.put, key, model_id, prompt[:100], content, size, now, expires_at)
+            self.counters["writes"] += 1
+        except Exception as exc:
+            self.counters["errors"] += 1
+            logger.warning("Cache write failed: %s", exc)
+
+    async def stats(self) -> dict[str, Any]:
+        lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        disk = await asyncio.to_thread(self.disk.stats) if self.enabled else {}
+        return {
+            "enabled": self.enabled,
+            "ttl_sec": self.ttl_sec,
+            **self.counters,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory": {
+                "entries": len(self.memory),
+                "bytes": self.memory.bytes,
+                "max_bytes": self.memory.max_bytes,
+                "evictions": self.memory.evictions,
+            },
+            "disk": {**disk, "evictions": self.disk.evictions, "path": str(self.disk.path)},
+        }
+
+    async def list_entries(self, limit: int = 50) -> list[dict[str, Any]]:
+        if not self.enabled:
+            return []
+        return await asyncio.to_thread(self.disk.list_entries, limit)
+
+    async def purge(self, *, expired_only: bool = False, model_id: str | None = None) -> int:
+        if model_id and not expired_only:
+            self.memory.drop_model(model_id)
+        elif not expired_only:
+            self.memory.clear()
+        if not self.enabled:
+            return 0
+        return await asyncio.to_thread(self.disk.purge, expired_only=expired_only, model_id=model_id, now=time.time())
+
+    def close(self) -> None:
+        self.disk.close()
+
+
+response_cache = ResponseCache(
+    enabled=config.CACHE_ENABLED,
+    db_path=config.CACHE_DIR / "responses.sqlite3",
+    ttl_sec=config.CACHE_TTL_SEC,
+    memory_max_bytes=config.CACHE_MEMORY_MAX_BYTES,
+    disk_max_bytes=config.CACHE_DISK_MAX_BYTES,
+)
+
+
+async def get_cached_response(prompt: str, model_id: str) -> Optional[str]:
     """Get cached response if it exists"""
-    try:
-        cache_key = get_cache_key(prompt, model_id)
-        cache_file = CACHE_DIR / f"{cache_key}.json"
-        
-        if cache_file.exists():
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('content')
-    except Exception:
-        pass
-    return None
-
-def cache_response(prompt: str, model_id: str, content: str) -> None:
+    return await response_cache.get(prompt, model_id)
+
+
+async def cache_response(prompt: str, model_id: str, content: str) -> None:
     """Cache the response"""
-    try:
-        cache_key = get_cache_key(prompt, model_id)
-        cache_file = CACHE_DIR / f"{cache_key}.json"
-        
-        data = {
-            'prompt': prompt[:100],  # Store first 100 chars for reference
-            'model_id': model_id,
-            'content': content
-        }
-        
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception:
-        pass  # Fail silently if caching fails
\ No newline at end of file
+    await response_cache.put(prompt, model_id, content)
@@ -0,0 +1,119 @@
+"""Per-model circuit breakers for upstream LLM calls.
+
+closed -> open after `failure_threshold` consecutive failures (or one failed health
+probe); open -> half_open once `open_sec` has passed, letting a single trial call
+through; the trial's outcome closes the breaker or re-opens it with a doubled cool-down
+(capped at `max_open_sec`).
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, open_sec: float, max_open_sec: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_open_sec = open_sec
+        self.max_open_sec = max(open_sec, max_open_sec)
+        self.open_sec = open_sec
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.trial_started = 0.0
+        self.last_error = ""
+        self.counters = {"successes": 0, "failures": 0, "rejected": 0, "trips": 0}
+
+    def allow(self, now: float) -> bool:
+        if self.state == OPEN and now - self.opened_at >= self.open_sec:
+            self.state = HALF_OPEN
+            self.trial_in_flight = False
+        if self.state == CLOSED:
+            return True
+        # A trial that never reported back (e.g. its caller was cancelled) expires.
+        if self.state == HALF_OPEN and (not self.trial_in_flight or now - self.trial_started >= self.open_sec):
+            self.trial_in_flight = True
+            self.trial_started = now
+            return True
+        self.counters["rejected"] += 1
+        return False
+
+    def record_success(self) -> None:
+        self.counters["successes"] += 1
+        self.state = CLOSED
+        self.failures = 0
+        self.open_sec = self.base_open_sec
+        self.trial_in_flight = False
+
+    def record_failure(self, now: float, error: str = "", trip: bool = False) -> None:
+        self.counters["failures"] += 1
+        self.failures += 1
+        self.last_error = error[:200]
+        if self.state == HALF_OPEN:
+            self.open_sec = min(self.max_open_sec, self.open_sec * 2)
+            self._open(now)
+        elif self.state == CLOSED and (trip or self.failures >= self.failure_threshold):
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.trial_in_flight = False
+        self.counters["trips"] += 1
+
+    def snapshot(self, now: float) -> dict[str, Any]:
+        retry_in = max(0.0, self.open_sec - (now - self.opened_at)) if self.state == OPEN else 0.0
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_sec": round(retry_in, 1),
+            "last_error": self.last_error,
+            **self.counters,
+        }
+
+
+class BreakerRegistry:
+    def __init__(self, *, failure_threshold: int, open_sec: float, max_open_sec: float):
+        self.failure_threshold = failure_threshold
+        self.open_sec = open_sec
+        self.max_open_sec = max_open_sec
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def get(self, key: str) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.open_sec, self.max_open_sec)
+            self._breakers[key] = breaker
+        return breaker
+
+    def allow(self, key: str) -> bool:
+        return self.get(key).allow(time.monotonic())
+
+    def is_open(self, key: str) -> bool:
+        """Read-only check (does not consume the half-open trial)."""
+        breaker = self._breakers.get(key)
+        if breaker is None or breaker.state == CLOSED:
+            return False
+        if breaker.state == OPEN:
+            return time.monotonic() - breaker.opened_at < breaker.open_sec
+        return breaker.trial_in_flight
+
+    def record_success(self, key: str) -> None:
+        self.get(key).record_success()
+
+    def record_failure(self, key: str, error: str = "", trip: bool = False) -> None:
+        self.get(key).record_failure(time.monotonic(), error, trip)
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        return {key: b.snapshot(now) for key, b in self._breakers.items()}
@@ -1,6 +1,10 @@
 ﻿from __future__ import annotations
 
+import hashlib
+import os
 import re
+import threading
+from collections import OrderedDict, deque
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
@@ -19,6 +23,17 @@ SENSITIVE_SUGGESTIONS = {
     "洗钱": "非法资金流转",
     "非法集资": "违规募资",
 }
+NOVEL_TITLE_PATTERN = re.compile(r"《([^》]+)》")
+CHAPTER_HEADING_PATTERN = re.compile(r"(?m)^(第\s*[一二三四五六七八九十百千万\d]+\s*[章节卷]\s*[^\n]*)")
+CONNECTIVE_WORDS = ("然后", "接着", "随后", "之后")
+MAX_HIT_POSITIONS = 50
+PROFILE_CACHE_SIZE = 512
+
+# One tokenizer pass yields everything the text metrics need: CJK runs (net words and
+# coherence tokens), alphanumeric runs, sentence ends and paragraph breaks.
+_TOKEN_PATTERN = re.compile(
+    r'(?P<cjk>[\u4e00-\u9fff]+)|(?P<alnum>[A-Za-z0-9]+)|(?P<end>[。！？!?])|(?P<para>\n\s*\n)'
+)
 
 
 @dataclass
@@ -31,19 +46,156 @@ class ChapterAudit:
     coherence_score: int
     hook_ok: bool
     hook_reason: str
+    sensitive_positions: list[dict]
 
 
-def load_sensitive_words() -> list[str]:
-    if not SENSITIVE_PATH.exists():
+def load_sensitive_words(path: Path = SENSITIVE_PATH) -> list[str]:
+    if not path.exists():
         return []
     words = []
-    for line in SENSITIVE_PATH.read_text(encoding='utf-8').splitlines():
+    seen = set()
+    # utf-8-sig: the lexicon is often edited on Windows and saved with a BOM.
+    for line in path.read_text(encoding='utf-8-sig').splitlines():
         x = line.strip()
-        if x and not x.startswith('#'):
+        if x and not x.startswith('#') and x not in seen:
+            seen.add(x)
             words.append(x)
     return words
 
 
+def content_hash(text: str) -> str:
+    return hashlib.sha1((text or '').encode('utf-8')).hexdigest()
+
+
+class KeywordAutomaton:
+    """Aho–Corasick automaton: finds every occurrence of every pattern in one scan.
+
+    Scan cost is linear in the text length regardless of lexicon size, unlike testing
+    each word with `in`, which is O(words x text).
+    """
+
+    _LEAF: dict[str, int] = {}
+
+    def __init__(self, patterns: list[str]):
+        self.patterns = list(patterns)
+        goto: list[dict[str, int]] = [{}]
+        terminal: list[int] = [-1]
+        for pid, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    terminal.append(-1)
+                state = nxt
+            terminal[state] = pid
+
+        fail = [0] * len(goto)
+        out: list[tuple[int, ...]] = [()] * len(goto)
+        queue = deque()
+        for child in goto[0].values():
+            queue.append(child)
+        while queue:
+            state = queue.popleft()
+            own = (terminal[state],) if terminal[state] >= 0 else ()
+            out[state] = own + out[fail[state]]
+            for ch, child in goto[state].items():
+                if state:
+                    f = fail[state]
+                    while f and ch not in goto[f]:
+                        f = fail[f]
+                    fail[child] = goto[f].get(ch, 0)
+                queue.append(child)
+        # Leaves share one empty dict; a 100k-word lexicon has ~100k of them.
+        self._goto = [g if g else self._LEAF for g in goto]
+        self._fail = fail
+        self._out = out
+        self._lengths = [len(p) for p in self.patterns]
+        self.state_count = len(goto)
+
+    def find_all(self, text: str) -> dict[int, list[int]]:
+        """Return {pattern_id: [start offsets]} for every match in text."""
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self._lengths
+        hits: dict[int, list[int]] = {}
+        state = 0
+        for i, ch in enumerate(text):
+            nxt = goto[state].get(ch)
+            while nxt is None and state:
+                state = fail[state]
+                nxt = goto[state].get(ch)
+            if nxt is None:
+                state = 0
+                continue
+            state = nxt
+            for pid in out[state]:
+                start = i - lengths[pid] + 1
+                bucket = hits.get(pid)
+                if bucket is None:
+                    hits[pid] = [start]
+                else:
+                    bucket.append(start)
+        return hits
+
+
+class SensitiveLexicon:
+    """Compiled sensitive-word lexicon that rebuilds itself when the file changes.
+
+    The automaton also carries the readability connective words so one scan serves
+    both checks. The file is re-stat'ed on every access, which costs microseconds.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature: tuple[int, int] | None = None
+        self.words: list[str] = []
+        self.automaton = KeywordAutomaton(list(CONNECTIVE_WORDS))
+        self._word_ids: set[int] = set()
+        self._connective_ids: set[int] = set(range(len(CONNECTIVE_WORDS)))
+        self.reloads = 0
+
+    def _stat(self) -> tuple[int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def current(self) -> SensitiveLexicon:
+        signature = self._stat()
+        if signature != self._signature:
+            with self._lock:
+                if signature != self._signature:
+                    self._rebuild(signature)
+        return self
+
+    def _rebuild(self, signature: tuple[int, int] | None) -> None:
+        words = load_sensitive_words(self.path) if signature else []
+        patterns = list(words)
+        index = {w: i for i, w in enumerate(patterns)}
+        connective_ids = set()
+        for w in CONNECTIVE_WORDS:
+            if w not in index:
+                index[w] = len(patterns)
+                patterns.append(w)
+            connective_ids.add(index[w])
+        self.automaton = KeywordAutomaton(patterns)
+        self.words = words
+        self._word_ids = set(range(len(words)))
+        self._connective_ids = connective_ids
+        self._signature = signature
+        self.reloads += 1
+
+    def scan(self, text: str) -> tuple[list[tuple[str, list[int]]], bool]:
+        """Return ([(word, start offsets)] in lexicon order, has_connective)."""
+        found = self.automaton.find_all(text)
+        hits = [(self.automaton.patterns[pid], found[pid]) for pid in sorted(found) if pid in self._word_ids]
+        has_connective = any(pid in self._connective_ids for pid in found)
+        return hits, has_connective
+
+
 def count_net_words(text: str) -> int:
     # Keep Chinese chars, letters, digits; drop whitespace/punct/symbols.
     filtered = re.findall(r'[\u4e00-\u9fffA-Za-z0-9]', text or '')
@@ -66,14 +218,19 @@ def readability_score(text: str) -> int:
     sentences = [s.strip() for s in sentences if s.strip()]
     avg_len = sum(len(s) for s in sentences) / max(1, len(sentences))
     paras = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+    has_connective = re.search(r'(然后|接着|随后|之后)\1{0,}', text) is not None
+    return _readability_from(avg_len, len(paras), has_connective)
+
+
+def _readability_from(avg_sentence_len: float, para_count: int, has_connective: bool) -> int:
     score = 80
-    if avg_len > 70:
+    if avg_sentence_len > 70:
         score -= 20
-    elif avg_len > 50:
+    elif avg_sentence_len > 50:
         score -= 10
-    if len(paras) < 3:
+    if para_count < 3:
         score -= 10
-    if re.search(r'(然后|接着|随后|之后)\1{0,}', text):
+    if has_connective:
         score -= 5
     return max(0, min(100, int(score)))
 
@@ -86,7 +243,10 @@ def coherence_score(current: str, prev: str | None) -> int:
     # weak heuristic based on recurring entities and overlap
     cur_tokens = set(re.findall(r'[\u4e00-\u9fff]{2,}', current))
     prev_tokens = set(re.findall(r'[\u4e00-\u9fff]{2,}', prev))
-    overlap = len(cur_tokens & prev_tokens)
+    return _coherence_from(len(cur_tokens & prev_tokens))
+
+
+def _coherence_from(overlap: int) -> int:
     if overlap >= 20:
         return 90
     if overlap >= 10:
@@ -129,6 +289,32 @@ def clean_chapter_content(text: str) -> str:
     return s
 
 
+def extract_title_and_chapters(content: str) -> tuple[str, list[dict]]:
+    title_match = NOVEL_TITLE_PATTERN.search(content)
+    title = title_match.group(1) if title_match else "未命名小说"
+
+    matches = list(CHAPTER_HEADING_PATTERN.finditer(content))
+
+    chapters = []
+    if matches:
+        for idx, m in enumerate(matches):
+            start = m.end()
+            end = matches[idx + 1].start() if idx + 1 < len(matches) else len(content)
+            body = content[start:end].strip()
+            if body:
+                chapters.append({"title": m.group(1).strip(), "content": body})
+
+    if not chapters:
+        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", content.strip()) if p.strip()]
+        if len(paragraphs) >= 2:
+            for i, p in enumerate(paragraphs[:10], 1):
+                chapters.append({"title": f"第{i}章", "content": p})
+        elif content.strip():
+            chapters.append({"title": "第1章", "content": content.strip()})
+
+    return title, chapters
+
+
 def ensure_unique_titles(chapters: list[dict[str, Any]]) -> list[dict[str, Any]]:
     seen: dict[str, int] = {}
     out = []
@@ -142,41 +328,265 @@ def ensure_unique_titles(chapters: list[dict[str, Any]]) -> list[dict[str, Any]]
     return out
 
 
-def audit_chapters(chapters: list[dict[str, Any]]) -> dict[str, Any]:
-    words = load_sensitive_words()
-    audits: list[dict[str, Any]] = []
-    total_sensitive = 0
-    prev = None
-    for ch in chapters:
-        content = ch.get('content', '') or ''
-        hits = detect_sensitive(content, words)
-        sugg = [{"word": w, "replace_with": SENSITIVE_SUGGESTIONS.get(w, "合规替代表述")} for w in hits]
-        total_sensitive += len(hits)
-        hook_ok, hook_reason = check_hook(content)
-        row = ChapterAudit(
-            title=ch.get('title', ''),
-            word_count_net=count_net_words(content),
-            sensitive_hits=hits,
-            sensitive_suggestions=sugg,
-            readability_score=readability_score(content),
-            coherence_score=coherence_score(content, prev),
+@dataclass
+class ChapterProfile:
+    """Metrics that depend only on one chapter's text; coherence is derived from neighbours."""
+
+    word_count_net: int
+    readability_score: int
+    hook_ok: bool
+    hook_reason: str
+    sensitive_positions: list[dict]
+    tokens: frozenset
+    empty: bool
+    has_content: bool
+
+
+class QualityAuditor:
+    """Compiled auditor: one tokenizer pass plus one automaton scan per chapter.
+
+    The tokenizer pass replaces the separate regex scans of count_net_words,
+    readability_score and coherence_score; the automaton scan finds every sensitive
+    word (with offsets) and the readability connectives together.
+    """
+
+    def __init__(self, lexicon: SensitiveLexicon, cache_size: int = PROFILE_CACHE_SIZE):
+        self.lexicon = lexicon
+        self.cache_size = cache_size
+        self._profiles: OrderedDict[tuple[int, str], ChapterProfile] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.counters = {"profile_hits": 0, "profile_misses": 0}
+
+    def cached_profile(self, text: str, lexicon: SensitiveLexicon | None = None) -> ChapterProfile:
+        """profile() memoized by content hash; a lexicon reload invalidates every entry."""
+        lexicon = lexicon or self.lexicon.current()
+        key = (lexicon.reloads, content_hash(text))
+        with self._cache_lock:
+            profile = self._profiles.get(key)
+            if profile is not None:
+                self._profiles.move_to_end(key)
+                self.counters["profile_hits"] += 1
+                return profile
+        profile = self.profile(text, lexicon)
+        with self._cache_lock:
+            self.counters["profile_misses"] += 1
+            self._profiles[key] = profile
+            while len(self._profiles) > self.cache_size:
+                self._profiles.popitem(last=False)
+        return profile
+
+    def profile(self, text: str, lexicon: SensitiveLexicon | None = None) -> ChapterProfile:
+        lexicon = lexicon or self.lexicon.current()
+        text = text or ''
+        net = 0
+        tokens = set()
+        sentence_lens: list[int] = []
+        sentence_start = 0
+        paras = 0
+        para_start = 0
+        for m in _TOKEN_PATTERN.finditer(text):
+            kind = m.lastgroup
+            if kind == 'cjk':
+                run = m.group()
+                net += len(run)
+                if len(run) >= 2:
+                    tokens.add(run)
+            elif kind == 'alnum':
+                net += m.end() - m.start()
+            elif kind == 'end':
+                n = len(text[sentence_start:m.start()].strip())
+                if n:
+                    sentence_lens.append(n)
+                sentence_start = m.end()
+            else:
+                if text[para_start:m.start()].strip():
+                    paras += 1
+                para_start = m.end()
+        n = len(text[sentence_start:].strip())
+        if n:
+            sentence_lens.append(n)
+        if text[para_start:].strip():
+            paras += 1
+
+        hits, has_connective = lexicon.scan(text)
+        empty = not text.strip()
+        readability = 0 if empty else _readability_from(
+            sum(sentence_lens) / max(1, len(sentence_lens)), paras, has_connective
+        )
+        hook_ok, hook_reason = check_hook(text)
+        return ChapterProfile(
+            word_count_net=net,
+            readability_score=readability,
             hook_ok=hook_ok,
             hook_reason=hook_reason,
+            sensitive_positions=[
+                {"word": w, "count": len(pos), "positions": pos[:MAX_HIT_POSITIONS]} for w, pos in hits
+            ],
+            tokens=frozenset(tokens),
+            empty=empty,
+            has_content=bool(text),
         )
-        audits.append(row.__dict__)
-        prev = content
-
-    avg_read = int(sum(x['readability_score'] for x in audits) / max(1, len(audits)))
-    avg_coh = int(sum(x['coherence_score'] for x in audits) / max(1, len(audits)))
-    hook_rate = round(sum(1 for x in audits if x['hook_ok']) / max(1, len(audits)), 2)
-    return {
-        'summary': {
-            'chapter_count': len(audits),
-            'avg_readability': avg_read,
-            'avg_coherence': avg_coh,
-            'hook_rate': hook_rate,
-            'sensitive_hit_count': total_sensitive,
-            'sensitive_word_count': len(words),
-        },
-        'chapters': audits,
-    }
+
+    @staticmethod
+    def row(title: str, profile: ChapterProfile, prev: ChapterProfile | None) -> dict[str, Any]:
+        if profile.empty:
+            coherence = 0
+        elif prev is None or not prev.has_content:
+            coherence = 85
+        else:
+            coherence = _coherence_from(len(profile.tokens & prev.tokens))
+        hits = [x["word"] for x in profile.sensitive_positions]
+        return ChapterAudit(
+            title=title,
+            word_count_net=profile.word_count_net,
+            sensitive_hits=hits,
+            sensitive_suggestions=[{"word": w, "replace_with": SENSITIVE_SUGGESTIONS.get(w, "合规替代表述")} for w in hits],
+            readability_score=profile.readability_score,
+            coherence_score=coherence,
+            hook_ok=profile.hook_ok,
+            hook_reason=profile.hook_reason,
+            sensitive_positions=profile.sensitive_positions,
+        ).__dict__
+
+    def audit(self, chapters: list[dict[str, Any]]) -> dict[str, Any]:
+        lexicon = self.lexicon.current()
+        audits: list[dict[str, Any]] = []
+        prev = None
+        for ch in chapters:
+            profile = self.cached_profile(ch.get('content', '') or '', lexicon)
+            audits.append(self.row(ch.get('title', ''), profile, prev))
+            prev = profile
+        return summarize_audits(audits, len(lexicon.words))
+
+
+class AuditTotals:
+    """Running book summary; rows can be added and removed in O(1)."""
+
+    def __init__(self):
+        self.count = 0
+        self.readability = 0
+        self.coherence = 0
+        self.hooks = 0
+        self.sensitive = 0
+
+    def add(self, row: dict[str, Any], sign: int = 1) -> None:
+        self.count += sign
+        self.readability += sign * row['readability_score']
+        self.coherence += sign * row['coherence_score']
+        self.hooks += sign * (1 if row['hook_ok'] else 0)
+        self.sensitive += sign * len(row['sensitive_hits'])
+
+    def remove(self, row: dict[str, Any]) -> None:
+        self.add(row, -1)
+
+    def summary(self, sensitive_word_count: int | None = None) -> dict[str, Any]:
+        n = max(1, self.count)
+        if sensitive_word_count is None:
+            sensitive_word_count = len(sensitive_lexicon.current().words)
+        return {
+            'chapter_count': self.count,
+            'avg_readability': int(self.readability / n),
+            'avg_coherence': int(self.coherence / n),
+            'hook_rate': round(self.hooks / n, 2),
+            'sensitive_hit_count': self.sensitive,
+            'sensitive_word_count': sensitive_word_count,
+        }
+
+
+def summarize_audits(audits: list[dict[str, Any]], sensitive_word_count: int) -> dict[str, Any]:
+    totals = AuditTotals()
+    for row in audits:
+        totals.add(row)
+    return {'summary': totals.summary(sensitive_word_count), 'chapters': audits}
+
+
+class IncrementalAudit:
+    """Book-level audit that only recomputes what changed since the last update.
+
+    Chapters are compared by (title, content hash). A changed chapter is re-profiled
+    (usually a profile-cache hit) and, because coherence_score depends on the previous
+    chapter, its successor's coherence is recomputed too. Everything else, including
+    the summary totals, is reused.
+    """
+
+    def __init__(self, auditor: QualityAuditor):
+        self.auditor = auditor
+        self._keys: list[tuple[str, str]] = []
+        self._profiles: list[ChapterProfile] = []
+        self._rows: list[dict[str, Any]] = []
+        self._totals = AuditTotals()
+        self._lexicon_version = -1
+        self.last_recomputed = 0
+        self.lock = threading.Lock()
+
+    def update(self, chapters: list[dict[str, Any]]) -> dict[str, Any]:
+        lexicon = self.auditor.lexicon.current()
+        if lexicon.reloads != self._lexicon_version:
+            self._keys, self._profiles, self._rows = [], [], []
+            self._totals = AuditTotals()
+            self._lexicon_version = lexicon.reloads
+
+        contents = [ch.get('content', '') or '' for ch in chapters]
+        keys = [(ch.get('title', '') or '', content_hash(c)) for ch, c in zip(chapters, contents)]
+        old_len = len(self._keys)
+        for row in self._rows[len(keys):]:
+            self._totals.remove(row)
+        del self._keys[len(keys):], self._profiles[len(keys):], self._rows[len(keys):]
+
+        recomputed = 0
+        content_changed_prev = False
+        for i, key in enumerate(keys):
+            is_new = i >= old_len
+            content_changed = is_new or self._keys[i][1] != key[1]
+            if not (is_new or content_changed or content_changed_prev or self._keys[i][0] != key[0]):
+                content_changed_prev = False
+                continue
+            profile = self.auditor.cached_profile(contents[i], lexicon) if content_changed else self._profiles[i]
+            row = self.auditor.row(key[0], profile, self._profiles[i - 1] if i else None)
+            if is_new:
+                self._keys.append(key)
+                self._profiles.append(profile)
+                self._rows.append(row)
+            else:
+                self._totals.remove(self._rows[i])
+                self._keys[i], self._profiles[i], self._rows[i] = key, profile, row
+            self._totals.add(row)
+            recomputed += 1
+            content_changed_prev = content_changed
+        self.last_recomputed = recomputed
+        return {'summary': self._totals.summary(len(lexicon.words)), 'chapters': list(self._rows)}
+
+
+class BookAuditRegistry:
+    """LRU of IncrementalAudit states, one per book key.
+
+    Keys only affect reuse, never correctness: every update diffs all chapter hashes,
+    so two books sharing a key simply recompute more. Safe to call from worker threads;
+    updates to the same book are serialized.
+    """
+
+    def __init__(self, auditor: QualityAuditor, max_books: int):
+        self.auditor = auditor
+        self.max_books = max_books
+        self._books: OrderedDict[str, IncrementalAudit] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def audit(self, key: str, chapters: list[dict[str, Any]]) -> dict[str, Any]:
+        with self._lock:
+            state = self._books.get(key)
+            if state is None:
+                state = IncrementalAudit(self.auditor)
+                self._books[key] = state
+            self._books.move_to_end(key)
+            while len(self._books) > max(1, self.max_books):
+                self._books.popitem(last=False)
+        with state.lock:
+            return state.update(chapters)
+
+
+sensitive_lexicon = SensitiveLexicon(SENSITIVE_PATH)
+default_auditor = QualityAuditor(sensitive_lexicon)
+
+
+def audit_chapters(chapters: list[dict[str, Any]]) -> dict[str, Any]:
+    return default_auditor.audit(chapters)
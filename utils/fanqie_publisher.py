@@ -1,12 +1,18 @@
 ﻿from __future__ import annotations
 
 import asyncio
+import logging
+import re
+import time
+import uuid
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
 
 from playwright.async_api import async_playwright
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class FanqiePublishResult:
@@ -14,6 +20,8 @@ class FanqiePublishResult:
     detail: str
     url: str = ""
     screenshot: str = ""
+    fill_mode: str = ""
+    fill_ms: int = 0
 
 
 @dataclass
@@ -37,6 +45,66 @@ def _pick_selector(selectors: dict[str, Any] | None, key: str, fallback: list[st
     return fallback
 
 
+FILL_MODES = ("auto", "type")
+
+
+def _net_len(text: str) -> int:
+    return len(re.sub(r"\s+", "", text or ""))
+
+
+def _fill_verified(actual: str, expected: str) -> bool:
+    # Editors re-wrap paragraphs, so compare non-whitespace length with a small tolerance.
+    want = _net_len(expected)
+    return abs(_net_len(actual) - want) <= max(2, int(want * 0.01))
+
+
+# Raw string: the JS regex literal /\n/ must reach the browser unexpanded.
+_DOM_INSERT_JS = r"""
+(el, text) => {
+  el.focus();
+  const paras = text.split(/\n/);
+  el.innerHTML = '';
+  for (const line of paras) {
+    const p = document.createElement('p');
+    if (line) p.textContent = line; else p.appendChild(document.createElement('br'));
+    el.appendChild(p);
+  }
+  el.dispatchEvent(new InputEvent('input', { bubbles: true, inputType: 'insertFromPaste', data: text }));
+  el.dispatchEvent(new Event('change', { bubbles: true }));
+  return el.innerText;
+}
+"""
+
+
+async def _fill_contenteditable(page, locator, content: str, mode: str) -> str:
+    """Fill a rich-text editor and return the insertion mode that passed verification.
+
+    Order: a single CDP insertText call, then DOM injection with synthetic input events,
+    then per-keystroke typing as the slow last resort (or directly when mode == "type").
+    """
+    if mode != "type":
+        await locator.click()
+        await page.keyboard.press("Control+A")
+        await page.keyboard.press("Delete")
+        await page.keyboard.insert_text(content)
+        if _fill_verified(await locator.inner_text(), content):
+            return "insert_text"
+
+        try:
+            actual = await locator.evaluate(_DOM_INSERT_JS, content)
+        except Exception as exc:
+            logger.warning("DOM content injection failed: %s", exc)
+            actual = ""
+        if _fill_verified(actual, content):
+            return "dom_inject"
+        logger.warning("Bulk content insertion failed verification; falling back to typing")
+
+    await locator.click()
+    await page.keyboard.press("Control+A")
+    await page.keyboard.type(content)
+    return "type"
+
+
 async def _first_visible(page, candidates: list[str]):
     for sel in candidates:
         locator = page.locator(sel).first
@@ -48,6 +116,93 @@ async def _first_visible(page, candidates: list[str]):
     return None, ""
 
 
+class CdpBrowserPool:
+    """Long-lived Playwright driver with one cached CDP connection and a page pool per cdp_url.
+
+    Connections are health-checked on every acquire and re-established when the browser
+    has gone away. Idle pages are kept (up to max_idle_pages per endpoint) and reused by
+    later jobs, which navigate them to the target URL anyway.
+    """
+
+    def __init__(self, *, max_idle_pages: int = 2):
+        self.max_idle_pages = max_idle_pages
+        self._playwright = None
+        self._browsers: dict[str, Any] = {}
+        self._idle_pages: dict[str, list[Any]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._start_lock = asyncio.Lock()
+        self.counters = {"connects": 0, "reconnects": 0, "pages_created": 0, "pages_reused": 0}
+
+    async def _driver(self):
+        async with self._start_lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+        return self._playwright
+
+    async def _browser(self, cdp_url: str, timeout_ms: int):
+        lock = self._locks.setdefault(cdp_url, asyncio.Lock())
+        async with lock:
+            browser = self._browsers.get(cdp_url)
+            if browser is not None and browser.is_connected():
+                return browser
+            if browser is not None:
+                logger.warning("CDP connection lost, reconnecting: %s", cdp_url)
+                self.counters["reconnects"] += 1
+                self._idle_pages.pop(cdp_url, None)
+            driver = await self._driver()
+            browser = await driver.chromium.connect_over_cdp(cdp_url, timeout=timeout_ms)
+            self._browsers[cdp_url] = browser
+            self.counters["connects"] += 1
+            return browser
+
+    async def acquire_page(self, cdp_url: str, timeout_ms: int):
+        browser = await self._browser(cdp_url, timeout_ms)
+        idle = self._idle_pages.setdefault(cdp_url, [])
+        while idle:
+            page = idle.pop()
+            if not page.is_closed():
+                self.counters["pages_reused"] += 1
+                return page
+        context = browser.contexts[0] if browser.contexts else await browser.new_context()
+        self.counters["pages_created"] += 1
+        return await context.new_page()
+
+    async def release_page(self, cdp_url: str, page, *, healthy: bool = True) -> None:
+        browser = self._browsers.get(cdp_url)
+        idle = self._idle_pages.setdefault(cdp_url, [])
+        if healthy and browser is not None and browser.is_connected() and not page.is_closed() and len(idle) < self.max_idle_pages:
+            idle.append(page)
+            return
+        try:
+            if not page.is_closed():
+                await page.close()
+        except Exception:
+            pass
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self.counters,
+            "endpoints": {
+                url: {"connected": b.is_connected(), "idle_pages": len(self._idle_pages.get(url, []))}
+                for url, b in self._browsers.items()
+            },
+        }
+
+    async def close(self) -> None:
+        for pages in self._idle_pages.values():
+            for page in pages:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+        self._idle_pages.clear()
+        # The CDP browser belongs to the user; stopping the driver only drops our connections.
+        self._browsers.clear()
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
 async def publish_chapter_via_cdp(
     *,
     cdp_url: str,
@@ -58,7 +213,11 @@ async def publish_chapter_via_cdp(
     dry_run: bool = False,
     auto_publish: bool = True,
     timeout_ms: int = 45000,
+    pool: CdpBrowserPool | None = None,
+    fill_mode: str = "auto",
 ) -> FanqiePublishResult:
+    if fill_mode not in FILL_MODES:
+        return FanqiePublishResult(success=False, detail=f"fill_mode must be one of {', '.join(FILL_MODES)}, got {fill_mode!r}")
     title_selectors = _pick_selector(
         selectors,
         "title",
@@ -88,56 +247,101 @@ async def publish_chapter_via_cdp(
         ],
     )
 
-    screenshot_file = Path("logs") / f"fanqie_publish_{int(asyncio.get_event_loop().time())}.png"
+    # Unique per job: pooled workers may publish several chapters within the same second.
+    screenshot_file = Path("logs") / f"fanqie_publish_{int(asyncio.get_event_loop().time())}_{uuid.uuid4().hex[:8]}.png"
+
+    kwargs = dict(
+        chapter_title=chapter_title,
+        chapter_content=chapter_content,
+        create_url=create_url,
+        title_selectors=title_selectors,
+        content_selectors=content_selectors,
+        publish_selectors=publish_selectors,
+        screenshot_file=screenshot_file,
+        dry_run=dry_run,
+        auto_publish=auto_publish,
+        timeout_ms=timeout_ms,
+        fill_mode=fill_mode,
+    )
+    if pool is not None:
+        page = await pool.acquire_page(cdp_url, timeout_ms)
+        healthy = False
+        try:
+            result = await _fill_and_publish(page, **kwargs)
+            healthy = True
+            return result
+        finally:
+            await pool.release_page(cdp_url, page, healthy=healthy)
 
     async with async_playwright() as p:
         browser = await p.chromium.connect_over_cdp(cdp_url, timeout=timeout_ms)
         context = browser.contexts[0] if browser.contexts else await browser.new_context()
         page = await context.new_page()
         try:
-            await page.goto(create_url, wait_until="domcontentloaded", timeout=timeout_ms)
-
-            if dry_run:
-                await page.screenshot(path=str(screenshot_file), full_page=True)
-                return FanqiePublishResult(True, "dry_run_ok", page.url, str(screenshot_file))
-
-            title_locator, title_sel = await _first_visible(page, title_selectors)
-            if not title_locator:
-                return FanqiePublishResult(False, f"title_not_found: {title_selectors}", page.url)
-            tag = await title_locator.evaluate("el => el.tagName.toLowerCase()")
-            if tag in {"input", "textarea"}:
-                await title_locator.fill(chapter_title)
-            else:
-                await title_locator.click()
-                await page.keyboard.type(chapter_title)
-
-            content_locator, content_sel = await _first_visible(page, content_selectors)
-            if not content_locator:
-                return FanqiePublishResult(False, f"content_not_found: {content_selectors}", page.url)
-            ctag = await content_locator.evaluate("el => el.tagName.toLowerCase()")
-            if ctag == "textarea":
-                await content_locator.fill(chapter_content)
-            else:
-                await content_locator.click()
-                await page.keyboard.press("Control+A")
-                await page.keyboard.type(chapter_content)
-
-            detail = f"filled(title={title_sel}, content={content_sel})"
-            if auto_publish:
-                publish_locator, publish_sel = await _first_visible(page, publish_selectors)
-                if not publish_locator:
-                    await page.screenshot(path=str(screenshot_file), full_page=True)
-                    return FanqiePublishResult(False, f"publish_button_not_found: {publish_selectors}", page.url, str(screenshot_file))
-                await publish_locator.click()
-                detail += f", clicked({publish_sel})"
-
-            await asyncio.sleep(1)
-            await page.screenshot(path=str(screenshot_file), full_page=True)
-            return FanqiePublishResult(True, detail, page.url, str(screenshot_file))
+            return await _fill_and_publish(page, **kwargs)
         finally:
             await page.close()
 
 
+async def _fill_and_publish(
+    page,
+    *,
+    chapter_title: str,
+    chapter_content: str,
+    create_url: str,
+    title_selectors: list[str],
+    content_selectors: list[str],
+    publish_selectors: list[str],
+    screenshot_file: Path,
+    dry_run: bool,
+    auto_publish: bool,
+    timeout_ms: int,
+    fill_mode: str,
+) -> FanqiePublishResult:
+    await page.goto(create_url, wait_until="domcontentloaded", timeout=timeout_ms)
+
+    if dry_run:
+        await page.screenshot(path=str(screenshot_file), full_page=True)
+        return FanqiePublishResult(True, "dry_run_ok", page.url, str(screenshot_file))
+
+    title_locator, title_sel = await _first_visible(page, title_selectors)
+    if not title_locator:
+        return FanqiePublishResult(False, f"title_not_found: {title_selectors}", page.url)
+    tag = await title_locator.evaluate("el => el.tagName.toLowerCase()")
+    if tag in {"input", "textarea"}:
+        await title_locator.fill(chapter_title)
+    else:
+        await title_locator.click()
+        await page.keyboard.type(chapter_title)
+
+    content_locator, content_sel = await _first_visible(page, content_selectors)
+    if not content_locator:
+        return FanqiePublishResult(False, f"content_not_found: {content_selectors}", page.url)
+    ctag = await content_locator.evaluate("el => el.tagName.toLowerCase()")
+    fill_started = time.perf_counter()
+    if ctag == "textarea":
+        await content_locator.fill(chapter_content)
+        used_mode = "fill"
+    else:
+        used_mode = await _fill_contenteditable(page, content_locator, chapter_content, fill_mode)
+    fill_ms = int((time.perf_counter() - fill_started) * 1000)
+
+    detail = f"filled(title={title_sel}, content={content_sel}, mode={used_mode}, {fill_ms}ms)"
+    if auto_publish:
+        publish_locator, publish_sel = await _first_visible(page, publish_selectors)
+        if not publish_locator:
+            await page.screenshot(path=str(screenshot_file), full_page=True)
+            return FanqiePublishResult(
+                False, f"publish_button_not_found: {publish_selectors}", page.url, str(screenshot_file), used_mode, fill_ms
+            )
+        await publish_locator.click()
+        detail += f", clicked({publish_sel})"
+
+    await asyncio.sleep(1)
+    await page.screenshot(path=str(screenshot_file), full_page=True)
+    return FanqiePublishResult(True, detail, page.url, str(screenshot_file), used_mode, fill_ms)
+
+
 async def probe_cdp_endpoint(*, cdp_url: str, timeout_ms: int = 8000) -> FanqieCdpProbeResult:
     async with async_playwright() as p:
         browser = await p.chromium.connect_over_cdp(cdp_url, timeout=timeout_ms)
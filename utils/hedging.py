@@ -0,0 +1,210 @@
+"""Hedged upstream requests.
+
+If the primary call has not answered (or, for streams, produced a first token) within a
+learned percentile of that model's recent latency, a second call is fired and whichever
+answers first wins; the loser is cancelled. Hedges draw from a budget that refills by
+`budget_ratio` per request, so at most ~budget_ratio extra upstream load is added.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyWindow:
+    """Recent latencies of one model; the hedge delay is a percentile of them."""
+
+    def __init__(self, size: int = 200):
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+        return ordered[idx]
+
+
+class Hedger:
+    def __init__(
+        self,
+        *,
+        percentile: float,
+        min_delay: float,
+        default_delay: float,
+        min_samples: int,
+        budget_ratio: float,
+        budget_burst: float,
+        max_inflight: int,
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.max_inflight = max_inflight
+        self._budget = budget_burst
+        self._inflight = 0
+        self._windows: dict[str, LatencyWindow] = {}
+        self.counters = {"requests": 0, "hedges_fired": 0, "hedge_wins": 0, "primary_wins": 0, "budget_denied": 0}
+
+    def _window(self, key: str) -> LatencyWindow:
+        window = self._windows.get(key)
+        if window is None:
+            window = LatencyWindow()
+            self._windows[key] = window
+        return window
+
+    def delay(self, key: str) -> float:
+        window = self._window(key)
+        if len(window.samples) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, window.percentile(self.percentile) or self.default_delay)
+
+    def _start_request(self) -> None:
+        self.counters["requests"] += 1
+        self._budget = min(self.budget_burst, self._budget + self.budget_ratio)
+
+    def _take_budget(self) -> bool:
+        if self._budget < 1 or self._inflight >= self.max_inflight:
+            self.counters["budget_denied"] += 1
+            return False
+        self._budget -= 1
+        self._inflight += 1
+        self.counters["hedges_fired"] += 1
+        return True
+
+    def _record(self, key: str, started: float, winner: int, hedged: bool) -> None:
+        # Time since the primary started: a lower bound on the primary's own latency when
+        # the hedge won, which keeps the learned delay from drifting down on censored data.
+        self._window(key).observe(time.monotonic() - started)
+        if hedged:
+            self.counters["hedge_wins" if winner == 1 else "primary_wins"] += 1
+
+    async def call(
+        self,
+        key: str,
+        primary: Callable[[], Awaitable[T]],
+        hedge: Callable[[], Awaitable[T]],
+        on_winner: Callable[[int], None] | None = None,
+    ) -> T:
+        """Run primary(); fire hedge() if it is slow. Falsy results count as failures.
+
+        on_winner(0 | 1) is called with the index of the call whose result is returned.
+        """
+        self._start_request()
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(primary())]
+        hedged = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay(key))
+            if not done and self._take_budget():
+                hedged = True
+                tasks.append(asyncio.ensure_future(hedge()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.index):
+                    if task.exception() is None and task.result():
+                        self._record(key, started, tasks.index(task), hedged)
+                        if on_winner is not None:
+                            on_winner(tasks.index(task))
+                        return task.result()
+            # Nobody produced content: surface the primary's outcome.
+            return tasks[0].result()
+        finally:
+            if hedged:
+                self._inflight -= 1
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
+
+    async def stream(
+        self,
+        key: str,
+        primary: Callable[[], AsyncIterator[str]],
+        hedge: Callable[[], AsyncIterator[str]],
+        on_winner: Callable[[int], None] | None = None,
+    ) -> AsyncIterator[str]:
+        """Hedge on time-to-first-token, then keep streaming from the winner only.
+
+        on_winner(0 | 1) is called before the first delta is yielded (1 = the hedge).
+        """
+        self._start_request()
+        started = time.monotonic()
+        gens = [primary()]
+        firsts = {asyncio.ensure_future(_anext(gens[0])): 0}
+        hedged = False
+        winner: int | None = None
+        first_delta = ""
+        errors: list[BaseException] = []
+        try:
+            done, _ = await asyncio.wait(set(firsts), timeout=self.delay(key))
+            if not done and self._take_budget():
+                hedged = True
+                gens.append(hedge())
+                firsts[asyncio.ensure_future(_anext(gens[1]))] = 1
+            pending = set(firsts)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda t: firsts[t]):
+                    exc = task.exception()
+                    if exc is None:
+                        winner, first_delta = firsts[task], task.result()
+                        break
+                    errors.append(exc)
+        finally:
+            losers = [task for task in firsts if not task.done()]
+            for task in losers:
+                task.cancel()
+            # A generator cannot be closed while its cancelled __anext__ is still unwinding.
+            await asyncio.gather(*losers, return_exceptions=True)
+            for idx, gen in enumerate(gens):
+                if idx != winner:
+                    await _aclose_quietly(gen)
+            if hedged:
+                self._inflight -= 1
+        if winner is None:
+            if errors and not isinstance(errors[0], StopAsyncIteration):
+                raise errors[0]
+            return
+        self._record(key, started, winner, hedged)
+        if on_winner is not None:
+            on_winner(winner)
+        yield first_delta
+        async for delta in gens[winner]:
+            yield delta
+
+    def stats(self) -> dict[str, Any]:
+        fired = self.counters["hedges_fired"]
+        return {
+            **self.counters,
+            "hedge_rate": round(fired / self.counters["requests"], 4) if self.counters["requests"] else 0.0,
+            "hedge_win_rate": round(self.counters["hedge_wins"] / fired, 4) if fired else 0.0,
+            "inflight": self._inflight,
+            "budget": round(self._budget, 2),
+            "delays_sec": {key: round(self.delay(key), 2) for key in self._windows},
+        }
+
+
+async def _anext(gen: AsyncIterator[str]) -> str:
+    return await gen.__anext__()
+
+
+async def _aclose_quietly(gen: AsyncIterator[str]) -> None:
+    # Exception only: a CancelledError here means the whole request is being cancelled.
+    try:
+        await gen.aclose()
+    except Exception:
+        pass
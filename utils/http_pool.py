@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any
+
+import aiohttp
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSessionManager:
+    """Owns one shared aiohttp session (keep-alive + DNS cache) for all upstream calls."""
+
+    def __init__(
+        self,
+        *,
+        limit: int,
+        limit_per_host: int,
+        dns_ttl: int,
+        keepalive_timeout: float,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self._session: aiohttp.ClientSession | None = None
+        self._lock = asyncio.Lock()
+        self.sessions_created = 0
+
+    def _build_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+            enable_cleanup_closed=True,
+        )
+        self.sessions_created += 1
+        return aiohttp.ClientSession(connector=connector)
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                self._session = self._build_session()
+                logger.info(
+                    "HTTP pool started limit=%s per_host=%s dns_ttl=%s keepalive=%s",
+                    self.limit,
+                    self.limit_per_host,
+                    self.dns_ttl,
+                    self.keepalive_timeout,
+                )
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        # Lazily (re)create the session so library callers outside the app lifecycle still work.
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+                logger.info("HTTP pool closed")
+            self._session = None
+
+    def metrics(self) -> dict[str, Any]:
+        session = self._session
+        if session is None or session.closed:
+            return {
+                "active": False,
+                "limit": self.limit,
+                "limit_per_host": self.limit_per_host,
+                "open": 0,
+                "idle": 0,
+                "in_use": 0,
+                "per_host": {},
+                "sessions_created": self.sessions_created,
+            }
+        connector = session.connector
+        # aiohttp keeps idle keep-alive connections in _conns and checked-out ones in _acquired.
+        idle_by_key = getattr(connector, "_conns", {}) or {}
+        acquired_by_key = getattr(connector, "_acquired_per_host", {}) or {}
+        per_host: dict[str, dict[str, int]] = {}
+        for key, conns in idle_by_key.items():
+            host = f"{getattr(key, 'host', key)}:{getattr(key, 'port', '')}"
+            per_host.setdefault(host, {"idle": 0, "in_use": 0})["idle"] += len(conns)
+        for key, protos in acquired_by_key.items():
+            host = f"{getattr(key, 'host', key)}:{getattr(key, 'port', '')}"
+            per_host.setdefault(host, {"idle": 0, "in_use": 0})["in_use"] += len(protos)
+        idle = sum(x["idle"] for x in per_host.values())
+        in_use = len(getattr(connector, "_acquired", ()) or ())
+        return {
+            "active": True,
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "open": idle + in_use,
+            "idle": idle,
+            "in_use": in_use,
+            "per_host": per_host,
+            "sessions_created": self.sessions_created,
+        }
+
+
+http_pool = PooledSessionManager(
+    limit=config.HTTP_POOL_LIMIT,
+    limit_per_host=config.HTTP_POOL_LIMIT_PER_HOST,
+    dns_ttl=config.HTTP_DNS_CACHE_TTL,
+    keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT,
+)
@@ -0,0 +1,115 @@
+"""Event-loop lag measurement and a blocked-loop watchdog.
+
+A heartbeat task sleeps `interval` seconds in a loop; how late it wakes up is the loop
+lag every other coroutine saw at that moment. A separate watchdog thread watches the
+heartbeat. When it goes quiet for longer than `threshold`, the thread grabs the loop
+thread's current stack, which names the handler that is holding the loop. It logs that
+stack once the loop recovers, together with the stall's full duration.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Any
+
+from .metrics import event_loop_lag_seconds, event_loop_stalls
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_FRAMES = 12
+
+
+def _request_hint(frame) -> str:
+    """Method and path of the innermost frame holding a Starlette `request`, if any."""
+    while frame is not None:
+        request = frame.f_locals.get("request")
+        url = getattr(request, "url", None)
+        if url is not None:
+            rid = getattr(getattr(request, "state", None), "request_id", "")
+            return f"{getattr(request, 'method', '')} {getattr(url, 'path', url)} rid={rid}".strip()
+        frame = frame.f_back
+    return ""
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.last_stall: dict[str, Any] | None = None
+        self._beat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    async def run(self) -> None:
+        """Heartbeat; run as a task on the loop being watched."""
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        if self.threshold > 0 and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+        try:
+            while True:
+                started = time.monotonic()
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                lag = max(0.0, now - started - self.interval)
+                self._beat = now
+                self.max_lag = max(self.max_lag, lag)
+                event_loop_lag_seconds.observe(lag)
+        finally:
+            self._stop.set()
+            self._thread = None
+
+    def _watch(self) -> None:
+        poll = max(0.01, min(self.interval, self.threshold / 4))
+        stalled_since: float | None = None
+        where = hint = ""
+        while not self._stop.wait(poll):
+            beat = self._beat
+            quiet = time.monotonic() - beat
+            if stalled_since is None:
+                if quiet > self.threshold + self.interval:
+                    stalled_since = beat
+                    where, hint = self._capture()
+            elif self._beat != beat or quiet <= self.interval:
+                self._report(self._beat - stalled_since - self.interval, where, hint)
+                stalled_since = None
+
+    def _capture(self) -> tuple[str, str]:
+        frame = sys._current_frames().get(self._loop_thread_id or -1)
+        if frame is None:
+            return "", ""
+        stack = traceback.extract_stack(frame)[-MAX_STACK_FRAMES:]
+        return "".join(traceback.format_list(stack)), _request_hint(frame)
+
+    def _report(self, seconds: float, where: str, hint: str) -> None:
+        self.stalls += 1
+        event_loop_stalls.inc()
+        self.last_stall = {"at": time.time(), "seconds": round(seconds, 3), "request": hint}
+        logger.warning(
+            "Event loop blocked for %.0fms (threshold %.0fms)%s; stack when detected:\n%s",
+            seconds * 1000,
+            self.threshold * 1000,
+            f" in {hint}" if hint else "",
+            where or "  <unavailable>",
+        )
+
+    def stats(self) -> dict[str, Any]:
+        hist = event_loop_lag_seconds.child()
+        p99 = hist.percentile(99)
+        return {
+            "threshold_ms": int(self.threshold * 1000),
+            "lag_p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+            "lag_max_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stalls,
+            "last_stall": self.last_stall,
+        }
@@ -0,0 +1,237 @@
+"""In-process metrics with Prometheus text exposition.
+
+Counters, gauges and fixed-bucket histograms keyed by label tuples; recording is a dict
+lookup plus a bisect, with no locks (everything runs on the event loop). Histograms also
+export bucket-interpolated p50/p90/p99 as a companion ``<name>_quantile`` gauge, so a
+plain `curl /metrics` shows percentiles without a Prometheus server doing the maths.
+"""
+
+from __future__ import annotations
+
+import bisect
+from typing import Any, Iterable
+
+# Upper bounds in seconds; the implicit last bucket is +Inf.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+FAST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram (Prometheus style) with bucket-interpolated percentiles."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def percentile(self, pct: float) -> float | None:
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[idx - 1] if idx else 0.0
+                upper = self.buckets[idx] if idx < len(self.buckets) else lower * 2 or 1.0
+                return lower + (upper - lower) * max(0.0, rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict[str, Any]:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "count": self.count,
+            "mean_ms": int(self.sum / self.count * 1000) if self.count else None,
+            "p50_ms": int(p50 * 1000) if p50 is not None else None,
+            "p95_ms": int(p95 * 1000) if p95 is not None else None,
+        }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(round(value, 6))
+
+
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _header(self, name: str | None = None, kind: str | None = None) -> list[str]:
+        name = name or self.name
+        return [f"# HELP {name} {self.help}", f"# TYPE {name} {kind or self.kind}"]
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_num(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        self.values[self._key(labels)] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def clear(self) -> None:
+        self.values.clear()
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets
+        self.children: dict[tuple[str, ...], LatencyHistogram] = {}
+
+    def child(self, **labels: Any) -> LatencyHistogram:
+        key = self._key(labels)
+        hist = self.children.get(key)
+        if hist is None:
+            hist = LatencyHistogram(self.buckets)
+            self.children[key] = hist
+        return hist
+
+    def observe(self, value: float, **labels: Any) -> None:
+        self.child(**labels).observe(value)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, hist in self.children.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, hist.counts):
+                cumulative += n
+                le = 'le="%s"' % _num(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, inf)} {hist.count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(hist.sum)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {hist.count}")
+        if self.children:
+            lines += self._header(f"{self.name}_quantile", "gauge")
+            for key, hist in self.children.items():
+                for q in QUANTILES:
+                    value = hist.percentile(q * 100)
+                    if value is not None:
+                        quantile = 'quantile="%s"' % q
+                        lines.append(f"{self.name}_quantile{_labels(self.labelnames, key, quantile)} {_num(value)}")
+        return lines
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """JSON-friendly count/mean/p50/p95 per label set (for /runtime/status-style views)."""
+        return {"|".join(key) or "all": hist.snapshot() for key, hist in self.children.items()}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families: list[_Family] = []
+
+    def _add(self, family: _Family):
+        self._families.append(family)
+        return family
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for family in self._families:
+            lines += family.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Request latency until the response body is fully sent.", ("route", "method", "status", "mode")
+)
+upstream_request_seconds = registry.histogram(
+    "upstream_request_duration_seconds", "LLM call latency including retries.", ("provider", "model", "outcome")
+)
+upstream_ttft_seconds = registry.histogram(
+    "upstream_time_to_first_token_seconds", "Time to the first streamed token.", ("provider", "model")
+)
+upstream_tokens = registry.counter(
+    "upstream_tokens_total", "Estimated prompt (in) and completion (out) tokens.", ("provider", "model", "direction")
+)
+generate_wait_seconds = registry.histogram(
+    "generate_semaphore_wait_seconds", "Time spent waiting for a MAX_GENERATE_CONCURRENCY slot.", (), FAST_BUCKETS
+)
+generate_waiting = registry.gauge("generate_semaphore_waiting", "Requests waiting for a generate slot.")
+generate_in_use = registry.gauge("generate_semaphore_in_use", "Generate slots currently held.")
+publish_seconds = registry.histogram(
+    "publish_duration_seconds", "Fanqie publish duration.", ("source", "outcome")
+)
+generated_calls = registry.counter("generated_calls_total", "Successful generate requests.", ("mode",))
+generated_chapters = registry.counter("generated_chapters_total", "Chapters returned by generate requests.", ("mode",))
+publish_attempts = registry.counter("publish_attempts_total", "Publish attempts.", ("source",))
+publish_success = registry.counter("publish_success_total", "Successful publishes.", ("source",))
+cache_lookups = registry.counter("response_cache_lookups_total", "Response cache lookups by result.", ("result",))
+cache_hit_ratio = registry.gauge("response_cache_hit_ratio", "Response cache hit ratio since start.")
+queue_depth = registry.gauge("queue_depth", "Queued or running work by queue.", ("queue", "state"))
+postprocess_seconds = registry.histogram(
+    "postprocess_duration_seconds", "Parse/clean/audit time including executor queueing.", ("stage", "where"), FAST_BUCKETS
+)
+postprocess_pending = registry.gauge("postprocess_pending", "Post-processing calls queued or running in the executor.")
+event_loop_lag_seconds = registry.histogram(
+    "event_loop_lag_seconds", "How late the loop heartbeat woke up.", (), FAST_BUCKETS
+)
+event_loop_stalls = registry.counter("event_loop_stalls_total", "Times the loop was blocked past LOOP_BLOCK_WARN_MS.")
@@ -101,6 +101,14 @@ def resolve_model(model_uid: str | None) -> dict:
     return models[0]
 
 
+def failover_chain(primary: dict, provider_order: list[str], max_models: int) -> list[dict]:
+    """primary first, then other catalogue models by provider_order (unlisted providers last)."""
+    rank = {provider: i for i, provider in enumerate(provider_order)}
+    others = [m for m in fetch_free_models() if m.get("uid") != primary.get("uid")]
+    others.sort(key=lambda m: rank.get(m.get("provider"), len(rank)))
+    return ([primary] + others)[: max(1, max_models)]
+
+
 def get_llama_model() -> dict:
     """Backward-compatible default model getter."""
     return resolve_model(None)
@@ -0,0 +1,146 @@
+"""Cached, concurrent model health probes.
+
+Probes run concurrently (bounded by a semaphore) and their results are cached for
+`ttl` seconds, so /models/health and /readyz answer from memory; a background prober
+keeps the cache warm. Each model keeps a probe-latency histogram and the time of its
+last successful probe, which the UI and router use to prefer the fastest healthy model.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable
+
+from .metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+class ModelHealth:
+    def __init__(self):
+        self.ok: bool | None = None
+        self.detail = "not checked"
+        self.checked_at = 0.0  # wall clock, for display
+        self.checked_mono = 0.0
+        self.latency_ms: int | None = None
+        self.last_success_at: float | None = None
+        self.consecutive_failures = 0
+        self.latency = LatencyHistogram()
+
+    def record(self, ok: bool, detail: str, seconds: float) -> None:
+        self.ok = ok
+        self.detail = detail
+        self.checked_at = time.time()
+        self.checked_mono = time.monotonic()
+        self.latency_ms = int(seconds * 1000)
+        if ok:
+            self.latency.observe(seconds)
+            self.last_success_at = self.checked_at
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+
+    def age(self, now: float) -> float:
+        return now - self.checked_mono if self.checked_mono else float("inf")
+
+
+class ModelHealthMonitor:
+    def __init__(
+        self,
+        check: Callable[[dict], Awaitable[tuple[bool, str]]],
+        *,
+        key: Callable[[dict], str],
+        ttl: float,
+        timeout: float,
+        concurrency: int,
+        on_result: Callable[[dict, bool, str], None] | None = None,
+    ):
+        self._check = check
+        self._key = key
+        self.ttl = ttl
+        self.timeout = timeout
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._on_result = on_result
+        self._health: dict[str, ModelHealth] = {}
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.probes = 0
+
+    def get(self, model: dict) -> ModelHealth:
+        key = self._key(model)
+        health = self._health.get(key)
+        if health is None:
+            health = ModelHealth()
+            self._health[key] = health
+        return health
+
+    async def _probe(self, model: dict) -> None:
+        async with self._sem:
+            started = time.monotonic()
+            try:
+                ok, detail = await asyncio.wait_for(self._check(model), timeout=self.timeout)
+            except Exception as exc:
+                ok, detail = False, str(exc) or exc.__class__.__name__
+            self.probes += 1
+            self.get(model).record(ok, detail, time.monotonic() - started)
+        if self._on_result is not None:
+            self._on_result(model, ok, detail)
+
+    async def refresh(self, models: Iterable[dict], *, force: bool = False) -> None:
+        """Probe every model whose result is older than ttl (all of them if force)."""
+        now = time.monotonic()
+        waits = []
+        for model in models:
+            key = self._key(model)
+            task = self._inflight.get(key)
+            if task is None:
+                if not force and self.get(model).age(now) < self.ttl:
+                    continue
+                task = asyncio.create_task(self._probe(model))
+                self._inflight[key] = task
+                task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+            waits.append(task)
+        if waits:
+            # shield: a caller that gives up must not cancel a probe other callers share.
+            await asyncio.gather(*(asyncio.shield(t) for t in waits), return_exceptions=True)
+
+    def is_healthy(self, model: dict) -> bool:
+        health = self._health.get(self._key(model))
+        return bool(health and health.ok)
+
+    def fastest_healthy(self, models: Iterable[dict]) -> dict | None:
+        healthy = [m for m in models if self.is_healthy(m)]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda m: self.get(m).latency.percentile(50) or float("inf"))
+
+    def results(self, models: Iterable[dict]) -> list[dict[str, Any]]:
+        now = time.monotonic()
+        out = []
+        for model in models:
+            health = self.get(model)
+            out.append({
+                "uid": model.get("uid"),
+                "provider": model.get("provider"),
+                "id": model.get("id"),
+                "ok": bool(health.ok),
+                "checked": health.ok is not None,
+                "detail": health.detail,
+                "latency_ms": health.latency_ms,
+                "checked_at": health.checked_at or None,
+                "last_success_at": health.last_success_at,
+                "consecutive_failures": health.consecutive_failures,
+                "stale": health.age(now) >= self.ttl,
+                "latency": health.latency.snapshot(),
+            })
+        return out
+
+    async def run(self, models_fn: Callable[[], list[dict]], interval: float) -> None:
+        """Background prober: re-probe every model every `interval` seconds."""
+        while True:
+            try:
+                await self.refresh(models_fn(), force=True)
+            except Exception as exc:
+                logger.exception("Background model probe failed: %s", exc)
+            await asyncio.sleep(interval)
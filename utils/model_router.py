@@ -0,0 +1,189 @@
+"""Latency-aware routing for ``model="auto"``.
+
+Live calls feed per-model EWMAs of latency, output tokens/sec and error rate. route()
+drops models whose context window cannot hold the prompt plus an output reserve (the
+output budget, capped at half the window), whose breaker is open or whose last health
+probe failed, then picks the model with the lowest expected completion time, inflated by
+its error rate (a call that fails 1 time in 4 costs ~4/3 of a clean one once retried).
+Models without a measured throughput, including those whose calls all failed, are
+costed at a prior tokens/sec, so every model is compared on the same output budget.
+A small share of requests goes to the least-measured eligible model so that models
+without live data still get measured.
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from .upstream_limiter import estimate_tokens
+
+
+class ModelStats:
+    """EWMAs of one model's live calls."""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency_sec: float | None = None
+        self.tokens_per_sec: float | None = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    def _ewma(self, old: float | None, new: float) -> float:
+        return new if old is None else old + self.alpha * (new - old)
+
+    def record_success(self, seconds: float, output_tokens: int) -> None:
+        self.calls += 1
+        self.latency_sec = self._ewma(self.latency_sec, seconds)
+        if seconds > 0 and output_tokens > 0:
+            self.tokens_per_sec = self._ewma(self.tokens_per_sec, output_tokens / seconds)
+        self.error_rate = self._ewma(self.error_rate, 0.0)
+
+    def record_error(self) -> None:
+        self.calls += 1
+        self.errors += 1
+        self.error_rate = self._ewma(self.error_rate, 1.0)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_sec": round(self.latency_sec, 2) if self.latency_sec is not None else None,
+            "tokens_per_sec": round(self.tokens_per_sec, 1) if self.tokens_per_sec is not None else None,
+            "error_rate": round(self.error_rate, 3),
+        }
+
+
+class ModelStatsRegistry:
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._stats: dict[str, ModelStats] = {}
+
+    def get(self, key: str) -> ModelStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = ModelStats(self.alpha)
+            self._stats[key] = stats
+        return stats
+
+    def peek(self, key: str) -> ModelStats | None:
+        return self._stats.get(key)
+
+    def record_success(self, key: str, seconds: float, output_tokens: int) -> None:
+        self.get(key).record_success(seconds, output_tokens)
+
+    def record_error(self, key: str) -> None:
+        self.get(key).record_error()
+
+    def stats(self) -> dict[str, Any]:
+        return {key: s.snapshot() for key, s in self._stats.items()}
+
+
+@dataclass
+class Route:
+    model: dict
+    reason: str
+    ranked: list[dict]
+    candidates: list[dict[str, Any]] = field(default_factory=list)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"model": self.model.get("uid"), "reason": self.reason, "candidates": self.candidates}
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        stats: ModelStatsRegistry,
+        *,
+        key: Callable[[dict], str],
+        is_open: Callable[[str], bool],
+        is_unhealthy: Callable[[dict], bool],
+        probe_latency: Callable[[dict], float | None],
+        prior_tokens_per_sec: float,
+        explore_ratio: float = 0.0,
+    ):
+        self.stats = stats
+        self._key = key
+        self._is_open = is_open
+        self._is_unhealthy = is_unhealthy
+        self._probe_latency = probe_latency
+        self.prior_tokens_per_sec = max(0.1, prior_tokens_per_sec)
+        self.explore_ratio = explore_ratio
+
+    def _calls(self, model: dict) -> int:
+        stats = self.stats.peek(self._key(model))
+        return stats.calls if stats is not None else 0
+
+    def _expected_sec(self, model: dict, output_tokens: int) -> tuple[float, str]:
+        stats = self.stats.peek(self._key(model))
+        if stats is not None and stats.tokens_per_sec:
+            return output_tokens / stats.tokens_per_sec, f"{stats.tokens_per_sec:.1f} tok/s"
+        if stats is not None and stats.latency_sec is not None:
+            return stats.latency_sec, f"{stats.latency_sec:.1f}s avg"
+        # No successful call yet: assume the prior throughput. A fast probe only says the
+        # model answers, not how fast it writes, so it just adds its latency.
+        prior = output_tokens / self.prior_tokens_per_sec
+        label = "failed only" if stats is not None and stats.errors else "unmeasured"
+        probe = self._probe_latency(model)
+        if probe is not None:
+            return prior + probe, f"{label}, prior {self.prior_tokens_per_sec:g} tok/s, probe {probe * 1000:.0f}ms"
+        return prior, f"{label}, prior {self.prior_tokens_per_sec:g} tok/s"
+
+    def route(self, models: list[dict], prompt: str, max_output_tokens: int) -> Route:
+        if not models:
+            raise ValueError("no models configured")
+        prompt_tokens = estimate_tokens(prompt)
+        scored: list[tuple[float, int, dict, str]] = []
+        skipped: list[str] = []
+        candidates: list[dict[str, Any]] = []
+        for idx, model in enumerate(models):
+            key = self._key(model)
+            ctx = model.get("context_length")
+            entry: dict[str, Any] = {"model": model.get("uid")}
+            if ctx and prompt_tokens + min(max_output_tokens, ctx // 2) > ctx:
+                entry["excluded"] = f"context {ctx} too small for a {prompt_tokens}-token prompt"
+            elif self._is_open(key):
+                entry["excluded"] = "circuit open"
+            elif self._is_unhealthy(model):
+                entry["excluded"] = "health probe failed"
+            if "excluded" in entry:
+                skipped.append(f"{model.get('uid')} ({entry['excluded']})")
+                candidates.append(entry)
+                continue
+            expected, basis = self._expected_sec(model, max_output_tokens)
+            stats = self.stats.peek(key)
+            error_rate = stats.error_rate if stats is not None else 0.0
+            score = expected / max(0.05, 1.0 - error_rate)
+            entry.update({"score_sec": round(score, 2), "basis": basis, "error_rate": round(error_rate, 3)})
+            candidates.append(entry)
+            scored.append((score, idx, model, basis))
+
+        if not scored:
+            # Nothing qualifies: degrade rather than refuse. Prefer a model the prompt fits
+            # (its breaker/probe may have recovered), else the largest context window.
+            fits = [m for m in models if not m.get("context_length") or prompt_tokens <= m["context_length"] // 2]
+            if fits:
+                fallback, reason = fits[0], "no healthy model; using the first that fits the prompt"
+            else:
+                fallback = max(models, key=lambda m: m.get("context_length") or 0)
+                reason = "no model fits the prompt; using the largest context window"
+            if skipped:
+                reason += "; skipped: " + ", ".join(skipped)
+            ranked = [fallback] + [m for m in models if m is not fallback]
+            return Route(fallback, reason, ranked, candidates)
+
+        scored.sort(key=lambda item: (item[0], item[1]))
+        best_score, _, best, basis = scored[0]
+        reason = f"lowest expected time {best_score:.1f}s ({basis})"
+        if len(scored) > 1 and random.random() < self.explore_ratio:
+            least = min(scored, key=lambda item: self._calls(item[2]))
+            if least[2] is not best:
+                scored.remove(least)
+                scored.insert(0, least)
+                best = least[2]
+                reason = f"exploring least-measured model ({self._calls(best)} calls, {least[3]})"
+        if skipped:
+            reason += "; skipped: " + ", ".join(skipped)
+        return Route(best, reason, [item[2] for item in scored], candidates)
@@ -243,3 +243,105 @@ def build_pad_prompt(
 {chapter_title}
 {chapter_content}
 """
+
+
+def build_outline_prompt(
+    user_prompt: str,
+    chapter_count: int,
+    genre: Optional[str] = None,
+    workflow_answers: Optional[Dict[str, str]] = None,
+    style_prompt: Optional[str] = None,
+    custom_prompt: Optional[str] = None,
+    role_cards: Optional[list] = None,
+    org_cards: Optional[list] = None,
+    profession_system: Optional[Dict[str, str]] = None,
+    foreshadows: Optional[list] = None,
+    style_strength: Optional[str] = None,
+) -> str:
+    workflow_answers = workflow_answers or {}
+    qna_lines = []
+    for item in DEFAULT_WORKFLOW_QUESTIONS:
+        answer = (workflow_answers.get(item["id"]) or "").strip()
+        if answer:
+            qna_lines.append(f"- {item['question']} {answer}")
+    qna_block = "\n".join(qna_lines) if qna_lines else "- 未提供完整5问信息，请根据用户提示合理补全。"
+
+    extra_context_lines = []
+    if profession_system:
+        extra_context_lines.append(f"- 职业/等级体系：{profession_system}")
+    if role_cards:
+        extra_context_lines.append(f"- 角色卡：{role_cards}")
+    if org_cards:
+        extra_context_lines.append(f"- 组织卡：{org_cards}")
+    if foreshadows:
+        extra_context_lines.append(f"- 伏笔清单：{foreshadows}")
+    extra_context = "\n".join(extra_context_lines) if extra_context_lines else "- 无额外世界观结构数据"
+
+    return f"""你是专业中文长篇小说策划编辑。请为下面的作品制定完整的分章大纲，不要写正文。
+
+【输入信息】
+- 用户核心需求：{user_prompt}
+- 题材：{genre or "不限"}
+- 自定义写作风格：{style_prompt or "自然流畅"}
+- 风格锁定强度：{style_strength or "medium"}
+- Prompt工坊附加要求：{custom_prompt or "无"}
+
+【5问确认结果】
+{qna_block}
+【扩展创作上下文】
+{extra_context}
+
+【要求】
+1. 共 {chapter_count} 章，主线冲突逐步升级，人物弧线完整，伏笔有埋有收。
+2. 每章梗概 80-150 字，写清本章核心事件、冲突与结尾钩子。
+3. 不要输出正文、创作说明或任何解释。
+
+【输出格式】
+《书名》
+第1章 章节标题：本章梗概
+第2章 章节标题：本章梗概
+……
+第{chapter_count}章 章节标题：本章梗概
+"""
+
+
+def build_outline_chapter_prompt(
+    novel_title: str,
+    outline_text: str,
+    chapter_index: int,
+    chapter_title: str,
+    chapter_summary: str,
+    previous_context: str,
+    genre: Optional[str] = None,
+    style_prompt: Optional[str] = None,
+    style_strength: Optional[str] = None,
+    chapter_min_words: Optional[int] = None,
+    chapter_max_words: Optional[int] = None,
+) -> str:
+    min_words = chapter_min_words or 3000
+    max_words = chapter_max_words or 5000
+    return f"""请根据全书大纲创作指定章节的完整正文。
+
+小说标题：{novel_title or "未命名小说"}
+题材参考：{genre or "沿用大纲"}
+风格要求：{style_prompt or "自然流畅"}
+风格锁定强度：{style_strength or "medium"}
+
+全书大纲：
+{outline_text}
+
+前文衔接：
+{previous_context or "（本章为开篇）"}
+
+本章任务：第{chapter_index}章 {chapter_title}
+本章梗概：{chapter_summary}
+
+硬性要求：
+1. 只输出本章正文，严格按本章梗概推进，不要提前写后续章节的事件。
+2. 与前文衔接自然，人物设定和世界观保持一致。
+3. 字数目标{min_words}-{max_words}。
+4. 章节结尾必须有悬念钩子，不要出现“本章总结/作者点评”等元叙述。
+5. 输出格式必须是：
+第{chapter_index}章 {chapter_title}
+[章节正文]
+"""
@@ -0,0 +1,88 @@
+"""Run CPU-heavy post-processing off the event loop.
+
+Parsing, cleaning and auditing a long multi-chapter output takes tens to hundreds of
+milliseconds of pure Python; run inline it stalls every other request on the worker.
+CpuOffload sends such calls to a thread or process pool. A semaphore bounds how many
+calls may be queued or running, so a burst waits on the loop instead of piling work
+into the executor. Inputs below `inline_chars` still run inline, because the executor
+round trip costs more than the work.
+
+Thread mode keeps the loop responsive: the GIL is handed back every few milliseconds.
+Process mode also runs calls in parallel, but arguments and results are pickled.
+Calls on shared in-process state (stateful=True) always use the thread pool.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from .metrics import postprocess_pending, postprocess_seconds
+
+MODES = ("thread", "process", "inline")
+
+
+class CpuOffload:
+    def __init__(self, mode: str = "thread", workers: int = 2, max_pending: int = 32, inline_chars: int = 20000):
+        if mode not in MODES:
+            raise ValueError(f"POSTPROCESS_EXECUTOR must be one of {', '.join(MODES)}, got {mode!r}")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.inline_chars = inline_chars
+        self._threads: ThreadPoolExecutor | None = None
+        self._processes: ProcessPoolExecutor | None = None
+        self._pending: asyncio.Semaphore | None = None
+        self.counters = {"offloaded": 0, "inline": 0, "waited": 0}
+
+    def _executor(self, stateful: bool) -> Executor:
+        if self.mode == "process" and not stateful:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.workers)
+            return self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="postprocess")
+        return self._threads
+
+    async def run(self, stage: str, fn: Callable[..., Any], *args: Any, size: int | None = None, stateful: bool = False) -> Any:
+        """Run fn(*args) for `stage`; `size` (input chars) decides inline vs offloaded."""
+        started = time.perf_counter()
+        if self.mode == "inline" or (size is not None and size < self.inline_chars):
+            self.counters["inline"] += 1
+            result = fn(*args)
+            postprocess_seconds.observe(time.perf_counter() - started, stage=stage, where="inline")
+            return result
+        if self._pending is None:
+            self._pending = asyncio.Semaphore(self.max_pending)
+        if self._pending.locked():
+            self.counters["waited"] += 1
+        postprocess_pending.inc()
+        try:
+            async with self._pending:
+                self.counters["offloaded"] += 1
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._executor(stateful), partial(fn, *args))
+        finally:
+            postprocess_pending.dec()
+        postprocess_seconds.observe(time.perf_counter() - started, stage=stage, where=self.mode if not stateful else "thread")
+        return result
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "inline_chars": self.inline_chars,
+            "pending": int(postprocess_pending.value()),
+            **self.counters,
+            "seconds": postprocess_seconds.summary(),
+        }
+
+    def shutdown(self) -> None:
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
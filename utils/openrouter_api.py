@@ -2,19 +2,70 @@
 import json
 import logging
 import os
+import time
 from pathlib import Path
+from typing import AsyncIterator
 
 import aiohttp
 from dotenv import load_dotenv
 
 import config
-from .cache import cache_response, get_cached_response
+from .cache import cache_response, get_cache_key, get_cached_response
+from .circuit_breaker import BreakerRegistry, CircuitOpenError
+from .hedging import Hedger
+from .metrics import upstream_request_seconds, upstream_tokens, upstream_ttft_seconds
+from .model_router import ModelStatsRegistry
+from .http_pool import http_pool
+from .single_flight import SingleFlight
+from .tracing import span
+from .upstream_limiter import OVERLOAD_STATUSES, UpstreamLimiter, estimate_tokens
+
+# Request-side errors say nothing about the model's health.
+BREAKER_IGNORED_STATUSES = {400, 413, 422}
+# Client errors a retry with a smaller max_tokens (see _retry_payload) may fix. Other
+# 4xx except 408/429 (bad key, unknown model, ...) fail without retrying.
+SHRINKABLE_STATUSES = {400, 402, 413, 422}
 
 logger = logging.getLogger(__name__)
 load_dotenv(Path(__file__).parent.parent / ".env")
 
+generate_flight = SingleFlight()
+upstream_limiter = UpstreamLimiter(
+    rpm=config.UPSTREAM_RPM,
+    tpm=config.UPSTREAM_TPM,
+    max_concurrency=config.UPSTREAM_MAX_CONCURRENCY,
+    min_concurrency=config.UPSTREAM_MIN_CONCURRENCY,
+    backoff_base=config.UPSTREAM_BACKOFF_BASE,
+    backoff_cap=config.UPSTREAM_BACKOFF_CAP,
+)
+breakers = BreakerRegistry(
+    failure_threshold=config.CIRCUIT_FAILURE_THRESHOLD,
+    open_sec=config.CIRCUIT_OPEN_SEC,
+    max_open_sec=config.CIRCUIT_MAX_OPEN_SEC,
+)
+model_stats = ModelStatsRegistry(alpha=config.ROUTER_EWMA_ALPHA)
+hedger = Hedger(
+    percentile=config.HEDGE_PERCENTILE,
+    min_delay=config.HEDGE_MIN_DELAY_SEC,
+    default_delay=config.HEDGE_DEFAULT_DELAY_SEC,
+    min_samples=config.HEDGE_MIN_SAMPLES,
+    budget_ratio=config.HEDGE_BUDGET_RATIO,
+    budget_burst=config.HEDGE_BUDGET_BURST,
+    max_inflight=config.HEDGE_MAX_INFLIGHT,
+)
+
+
+def model_key(model: dict) -> str:
+    """Stable identity of a model endpoint; also the response-cache model id."""
+    return f"{model.get('provider', 'openrouter')}:{model['id']}:{model.get('api_base', '')}"
+
 
-def _build_endpoint(provider: str, model: dict) -> tuple[str, dict]:
+def _check_breaker(key: str) -> None:
+    if not breakers.allow(key):
+        raise CircuitOpenError(f"circuit_open model={key} last_error={breakers.get(key).last_error}")
+
+
+def _build_endpoint(provider: str, model: dict, stream: bool = False) -> tuple[str, dict]:
     if provider == "newapi":
         api_base = (model.get("api_base") or os.getenv("NEWAPI_BASE_URL") or "").strip()
         api_key = (os.getenv("NEWAPI_API_KEY") or "").strip()
@@ -38,7 +89,10 @@ def _build_endpoint(provider: str, model: dict) -> tuple[str, dict]:
         model_id = model.get("id", "").strip()
         if not model_id:
             raise ValueError("google model id is empty")
-        endpoint = f"{api_base.rstrip('/')}/models/{model_id}:generateContent?key={api_key}"
+        if stream:
+            endpoint = f"{api_base.rstrip('/')}/models/{model_id}:streamGenerateContent?alt=sse&key={api_key}"
+        else:
+            endpoint = f"{api_base.rstrip('/')}/models/{model_id}:generateContent?key={api_key}"
         headers = {"Content-Type": "application/json"}
         return endpoint, headers
 
@@ -68,6 +122,102 @@ def _build_endpoint(provider: str, model: dict) -> tuple[str, dict]:
     return endpoint, headers
 
 
+def _build_payload(provider: str, model_id: str, prompt: str, stream: bool = False) -> dict:
+    if provider == "google":
+        # Google selects streaming via the endpoint (streamGenerateContent), not the payload.
+        return {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": config.TEMPERATURE,
+                "topP": config.TOP_P,
+                "maxOutputTokens": config.MAX_TOKENS,
+            },
+        }
+    if provider == "anthropic":
+        payload = {
+            "model": model_id,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": config.TEMPERATURE,
+            "max_tokens": config.MAX_TOKENS,
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+    return {
+        "model": model_id,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": config.MAX_TOKENS,
+        "temperature": config.TEMPERATURE,
+        "top_p": config.TOP_P,
+        "stream": stream,
+    }
+
+
+def _retry_payload(provider: str, payload: dict, attempt: int) -> dict:
+    req_payload = dict(payload)
+    # On retries, lower output budget to improve completion stability on some providers.
+    if attempt > 0:
+        if provider == "google":
+            gc = dict(req_payload.get("generationConfig") or {})
+            gc["maxOutputTokens"] = max(512, int(config.MAX_TOKENS / (attempt + 1)))
+            req_payload["generationConfig"] = gc
+        elif provider == "anthropic":
+            req_payload["max_tokens"] = max(512, int(config.MAX_TOKENS / (attempt + 1)))
+        else:
+            req_payload["max_tokens"] = max(512, int(config.MAX_TOKENS / (attempt + 1)))
+    return req_payload
+
+
+def _status_retry_delay(status: int, attempt: int) -> float | None:
+    """Seconds to wait before retrying after an HTTP error, or None to fail now.
+
+    Overloads retry at once: upstream_limiter has opened a shared backoff window that
+    the next slot() waits out.
+    """
+    if status in OVERLOAD_STATUSES:
+        return 0.0
+    if status >= 500 or status == 408 or status in SHRINKABLE_STATUSES:
+        return upstream_limiter.retry_delay(attempt)
+    return None
+
+
+class UpstreamStreamError(RuntimeError):
+    """An error event inside an otherwise successful (HTTP 200) stream."""
+
+    def __init__(self, message: str, overloaded: bool = False):
+        super().__init__(message)
+        self.overloaded = overloaded
+
+
+# Anthropic stream error types that mean "back off", like an HTTP 429/529.
+ANTHROPIC_OVERLOAD_ERRORS = {"overloaded_error", "rate_limit_error"}
+
+
+def _stream_delta_text(provider: str, data: dict) -> str:
+    if provider == "google":
+        candidates = data.get("candidates") or []
+        if not candidates:
+            return ""
+        parts = (((candidates[0] or {}).get("content") or {}).get("parts") or [])
+        return "".join([str((p or {}).get("text", "")) for p in parts if (p or {}).get("text")])
+    if provider == "anthropic":
+        if data.get("type") == "error":
+            error = data.get("error") or data
+            raise UpstreamStreamError(
+                f"anthropic_stream_error: {json.dumps(error)[:300]}",
+                overloaded=isinstance(error, dict) and error.get("type") in ANTHROPIC_OVERLOAD_ERRORS,
+            )
+        if data.get("type") != "content_block_delta":
+            return ""
+        delta = data.get("delta") or {}
+        return str(delta.get("text", "")) if delta.get("type") == "text_delta" else ""
+    choices = data.get("choices") or []
+    if not choices:
+        return ""
+    delta = (choices[0] or {}).get("delta") or {}
+    return str(delta.get("content") or "")
+
+
 async def check_model_connection(model: dict) -> tuple[bool, str]:
     """Lightweight connectivity check for a model endpoint."""
     provider = model.get("provider", "openrouter")
@@ -94,145 +244,435 @@ async def check_model_connection(model: dict) -> tuple[bool, str]:
             "stream": False,
         }
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                endpoint,
-                headers=headers,
-                json=payload,
-                timeout=min(20, config.REQUEST_TIMEOUT),
-            ) as resp:
-                text = await resp.text()
-                if resp.status != 200:
-                    return False, f"HTTP {resp.status}: {text[:120]}"
-                data = await resp.json()
-                if provider == "google":
-                    candidates = data.get("candidates") or []
-                    if not candidates:
-                        return False, "No candidates in response"
-                elif provider == "anthropic":
-                    blocks = data.get("content") or []
-                    if not blocks:
-                        return False, "No content blocks in response"
-                else:
-                    choices = data.get("choices") or []
-                    if not choices:
-                        return False, "No choices in response"
-                return True, "ok"
+        session = await http_pool.get_session()
+        async with session.post(
+            endpoint,
+            headers=headers,
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=min(20, config.REQUEST_TIMEOUT)),
+        ) as resp:
+            text = await resp.text()
+            if resp.status != 200:
+                return False, f"HTTP {resp.status}: {text[:120]}"
+            data = await resp.json()
+            if provider == "google":
+                candidates = data.get("candidates") or []
+                if not candidates:
+                    return False, "No candidates in response"
+            elif provider == "anthropic":
+                blocks = data.get("content") or []
+                if not blocks:
+                    return False, "No content blocks in response"
+            else:
+                choices = data.get("choices") or []
+                if not choices:
+                    return False, "No choices in response"
+            return True, "ok"
     except Exception as exc:
         return False, str(exc)
 
 
-async def generate_content(model: dict, prompt: str) -> str | None:
-    provider = model.get("provider", "openrouter")
-    model_id = model["id"]
-    cache_model_id = f"{provider}:{model_id}:{model.get('api_base', '')}"
+def _hedge_target(model: dict, alternate: dict | None) -> dict:
+    return alternate if alternate is not None and config.HEDGE_TARGET == "alternate" else model
 
-    cached = get_cached_response(prompt, cache_model_id)
-    if cached:
-        logger.info("Using cached response")
-        return cached
 
-    endpoint, headers = _build_endpoint(provider, model)
+async def generate_content(
+    model: dict,
+    prompt: str,
+    max_attempts: int | None = None,
+    hedge_model: dict | None = None,
+) -> str | None:
+    """hedge_model is the alternate a slow call may be hedged to (HEDGE_TARGET=alternate)."""
+    content, _ = await generate_content_with_model(model, prompt, max_attempts, hedge_model)
+    return content
+
+
+async def generate_content_with_model(
+    model: dict,
+    prompt: str,
+    max_attempts: int | None = None,
+    hedge_model: dict | None = None,
+) -> tuple[str | None, dict]:
+    """generate_content that also returns the model that answered: hedge_model when an
+    alternate hedge won the race, else model."""
+    cache_model_id = model_key(model)
+
+    with span("generate_content", model=cache_model_id) as sp:
+        cached = await get_cached_response(prompt, cache_model_id)
+        if sp is not None:
+            sp.set(cached=bool(cached))
+        if cached:
+            logger.info("Using cached response")
+            return cached, model
+
+        attempts = max_attempts or config.MAX_RETRIES
+
+        async def run(m: dict) -> str | None:
+            key = model_key(m)
+            started = time.monotonic()
+            with span("upstream_call", model=key, provider=m.get("provider", "")):
+                try:
+                    content = await _generate_upstream(m, prompt, key, attempts)
+                except CircuitOpenError:
+                    raise
+                except (RuntimeError, ValueError):
+                    model_stats.record_error(key)
+                    _observe_upstream(m, prompt, "", time.monotonic() - started)
+                    raise
+            if content:
+                model_stats.record_success(key, time.monotonic() - started, estimate_tokens(content))
+                _observe_upstream(m, prompt, content, time.monotonic() - started)
+            return content
+
+        async def call() -> tuple[str | None, dict]:
+            if not config.HEDGE_ENABLED:
+                return await run(model), model
+            target = _hedge_target(model, hedge_model)
+            winner = [0]
+            content = await hedger.call(
+                cache_model_id,
+                lambda: run(model),
+                lambda: run(target),
+                on_winner=lambda idx: winner.__setitem__(0, idx),
+            )
+            return content, target if winner[0] else model
+
+        # Identical in-flight requests share one upstream call instead of each hitting the
+        # provider. The retry and hedge policy is part of the key, so a caller never
+        # inherits another caller's attempts or hedge target.
+        hedge_key = model_key(_hedge_target(model, hedge_model)) if config.HEDGE_ENABLED else ""
+        flight_key = f"{get_cache_key(prompt, cache_model_id)}:{attempts}:{hedge_key}"
+        return await generate_flight.do(flight_key, call)
+
+
+def _failover_candidates(models: list[dict]) -> list[dict]:
+    # Skip models whose breaker is open; if every one is open, let the first fail fast.
+    return [m for m in models if not breakers.is_open(model_key(m))] or models[:1]
+
+
+async def generate_with_failover(
+    models: list[dict],
+    prompt: str,
+    candidate_timeout: float | None = None,
+) -> tuple[str | None, dict]:
+    """Try models in order and return (content, model_used).
+
+    Every model but the last gets MODEL_FAILOVER_ATTEMPTS attempts, so an outage costs
+    one quick failure per model instead of MAX_RETRIES backoff rounds. candidate_timeout
+    bounds each model separately, so a primary that times out still leaves the fallback a
+    full budget; a timeout on the last model raises asyncio.TimeoutError.
+    """
+    candidates = _failover_candidates(models)
+    last_exc: Exception | None = None
+    for i, model in enumerate(candidates):
+        is_last = i == len(candidates) - 1
+        try:
+            content, answered_by = await asyncio.wait_for(
+                generate_content_with_model(
+                    model,
+                    prompt,
+                    max_attempts=None if is_last else config.MODEL_FAILOVER_ATTEMPTS,
+                    hedge_model=None if is_last else candidates[i + 1],
+                ),
+                timeout=candidate_timeout,
+            )
+        except asyncio.TimeoutError:
+            if is_last:
+                raise
+            logger.warning("Failing over from %s: timed out after %ss", model_key(model), candidate_timeout)
+            continue
+        except (RuntimeError, ValueError) as exc:
+            last_exc = exc
+            if not is_last:
+                logger.warning("Failing over from %s: %s", model_key(model), exc)
+            continue
+        if content:
+            return content, answered_by
+    if last_exc is not None:
+        raise last_exc if isinstance(last_exc, RuntimeError) else RuntimeError(str(last_exc))
+    return None, candidates[0]
+
+
+def _usage_tokens(provider: str, data: dict) -> int | None:
     if provider == "google":
-        payload = {
-            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "temperature": config.TEMPERATURE,
-                "topP": config.TOP_P,
-                "maxOutputTokens": config.MAX_TOKENS,
-            },
-        }
-    elif provider == "anthropic":
-        payload = {
-            "model": model_id,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": config.TEMPERATURE,
-            "max_tokens": config.MAX_TOKENS,
-        }
-    else:
-        payload = {
-            "model": model_id,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": config.MAX_TOKENS,
-            "temperature": config.TEMPERATURE,
-            "top_p": config.TOP_P,
-            "stream": False,
-        }
+        return (data.get("usageMetadata") or {}).get("totalTokenCount")
+    usage = data.get("usage") or {}
+    if provider == "anthropic":
+        total = (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0)
+        return total or None
+    return usage.get("total_tokens")
+
+
+async def _generate_upstream(model: dict, prompt: str, cache_model_id: str, max_attempts: int) -> str | None:
+    provider = model.get("provider", "openrouter")
+    model_id = model["id"]
+    endpoint, headers = _build_endpoint(provider, model)
+    payload = _build_payload(provider, model_id, prompt)
+    est_tokens = estimate_tokens(prompt) + config.MAX_TOKENS
 
+    # 429/5xx/timeouts open a shared backoff window in upstream_limiter, so the next
+    # attempt (from this or any other request) waits inside slot() rather than here.
     last_error = ""
-    for attempt in range(config.MAX_RETRIES):
+    pause = 0.0
+    for attempt in range(max_attempts):
+        if pause:
+            # Slept here, outside slot(), so the wait does not hold a concurrency slot.
+            await asyncio.sleep(pause)
+            pause = 0.0
         try:
-            req_payload = dict(payload)
-            # On retries, lower output budget to improve completion stability on some providers.
-            if attempt > 0:
-                if provider == "google":
-                    gc = dict(req_payload.get("generationConfig") or {})
-                    gc["maxOutputTokens"] = max(512, int(config.MAX_TOKENS / (attempt + 1)))
-                    req_payload["generationConfig"] = gc
-                elif provider == "anthropic":
-                    req_payload["max_tokens"] = max(512, int(config.MAX_TOKENS / (attempt + 1)))
-                else:
-                    req_payload["max_tokens"] = max(512, int(config.MAX_TOKENS / (attempt + 1)))
-            async with aiohttp.ClientSession() as session:
+            _check_breaker(cache_model_id)
+            req_payload = _retry_payload(provider, payload, attempt)
+            async with upstream_limiter.slot(provider, model_id, est_tokens) as ticket:
+                session = await http_pool.get_session()
                 async with session.post(
                     endpoint,
                     headers=headers,
                     json=req_payload,
-                    timeout=config.REQUEST_TIMEOUT,
+                    timeout=aiohttp.ClientTimeout(total=config.REQUEST_TIMEOUT),
                 ) as resp:
                     text = await resp.text()
                     if resp.status != 200:
+                        ticket.record_status(resp.status, resp.headers)
                         last_error = f"HTTP {resp.status}: {text[:300]}"
-                        if attempt < config.MAX_RETRIES - 1:
-                            await asyncio.sleep(2 ** attempt)
+                        if resp.status not in BREAKER_IGNORED_STATUSES:
+                            breakers.record_failure(cache_model_id, last_error)
+                        delay = _status_retry_delay(resp.status, attempt)
+                        if delay is not None and attempt < max_attempts - 1:
+                            pause = delay
                             continue
                         logger.error("LLM API error %s: %s", resp.status, text)
                         raise RuntimeError(last_error)
 
                     data = await resp.json()
-                    if provider == "google":
-                        candidates = data.get("candidates") or []
-                        if not candidates:
-                            logger.error("Invalid Google API response: %s", json.dumps(data)[:300])
-                            return None
-                        parts = (((candidates[0] or {}).get("content") or {}).get("parts") or [])
-                        content = "\n".join([str((p or {}).get("text", "")).strip() for p in parts if (p or {}).get("text")]).strip()
-                    elif provider == "anthropic":
-                        blocks = data.get("content") or []
-                        texts = [str((b or {}).get("text", "")).strip() for b in blocks if (b or {}).get("type") == "text"]
-                        content = "\n".join([t for t in texts if t]).strip()
-                    else:
-                        choices = data.get("choices") or []
-                        if not choices:
-                            logger.error("Invalid API response: %s", json.dumps(data)[:300])
-                            return None
-                        content = choices[0]["message"]["content"].strip()
-                    if not content:
-                        finish_reason = ""
-                        if provider not in {"google", "anthropic"}:
-                            choices = data.get("choices") or []
-                            finish_reason = str((choices[0] or {}).get("finish_reason", "")) if choices else ""
-                        last_error = f"empty_content provider={provider} finish_reason={finish_reason}".strip()
-                        logger.error("Empty content from provider=%s: %s", provider, json.dumps(data)[:300])
-                        if attempt < config.MAX_RETRIES - 1:
-                            await asyncio.sleep(2 ** attempt)
-                            continue
-                        raise RuntimeError(last_error)
-                    cache_response(prompt, cache_model_id, content)
-                    return content
+                    ticket.ok(_usage_tokens(provider, data))
+            if provider == "google":
+                candidates = data.get("candidates") or []
+                if not candidates:
+                    logger.error("Invalid Google API response: %s", json.dumps(data)[:300])
+                    return None
+                parts = (((candidates[0] or {}).get("content") or {}).get("parts") or [])
+                content = "\n".join([str((p or {}).get("text", "")).strip() for p in parts if (p or {}).get("text")]).strip()
+            elif provider == "anthropic":
+                blocks = data.get("content") or []
+                texts = [str((b or {}).get("text", "")).strip() for b in blocks if (b or {}).get("type") == "text"]
+                content = "\n".join([t for t in texts if t]).strip()
+            else:
+                choices = data.get("choices") or []
+                if not choices:
+                    logger.error("Invalid API response: %s", json.dumps(data)[:300])
+                    return None
+                content = choices[0]["message"]["content"].strip()
+            if not content:
+                finish_reason = ""
+                if provider not in {"google", "anthropic"}:
+                    choices = data.get("choices") or []
+                    finish_reason = str((choices[0] or {}).get("finish_reason", "")) if choices else ""
+                last_error = f"empty_content provider={provider} finish_reason={finish_reason}".strip()
+                breakers.record_failure(cache_model_id, last_error)
+                logger.error("Empty content from provider=%s: %s", provider, json.dumps(data)[:300])
+                if attempt < max_attempts - 1:
+                    await asyncio.sleep(upstream_limiter.retry_delay(attempt))
+                    continue
+                raise RuntimeError(last_error)
+            breakers.record_success(cache_model_id)
+            await cache_response(prompt, cache_model_id, content)
+            return content
         except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
             last_error = f"{exc.__class__.__name__}: {exc}"
-            if attempt < config.MAX_RETRIES - 1:
-                await asyncio.sleep(2 ** attempt)
+            breakers.record_failure(cache_model_id, last_error)
+            if attempt < max_attempts - 1:
+                await asyncio.sleep(upstream_limiter.retry_delay(attempt))
                 continue
             logger.error("Request failed: %s", exc)
             raise RuntimeError(last_error)
+        except RuntimeError:
+            raise
         except Exception as exc:
             last_error = f"{exc.__class__.__name__}: {exc}"
             logger.exception("Unexpected generation error: %s", exc)
-            if attempt < config.MAX_RETRIES - 1:
-                await asyncio.sleep(2 ** attempt)
+            if attempt < max_attempts - 1:
+                await asyncio.sleep(upstream_limiter.retry_delay(attempt))
+                continue
+            raise RuntimeError(last_error)
+
+    raise RuntimeError(last_error or "upstream_generation_failed")
+
+
+async def stream_content(model: dict, prompt: str, max_attempts: int | None = None) -> AsyncIterator[str]:
+    """Yield text deltas from the provider's streaming API (SSE for all four providers).
+
+    Retries only happen before the first delta is yielded; once tokens have been sent
+    downstream a failure is raised as RuntimeError instead of silently restarting.
+    Cache hits are served by the caller (_measured_stream); this always goes upstream.
+    """
+    provider = model.get("provider", "openrouter")
+    model_id = model["id"]
+    cache_model_id = model_key(model)
+    max_attempts = max_attempts or config.MAX_RETRIES
+
+    endpoint, headers = _build_endpoint(provider, model, stream=True)
+    payload = _build_payload(provider, model_id, prompt, stream=True)
+    headers = {**headers, "Accept": "text/event-stream"}
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=config.REQUEST_TIMEOUT, sock_read=config.REQUEST_TIMEOUT)
+
+    est_tokens = estimate_tokens(prompt) + config.MAX_TOKENS
+
+    last_error = ""
+    pause = 0.0
+    for attempt in range(max_attempts):
+        if pause:
+            await asyncio.sleep(pause)
+            pause = 0.0
+        parts: list[str] = []
+        try:
+            _check_breaker(cache_model_id)
+            req_payload = _retry_payload(provider, payload, attempt)
+            async with upstream_limiter.slot(provider, model_id, est_tokens) as ticket:
+                session = await http_pool.get_session()
+                async with session.post(endpoint, headers=headers, json=req_payload, timeout=timeout) as resp:
+                    if resp.status != 200:
+                        text = await resp.text()
+                        ticket.record_status(resp.status, resp.headers)
+                        last_error = f"HTTP {resp.status}: {text[:300]}"
+                        if resp.status not in BREAKER_IGNORED_STATUSES:
+                            breakers.record_failure(cache_model_id, last_error)
+                        delay = _status_retry_delay(resp.status, attempt)
+                        if delay is not None and attempt < max_attempts - 1:
+                            pause = delay
+                            continue
+                        logger.error("LLM stream API error %s: %s", resp.status, text)
+                        raise RuntimeError(last_error)
+
+                    async for raw_line in resp.content:
+                        line = raw_line.decode("utf-8", errors="ignore").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        data_text = line[5:].strip()
+                        if not data_text:
+                            continue
+                        if data_text == "[DONE]":
+                            break
+                        try:
+                            data = json.loads(data_text)
+                        except ValueError:
+                            continue
+                        try:
+                            delta = _stream_delta_text(provider, data)
+                        except UpstreamStreamError as exc:
+                            if exc.overloaded:
+                                ticket.overloaded()
+                            else:
+                                ticket.failed()
+                            raise
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                    ticket.ok()
+        except (aiohttp.ClientError, asyncio.TimeoutError, UpstreamStreamError) as exc:
+            last_error = str(exc) if isinstance(exc, UpstreamStreamError) else f"{exc.__class__.__name__}: {exc}"
+            breakers.record_failure(cache_model_id, last_error)
+            if not parts and attempt < max_attempts - 1:
+                await asyncio.sleep(upstream_limiter.retry_delay(attempt))
                 continue
+            logger.error("Stream request failed: %s", exc)
             raise RuntimeError(last_error)
 
+        content = "".join(parts).strip()
+        if not content:
+            last_error = f"empty_content provider={provider} stream=true"
+            breakers.record_failure(cache_model_id, last_error)
+            logger.error("Empty streamed content from provider=%s", provider)
+            if attempt < max_attempts - 1:
+                await asyncio.sleep(upstream_limiter.retry_delay(attempt))
+                continue
+            raise RuntimeError(last_error)
+        breakers.record_success(cache_model_id)
+        await cache_response(prompt, cache_model_id, content)
+        return
+
     raise RuntimeError(last_error or "upstream_generation_failed")
+
+
+def _model_label(model: dict) -> str:
+    """Metric label for a model; client-supplied custom models share one label so they
+    cannot grow the label set without bound."""
+    return "custom" if str(model.get("uid", "")).startswith("custom::") else model["id"]
+
+
+def _observe_upstream(model: dict, prompt: str, content: str, seconds: float) -> None:
+    provider, model_id = model.get("provider", "openrouter"), _model_label(model)
+    upstream_request_seconds.observe(seconds, provider=provider, model=model_id, outcome="ok" if content else "error")
+    if content:
+        upstream_tokens.inc(estimate_tokens(prompt), provider=provider, model=model_id, direction="in")
+        upstream_tokens.inc(estimate_tokens(content), provider=provider, model=model_id, direction="out")
+
+
+async def _measured_stream(model: dict, prompt: str, max_attempts: int | None) -> AsyncIterator[str]:
+    """stream_content that feeds its outcome into model_stats (the router's inputs).
+
+    Cache hits are served here and not measured; they would read as absurdly fast models.
+    """
+    key = model_key(model)
+    cached = await get_cached_response(prompt, key)
+    if cached:
+        logger.info("Using cached response (stream)")
+        yield cached
+        return
+    started = time.monotonic()
+    parts: list[str] = []
+    try:
+        async for delta in stream_content(model, prompt, max_attempts=max_attempts):
+            if not parts:
+                upstream_ttft_seconds.observe(time.monotonic() - started, provider=model.get("provider", "openrouter"), model=_model_label(model))
+            parts.append(delta)
+            yield delta
+    except CircuitOpenError:
+        raise
+    except (RuntimeError, ValueError):
+        model_stats.record_error(key)
+        _observe_upstream(model, prompt, "", time.monotonic() - started)
+        raise
+    if parts:
+        content = "".join(parts)
+        model_stats.record_success(key, time.monotonic() - started, estimate_tokens(content))
+        _observe_upstream(model, prompt, content, time.monotonic() - started)
+
+
+async def stream_with_failover(models: list[dict], prompt: str, chosen: dict) -> AsyncIterator[str]:
+    """stream_content over a failover chain; switching is only possible before the first delta.
+
+    The model that produced the stream is stored in chosen["model"].
+    """
+    candidates = _failover_candidates(models)
+    last_exc: Exception | None = None
+    for i, model in enumerate(candidates):
+        is_last = i == len(candidates) - 1
+        attempts = None if is_last else config.MODEL_FAILOVER_ATTEMPTS
+        producers = [model, _hedge_target(model, None if is_last else candidates[i + 1])]
+        winner = [0]
+        if config.HEDGE_ENABLED:
+            source = hedger.stream(
+                f"{model_key(model)}#ttft",
+                lambda: _measured_stream(producers[0], prompt, attempts),
+                lambda: _measured_stream(producers[1], prompt, attempts),
+                on_winner=lambda idx: winner.__setitem__(0, idx),
+            )
+        else:
+            source = _measured_stream(model, prompt, attempts)
+        started = False
+        try:
+            async for delta in source:
+                if not started:
+                    started = True
+                    chosen["model"] = producers[winner[0]]
+                yield delta
+            if started:
+                return
+        except (RuntimeError, ValueError) as exc:
+            if started:
+                raise
+            last_exc = exc
+            if not is_last:
+                logger.warning("Failing over stream from %s: %s", model_key(model), exc)
+    if last_exc is not None:
+        raise last_exc if isinstance(last_exc, RuntimeError) else RuntimeError(str(last_exc))
@@ -0,0 +1,62 @@
+"""Pure post-processing steps for model output, grouped so each is one executor hop.
+
+Everything here is a module-level function of plain data (str/dict/list), which lets
+CpuOffload run it in a thread or a worker process.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any
+
+from .content_quality import audit_chapters, clean_chapter_content, ensure_unique_titles, extract_title_and_chapters
+
+
+def extract_single_continue_chapter(content: str, next_idx: int) -> dict:
+    text = (content or "").strip()
+    if not text:
+        return {"title": f"第{next_idx}章", "content": ""}
+
+    # Prefer explicit chapter heading.
+    m = re.search(rf"(?m)^\s*第\s*{next_idx}\s*[章节卷]\s*[^\n]*", text)
+    if m:
+        title = m.group(0).strip()
+        body = text[m.end():].strip()
+        return {"title": title or f"第{next_idx}章", "content": body}
+
+    # Fallback: use first line as title only if it looks like a chapter heading.
+    first_line, _, rest = text.partition("\n")
+    if re.search(r"^\s*第\s*[一二三四五六七八九十百千万\d]+\s*[章节卷]", first_line):
+        return {"title": first_line.strip(), "content": rest.strip()}
+
+    # Hard fallback: force correct next-chapter title and keep full body.
+    return {"title": f"第{next_idx}章", "content": text}
+
+
+def parse_generated(content: str, mode: str, next_idx: int = 1) -> tuple[str, list[dict]]:
+    """Parse a generation into (title, cleaned chapters); continue yields one chapter and no title."""
+    if mode == "continue":
+        one = extract_single_continue_chapter(content, next_idx)
+        return "", [{"title": one["title"], "content": clean_chapter_content(one.get("content", ""))}]
+    title, chapters = extract_title_and_chapters(content)
+    chapters = ensure_unique_titles(chapters)
+    return title, [{"title": c["title"], "content": clean_chapter_content(c.get("content", ""))} for c in chapters]
+
+
+def parse_expanded(expanded: str, title: str) -> dict:
+    """First chapter of an expansion output, or the whole output under the old title."""
+    _, parsed = extract_title_and_chapters(expanded)
+    if parsed:
+        nxt = parsed[0]
+        return {"title": nxt.get("title") or title, "content": clean_chapter_content(nxt.get("content", ""))}
+    return {"title": title, "content": clean_chapter_content(expanded)}
+
+
+def clean_and_audit(title: str, content: str) -> tuple[str, dict[str, Any]]:
+    """Clean one chapter and return (content, its audit row)."""
+    content = clean_chapter_content(content)
+    return content, audit_chapters([{"title": title, "content": content}])["chapters"][0]
+
+
+def chapters_size(chapters: list[dict]) -> int:
+    return sum(len(str(c.get("content") or "")) for c in chapters)
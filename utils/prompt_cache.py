@@ -0,0 +1,178 @@
+"""Prompt canonicalization and an opt-in near-duplicate response cache.
+
+The response cache is keyed on the rendered prompt, so two requests that differ only in
+stray ASCII whitespace or in the key order of a card dict used to miss each other.
+`canonical()` normalizes the builder inputs before the prompt is rendered. Equivalent
+requests then render byte-identical prompts and share the cache and the single-flight.
+
+NearDupCache goes further, for modes where a close-enough earlier answer is fine, such
+as inspiration brainstorms. The free text is reduced to character-bigram shingles and a
+MinHash signature; LSH banding finds candidates; the best match at or above
+`threshold` estimated Jaccard similarity is reused. Everything except the free text
+(mode, genre, style, model, ...) is hashed into a scope and must match exactly.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any
+
+_SPACE_RUN = re.compile(r"[ \t]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_MERSENNE = (1 << 61) - 1
+
+
+def normalize_text(text: str) -> str:
+    """Unify newlines, drop trailing spaces, collapse ASCII space runs inside a line and
+    runs of blank lines. The result is what the model is sent, so wording, leading
+    indentation (e.g. the "　　" paragraph indent) and non-ASCII spaces are kept."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    lines = []
+    for line in text.split("\n"):
+        body = line.lstrip(" \t")
+        indent = line[: len(line) - len(body)]
+        body = _SPACE_RUN.sub(" ", body).rstrip(" \t")
+        lines.append(indent + body if body else "")
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip("\n")
+
+
+def canonical(value: Any) -> Any:
+    """Normalize prompt-builder inputs: strings via normalize_text, dicts sorted by key
+    with empty values dropped, lists element-wise."""
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, dict):
+        items = ((str(k).strip(), canonical(v)) for k, v in value.items())
+        return {k: v for k, v in sorted(items) if v not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    return value
+
+
+def scope_key(fields: dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(canonical(fields), ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def shingles(text: str, k: int = 2) -> set[str]:
+    """Character k-grams of the text with case, width, whitespace and punctuation folded away."""
+    folded = "".join(
+        ch for ch in unicodedata.normalize("NFKC", text).lower() if ch.isalnum()
+    )
+    if len(folded) <= k:
+        return {folded} if folded else set()
+    return {folded[i:i + k] for i in range(len(folded) - k + 1)}
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [(rng.randrange(1, _MERSENNE), rng.randrange(0, _MERSENNE)) for _ in range(num_perm)]
+
+    def signature(self, tokens: set[str]) -> tuple[int, ...]:
+        hashes = [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "big") for t in tokens]
+        if not hashes:
+            return tuple([_MERSENNE] * self.num_perm)
+        return tuple(min((a * h + b) % _MERSENNE for h in hashes) for a, b in self._perms)
+
+
+def similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return sum(x == y for x, y in zip(a, b)) / len(a) if a else 0.0
+
+
+class NearDupCache:
+    """In-process LRU of (scope, text) -> content with MinHash/LSH lookup and a TTL.
+
+    64 permutations in 16 bands of 4 rows: pairs at 0.8 similarity become candidates
+    with ~99% probability, pairs at 0.4 with ~34%, and every candidate is then checked
+    against `threshold`.
+    """
+
+    def __init__(self, *, modes: set[str], threshold: float = 0.8, ttl_sec: int = 3600, max_entries: int = 512, bands: int = 16, rows: int = 4):
+        self.modes = modes
+        self.threshold = threshold
+        self.ttl_sec = ttl_sec
+        self.max_entries = max(1, max_entries)
+        self.bands = bands
+        self.rows = rows
+        self.hasher = MinHasher(bands * rows)
+        self._entries: OrderedDict[int, tuple[str, tuple[int, ...], str, float]] = OrderedDict()
+        self._buckets: dict[tuple[str, int, tuple[int, ...]], set[int]] = {}
+        self._next_id = 0
+        self.counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def enabled_for(self, mode: str) -> bool:
+        return mode in self.modes
+
+    def _bands(self, scope: str, sig: tuple[int, ...]):
+        for i in range(self.bands):
+            yield scope, i, sig[i * self.rows:(i + 1) * self.rows]
+
+    def _drop(self, entry_id: int) -> None:
+        scope, sig, _, _ = self._entries.pop(entry_id)
+        for band in self._bands(scope, sig):
+            ids = self._buckets.get(band)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._buckets[band]
+
+    def get(self, scope: str, text: str) -> tuple[str, float] | None:
+        """(content, similarity) of the closest live entry in `scope`, or None."""
+        now = time.time()
+        sig = self.hasher.signature(shingles(text))
+        candidates: set[int] = set()
+        for band in self._bands(scope, sig):
+            candidates |= self._buckets.get(band, set())
+        best: tuple[float, int] | None = None
+        for entry_id in candidates:
+            _, other, _, expires_at = self._entries[entry_id]
+            if expires_at <= now:
+                self._drop(entry_id)
+                continue
+            sim = similarity(sig, other)
+            if sim >= self.threshold and (best is None or sim > best[0]):
+                best = (sim, entry_id)
+        if best is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        self._entries.move_to_end(best[1])
+        return self._entries[best[1]][2], best[0]
+
+    def put(self, scope: str, text: str, content: str) -> None:
+        if not content:
+            return
+        sig = self.hasher.signature(shingles(text))
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (scope, sig, content, time.time() + self.ttl_sec)
+        for band in self._bands(scope, sig):
+            self._buckets.setdefault(band, set()).add(entry_id)
+        self.counters["writes"] += 1
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            "modes": sorted(self.modes),
+            "threshold": self.threshold,
+            "ttl_sec": self.ttl_sec,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            **self.counters,
+            "hit_ratio": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
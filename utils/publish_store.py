@@ -0,0 +1,200 @@
+"""SQLite-backed publish job queue and task history."""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any
+
+PENDING_STATUSES = ("queued", "retry_wait")
+
+
+class PublishStore:
+    """Durable store for scheduled publish jobs and finished publish task records.
+
+    Pending jobs are served from an index on (status, next_run_at), so finding the next
+    due job is O(log n) regardless of how many jobs are scheduled. Finished jobs and task
+    records are compacted down to the configured retention caps once every `compact_every`
+    writes, so either table may briefly hold up to that many rows past its cap. Methods are
+    blocking; call them through asyncio.to_thread from the event loop.
+    """
+
+    def __init__(self, path: Path, *, job_retention: int, task_retention: int, compact_every: int = 64):
+        self.path = path
+        self.job_retention = job_retention
+        self.task_retention = task_retention
+        self.compact_every = max(1, compact_every)
+        self._finished_writes = 0
+        self._task_writes = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS publish_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    created_at TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    next_run_at INTEGER NOT NULL,
+                    data TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_due ON publish_jobs(status, next_run_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON publish_jobs(created_at)")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS publish_tasks (
+                    task_id TEXT PRIMARY KEY,
+                    created_at TEXT NOT NULL,
+                    data TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created ON publish_tasks(created_at)")
+            self._conn = conn
+        return self._conn
+
+    # Jobs
+
+    def add_job(self, job: dict[str, Any]) -> None:
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO publish_jobs VALUES (?, ?, ?, ?, ?)",
+                (job["job_id"], job["created_at"], job["status"], int(job["next_run_at"]), json.dumps(job, ensure_ascii=False)),
+            )
+
+    def save_job(self, job: dict[str, Any]) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "UPDATE publish_jobs SET status = ?, next_run_at = ?, data = ? WHERE job_id = ?",
+                (job["status"], int(job.get("next_run_at", 0)), json.dumps(job, ensure_ascii=False), job["job_id"]),
+            )
+            if job["status"] not in PENDING_STATUSES and job["status"] != "running":
+                self._finished_writes += 1
+                if self._finished_writes % self.compact_every == 0:
+                    self._compact_jobs(db)
+
+    def claim_due_job(self, now: int, owner: str = "") -> dict[str, Any] | None:
+        """Atomically move the earliest due pending job to running, marked with `owner`,
+        and return it."""
+        with self._lock:
+            db = self._db()
+            # Write lock up front: another process sharing the file must not claim the same row.
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT job_id, data FROM publish_jobs WHERE status IN (?, ?) AND next_run_at <= ? "
+                    "ORDER BY next_run_at ASC LIMIT 1",
+                    (*PENDING_STATUSES, now),
+                ).fetchone()
+                job = None
+                if row is not None:
+                    job = json.loads(row[1])
+                    job["status"] = "running"
+                    job["owner"] = owner
+                    db.execute(
+                        "UPDATE publish_jobs SET status = 'running', data = ? WHERE job_id = ?",
+                        (json.dumps(job, ensure_ascii=False), row[0]),
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return job
+
+    def next_run_at(self) -> int | None:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT MIN(next_run_at) FROM publish_jobs WHERE status IN (?, ?)",
+                PENDING_STATUSES,
+            ).fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    def running_owners(self) -> set[str]:
+        with self._lock:
+            rows = self._db().execute("SELECT data FROM publish_jobs WHERE status = 'running'").fetchall()
+        return {json.loads(data).get("owner", "") for (data,) in rows}
+
+    def requeue_running(self, dead_owners: set[str]) -> int:
+        """Jobs left running by a crashed process (an owner in `dead_owners`) are put back
+        in the queue. Jobs of a live owner are left alone; it re-queues them itself if it
+        stops."""
+        with self._lock:
+            db = self._db()
+            rows = db.execute("SELECT data FROM publish_jobs WHERE status = 'running'").fetchall()
+            requeued = 0
+            for (data,) in rows:
+                job = json.loads(data)
+                if job.get("owner", "") not in dead_owners:
+                    continue
+                job["status"] = "queued"
+                job.pop("owner", None)
+                db.execute(
+                    "UPDATE publish_jobs SET status = 'queued', data = ? WHERE job_id = ?",
+                    (json.dumps(job, ensure_ascii=False), job["job_id"]),
+                )
+                requeued += 1
+            return requeued
+
+    def list_jobs(self, limit: int) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT data FROM publish_jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def job_counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._db().execute("SELECT status, COUNT(*) FROM publish_jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def _compact_jobs(self, db: sqlite3.Connection) -> None:
+        db.execute(
+            "DELETE FROM publish_jobs WHERE status IN ('success', 'failed') AND job_id NOT IN ("
+            "SELECT job_id FROM publish_jobs WHERE status IN ('success', 'failed') "
+            "ORDER BY created_at DESC LIMIT ?)",
+            (self.job_retention,),
+        )
+
+    # Tasks
+
+    def save_task(self, task: dict[str, Any]) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO publish_tasks VALUES (?, ?, ?)",
+                (task["task_id"], task["created_at"], json.dumps(task, ensure_ascii=False)),
+            )
+            self._task_writes += 1
+            if self._task_writes % self.compact_every == 0:
+                self._compact_tasks(db)
+
+    def _compact_tasks(self, db: sqlite3.Connection) -> None:
+        db.execute(
+            "DELETE FROM publish_tasks WHERE task_id NOT IN ("
+            "SELECT task_id FROM publish_tasks ORDER BY created_at DESC LIMIT ?)",
+            (self.task_retention,),
+        )
+
+    def recent_tasks(self, limit: int) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT data FROM publish_tasks ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
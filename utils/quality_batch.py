@@ -0,0 +1,183 @@
+"""Batch quality audits for whole manuscripts, streamed as NDJSON.
+
+Chapters are audited in contiguous chunks on a process pool. Only a bounded window of
+chunks is in flight, and rows are emitted in chapter order as soon as they are ready,
+so memory stays flat however long the book is. Each chunk carries the chapter before
+it so coherence scores match a sequential audit_chapters run.
+
+CLI:
+    python -m utils.quality_batch book.json|book.txt|manuscripts/ [--workers 4] [--out report.ndjson]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator
+
+from .content_quality import AuditTotals, default_auditor, extract_title_and_chapters, sensitive_lexicon
+
+BOOK_SUFFIXES = (".json", ".txt")
+DEFAULT_CHUNK_CHAPTERS = 16
+
+
+def chapters_from_json(data: Any) -> tuple[str | None, list[dict[str, Any]]]:
+    """Accept a chapter list, {"title", "chapters"} (incl. book job checkpoints) or {"content"}."""
+    if isinstance(data, list):
+        return None, _normalize(data)
+    if isinstance(data, dict):
+        if isinstance(data.get("chapters"), list):
+            return data.get("title"), _normalize(data["chapters"])
+        if isinstance(data.get("content"), str):
+            return extract_title_and_chapters(data["content"])
+    raise ValueError("无法识别的 JSON 书稿格式：需要章节数组或包含 chapters 字段的对象")
+
+
+def _normalize(items: list) -> list[dict[str, Any]]:
+    out = []
+    for i, item in enumerate(items, 1):
+        if isinstance(item, dict):
+            out.append({"title": str(item.get("title") or f"第{i}章"), "content": str(item.get("content") or "")})
+        elif isinstance(item, str):
+            out.append({"title": f"第{i}章", "content": item})
+    return out
+
+
+def load_book(path: Path) -> tuple[str, list[dict[str, Any]]]:
+    raw = path.read_text(encoding="utf-8-sig")
+    if path.suffix.lower() == ".json":
+        title, chapters = chapters_from_json(json.loads(raw))
+        return title or path.stem, chapters
+    return extract_title_and_chapters(raw)
+
+
+def iter_book_files(path: Path) -> Iterator[Path]:
+    if path.is_dir():
+        for item in sorted(path.rglob("*")):
+            if item.is_file() and item.suffix.lower() in BOOK_SUFFIXES:
+                yield item
+    else:
+        yield path
+
+
+def audit_chunk(chapters: list[dict[str, Any]], prev_content: str | None) -> list[dict[str, Any]]:
+    """Process-pool entry point: audit a contiguous run of chapters."""
+    lexicon = sensitive_lexicon.current()
+    prev = default_auditor.profile(prev_content, lexicon) if prev_content is not None else None
+    rows = []
+    for ch in chapters:
+        profile = default_auditor.profile(ch.get("content", "") or "", lexicon)
+        rows.append(default_auditor.row(ch.get("title", ""), profile, prev))
+        prev = profile
+    return rows
+
+
+def _chunks(chapters: list[dict[str, Any]], size: int) -> Iterator[tuple[int, list[dict[str, Any]], str | None]]:
+    for start in range(0, len(chapters), size):
+        prev = (chapters[start - 1].get("content", "") or "") if start else None
+        yield start, chapters[start:start + size], prev
+
+
+def iter_book_audit(
+    chapters: list[dict[str, Any]],
+    executor: Executor,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_CHAPTERS,
+    window: int = 4,
+) -> Iterator[dict[str, Any]]:
+    """Yield {"index", **audit_row} in chapter order; at most `window` chunks in flight."""
+    chunks = _chunks(chapters, max(1, chunk_size))
+    pending: deque[tuple[int, Future]] = deque()
+    for start, chunk, prev in chunks:
+        pending.append((start, executor.submit(audit_chunk, chunk, prev)))
+        if len(pending) >= window:
+            yield from _drain_one(pending)
+    while pending:
+        yield from _drain_one(pending)
+
+
+def _drain_one(pending: deque) -> Iterator[dict[str, Any]]:
+    start, future = pending.popleft()
+    for offset, row in enumerate(future.result()):
+        yield {"index": start + offset + 1, **row}
+
+
+async def stream_book_audit(
+    chapters: list[dict[str, Any]],
+    executor: Executor,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_CHAPTERS,
+    window: int = 4,
+) -> AsyncIterator[dict[str, Any]]:
+    """Async counterpart of iter_book_audit for the API; never blocks the event loop."""
+    pending: deque[tuple[int, asyncio.Future]] = deque()
+    try:
+        for start, chunk, prev in _chunks(chapters, max(1, chunk_size)):
+            pending.append((start, asyncio.wrap_future(executor.submit(audit_chunk, chunk, prev))))
+            if len(pending) >= window:
+                start0, fut = pending.popleft()
+                for offset, row in enumerate(await fut):
+                    yield {"index": start0 + offset + 1, **row}
+        while pending:
+            start0, fut = pending.popleft()
+            for offset, row in enumerate(await fut):
+                yield {"index": start0 + offset + 1, **row}
+    finally:
+        # Client went away: drop chunks that have not started yet.
+        for _, fut in pending:
+            fut.cancel()
+
+
+def default_workers() -> int:
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m utils.quality_batch", description="批量审查书稿质量，按章输出 NDJSON")
+    parser.add_argument("path", type=Path, help="书稿文件（.json / .txt）或目录")
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK_CHAPTERS, help="每个进程任务包含的章节数")
+    parser.add_argument("--out", type=Path, default=None, help="输出文件，默认标准输出")
+    args = parser.parse_args(argv)
+
+    if not args.path.exists():
+        parser.error(f"路径不存在: {args.path}")
+    out = args.out.open("w", encoding="utf-8") if args.out else sys.stdout
+    failed = 0
+
+    def emit(obj: dict[str, Any]) -> None:
+        out.write(json.dumps(obj, ensure_ascii=False) + "\n")
+
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            books = 0
+            for path in iter_book_files(args.path):
+                books += 1
+                source = str(path)
+                try:
+                    title, chapters = load_book(path)
+                except Exception as exc:
+                    failed += 1
+                    emit({"type": "error", "source": source, "error": str(exc)})
+                    continue
+                emit({"type": "book", "source": source, "title": title, "chapter_count": len(chapters)})
+                totals = AuditTotals()
+                for row in iter_book_audit(chapters, executor, chunk_size=args.chunk, window=args.workers * 2):
+                    totals.add(row)
+                    emit({"type": "chapter", "source": source, **row})
+                emit({"type": "summary", "source": source, **totals.summary()})
+            emit({"type": "done", "books": books, "failed": failed})
+    finally:
+        if args.out:
+            out.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,514 @@
+"""State shared by every worker process: rate-limit windows, counters, leases.
+
+Three interchangeable backends:
+
+- ``memory``: plain dicts, for the default single-process deployment. Leases held in
+  one process mean nothing to another, so the app refuses to run two processes on it.
+- ``sqlite``: one WAL-mode database file, for several workers on one host (uvicorn
+  --workers / gunicorn). Calls are short transactions run through asyncio.to_thread.
+- ``redis``: any Redis-compatible server, for workers spread over hosts. Needs the
+  optional ``redis`` package (``pip install redis``).
+
+Rate limits use a sliding-window counter: hits are counted in fixed windows, and the
+previous window is weighted by how much of it still overlaps the sliding window. That
+costs two counters per key instead of one timestamp per hit. A key untouched for two
+windows carries no state, so backends evict it; the memory backend also caps how many
+keys it tracks.
+
+A lease is a named lock with an expiry. Its owner must renew it before it lapses, so a
+crashed worker's leases free themselves. LeaseManager keeps a worker's leases renewed;
+the app uses one lease to elect the publish-scheduler leader and one per running book job.
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+_worker_id: tuple[int, str] | None = None
+
+
+def worker_id() -> str:
+    """host:pid:nonce, recomputed after a fork so preloaded workers never share one."""
+    global _worker_id
+    pid = os.getpid()
+    if _worker_id is None or _worker_id[0] != pid:
+        _worker_id = (pid, f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:6]}")
+    return _worker_id[1]
+
+
+def _window_weight(now: float, window: float) -> tuple[int, float]:
+    """(current window index, share of the previous window still inside the sliding window)."""
+    idx = int(now // window)
+    return idx, 1.0 - (now - idx * window) / window
+
+
+class SharedBackend(abc.ABC):
+    kind = ""
+    multi_process = False
+
+    @abc.abstractmethod
+    async def hit(self, key: str, limit: int, window: float, now: float) -> tuple[bool, int, int]:
+        """Count a hit unless it would exceed `limit` per sliding `window` seconds.
+
+        Returns (allowed, hits in the current window, hits in the previous window); the
+        current count includes this hit if it was allowed.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def incr(self, name: str, amount: int = 1) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def counters(self, names: list[str]) -> dict[str, int]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """Take the lease if it is free or expired, or extend it if `owner` holds it."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def release(self, name: str, owner: str) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def owner(self, name: str) -> str | None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        return None
+
+
+class MemoryBackend(SharedBackend):
+    kind = "memory"
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max(1, max_keys)
+        # key -> (window idx, current, previous), least recently hit first.
+        self._windows: OrderedDict[str, tuple[int, int, int]] = OrderedDict()
+        self._counters: dict[str, int] = {}
+        self._leases: dict[str, tuple[str, float]] = {}
+        self.evicted = {"idle": 0, "cap": 0}
+
+    async def hit(self, key: str, limit: int, window: float, now: float) -> tuple[bool, int, int]:
+        idx, weight = _window_weight(now, window)
+        w_idx, cur, prev = self._windows.pop(key, (idx, 0, 0))
+        if w_idx != idx:
+            cur, prev = 0, (cur if w_idx == idx - 1 else 0)
+        allowed = prev * weight + cur + 1 <= limit
+        if allowed:
+            cur += 1
+        self._windows[key] = (idx, cur, prev)
+        # Keys are ordered by last hit, so idle ones (no hits in this or the previous
+        # window) sit at the front: evicting them costs O(1) per hit, amortized.
+        while self._windows:
+            oldest, (o_idx, _, _) = next(iter(self._windows.items()))
+            if o_idx >= idx - 1:
+                break
+            del self._windows[oldest]
+            self.evicted["idle"] += 1
+        while len(self._windows) > self.max_keys:
+            # Past the cap the least recently seen key starts over; that can only let a
+            # client through early, never block one wrongly.
+            self._windows.popitem(last=False)
+            self.evicted["cap"] += 1
+        return allowed, cur, prev
+
+    def rate_keys(self) -> int:
+        return len(self._windows)
+
+    async def incr(self, name: str, amount: int = 1) -> None:
+        self._counters[name] = self._counters.get(name, 0) + amount
+
+    async def counters(self, names: list[str]) -> dict[str, int]:
+        return {n: self._counters.get(n, 0) for n in names}
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        held = self._leases.get(name)
+        if held is None or held[0] == owner or held[1] <= now:
+            self._leases[name] = (owner, now + ttl)
+            return True
+        return False
+
+    async def release(self, name: str, owner: str) -> None:
+        held = self._leases.get(name)
+        if held is not None and held[0] == owner:
+            del self._leases[name]
+
+    async def owner(self, name: str) -> str | None:
+        held = self._leases.get(name)
+        return held[0] if held is not None and held[1] > time.time() else None
+
+
+class SqliteBackend(SharedBackend):
+    kind = "sqlite"
+    multi_process = True
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: tuple[int, sqlite3.Connection] | None = None
+        self._hits = 0
+
+    def _db(self) -> sqlite3.Connection:
+        # Reopen after a fork: an inherited SQLite connection must not be used by the child.
+        if self._conn is None or self._conn[0] != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_windows (key TEXT NOT NULL, idx INTEGER NOT NULL, "
+                "hits INTEGER NOT NULL, PRIMARY KEY (key, idx))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn = (os.getpid(), conn)
+        return self._conn[1]
+
+    def _hit(self, key: str, limit: int, window: float, now: float) -> tuple[bool, int, int]:
+        idx, weight = _window_weight(now, window)
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = dict(db.execute(
+                    "SELECT idx, hits FROM rate_windows WHERE key = ? AND idx >= ?", (key, idx - 1)
+                ).fetchall())
+                cur, prev = rows.get(idx, 0), rows.get(idx - 1, 0)
+                allowed = prev * weight + cur + 1 <= limit
+                if allowed:
+                    db.execute(
+                        "INSERT INTO rate_windows (key, idx, hits) VALUES (?, ?, 1) "
+                        "ON CONFLICT(key, idx) DO UPDATE SET hits = hits + 1",
+                        (key, idx),
+                    )
+                    cur += 1
+                self._hits += 1
+                if self._hits % self.PRUNE_EVERY == 0:
+                    # Windows older than the previous one can never matter again: this
+                    # evicts idle keys, so the table holds only keys seen in two windows.
+                    db.execute("DELETE FROM rate_windows WHERE idx < ?", (idx - 1,))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return allowed, cur, prev
+
+    def _incr(self, name: str, amount: int) -> None:
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                (name, amount, amount),
+            )
+
+    def _counters(self, names: list[str]) -> dict[str, int]:
+        with self._lock:
+            rows = dict(self._db().execute(
+                f"SELECT name, value FROM counters WHERE name IN ({','.join('?' * len(names))})", names
+            ).fetchall()) if names else {}
+        return {n: int(rows.get(n, 0)) for n in names}
+
+    def _acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cur = self._db().execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                (name, owner, now + ttl, now),
+            )
+            return cur.rowcount > 0
+
+    def _release(self, name: str, owner: str) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def _owner(self, name: str) -> str | None:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT owner FROM leases WHERE name = ? AND expires_at > ?", (name, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    async def hit(self, key: str, limit: int, window: float, now: float) -> tuple[bool, int, int]:
+        return await asyncio.to_thread(self._hit, key, limit, window, now)
+
+    async def incr(self, name: str, amount: int = 1) -> None:
+        await asyncio.to_thread(self._incr, name, amount)
+
+    async def counters(self, names: list[str]) -> dict[str, int]:
+        return await asyncio.to_thread(self._counters, names)
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        return await asyncio.to_thread(self._acquire, name, owner, ttl)
+
+    async def release(self, name: str, owner: str) -> None:
+        await asyncio.to_thread(self._release, name, owner)
+
+    async def owner(self, name: str) -> str | None:
+        return await asyncio.to_thread(self._owner, name)
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._conn[0] == os.getpid():
+                self._conn[1].close()
+            self._conn = None
+
+
+# KEYS[1] current window, KEYS[2] previous window; ARGV: limit, weight, window ms.
+_REDIS_HIT = """
+local cur = tonumber(redis.call('GET', KEYS[1]) or '0')
+local prev = tonumber(redis.call('GET', KEYS[2]) or '0')
+if prev * tonumber(ARGV[2]) + cur + 1 > tonumber(ARGV[1]) then
+  return {0, cur, prev}
+end
+redis.call('INCR', KEYS[1])
+redis.call('PEXPIRE', KEYS[1], ARGV[3] * 2)
+return {1, cur + 1, prev}
+"""
+_REDIS_ACQUIRE = """
+local holder = redis.call('GET', KEYS[1])
+if holder == false or holder == ARGV[1] then
+  redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+  return 1
+end
+return 0
+"""
+_REDIS_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisBackend(SharedBackend):
+    kind = "redis"
+    multi_process = True
+
+    def __init__(self, url: str, prefix: str = "novelgen:"):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as exc:
+            raise RuntimeError("SHARED_BACKEND=redis requires the redis package: pip install redis") from exc
+        self._redis = redis_asyncio.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def hit(self, key: str, limit: int, window: float, now: float) -> tuple[bool, int, int]:
+        idx, weight = _window_weight(now, window)
+        base = f"{self.prefix}rl:{key}:"
+        allowed, cur, prev = await self._redis.eval(
+            _REDIS_HIT, 2, f"{base}{idx}", f"{base}{idx - 1}", limit, weight, int(window * 1000)
+        )
+        return bool(int(allowed)), int(cur), int(prev)
+
+    async def incr(self, name: str, amount: int = 1) -> None:
+        await self._redis.hincrby(f"{self.prefix}counters", name, amount)
+
+    async def counters(self, names: list[str]) -> dict[str, int]:
+        values = await self._redis.hmget(f"{self.prefix}counters", names) if names else []
+        return {n: int(v or 0) for n, v in zip(names, values)}
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        return bool(await self._redis.eval(_REDIS_ACQUIRE, 1, f"{self.prefix}lease:{name}", owner, int(ttl * 1000)))
+
+    async def release(self, name: str, owner: str) -> None:
+        await self._redis.eval(_REDIS_RELEASE, 1, f"{self.prefix}lease:{name}", owner)
+
+    async def owner(self, name: str) -> str | None:
+        return await self._redis.get(f"{self.prefix}lease:{name}")
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def lock_single_process(path: Path) -> Any | None:
+    """Take an exclusive lock on `path` for the life of the process; None if another
+    process already holds it. Closing the returned handle releases it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle = open(path, "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def create_backend(kind: str, *, sqlite_path: Path, redis_url: str, max_rate_keys: int = 100_000) -> SharedBackend:
+    if kind == "memory":
+        return MemoryBackend(max_rate_keys)
+    if kind == "sqlite":
+        return SqliteBackend(sqlite_path)
+    if kind == "redis":
+        if not redis_url:
+            raise RuntimeError("SHARED_BACKEND=redis requires SHARED_REDIS_URL")
+        return RedisBackend(redis_url)
+    raise RuntimeError(f"SHARED_BACKEND must be memory, sqlite or redis, got {kind!r}")
+
+
+def _seconds_until_allowed(now: float, window: float, limit: int, cur: int, prev: int) -> float:
+    """How long until prev * weight + cur + 1 <= limit, with the weight decaying linearly."""
+    idx, weight = _window_weight(now, window)
+    if prev * weight + cur + 1 <= limit:
+        return 0.0
+    start = idx * window
+    if cur + 1 <= limit:
+        # The previous window's share has to decay far enough.
+        return start + window * (1 - (limit - cur - 1) / prev) - now
+    # This window alone is full: wait until it becomes the previous one and decays.
+    return start + window * (2 - (limit - 1) / cur) - now
+
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int  # seconds until a request is allowed again (or until the window rolls over)
+    window: int
+
+    def headers(self) -> dict[str, str]:
+        """IETF RateLimit header fields, plus Retry-After when the request was refused."""
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+            "RateLimit-Policy": f"{self.limit};w={self.window}",
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.reset)
+        return headers
+
+
+class SharedRateLimiter:
+    """Per-key request limits over a sliding minute, enforced across all workers.
+
+    Each route class (gen, health, publish, ...) has its own per-minute limit; classes
+    not listed fall back to `default_per_minute`.
+    """
+
+    WINDOW = 60.0
+
+    def __init__(self, backend: SharedBackend, default_per_minute: int, limits: dict[str, int] | None = None):
+        self.backend = backend
+        self.default_per_minute = max(1, default_per_minute)
+        self.limits = {name: max(1, value) for name, value in (limits or {}).items()}
+        self.rejected: dict[str, int] = {}
+
+    def limit_for(self, route_class: str) -> int:
+        return self.limits.get(route_class, self.default_per_minute)
+
+    async def check(self, route_class: str, key: str) -> RateLimitDecision:
+        limit = self.limit_for(route_class)
+        now = time.time()
+        allowed, cur, prev = await self.backend.hit(key, limit, self.WINDOW, now)
+        idx, weight = _window_weight(now, self.WINDOW)
+        remaining = max(0, math.floor(limit - prev * weight - cur))
+        if remaining:
+            reset = (idx + 1) * self.WINDOW - now
+        else:
+            reset = _seconds_until_allowed(now, self.WINDOW, limit, cur, prev)
+        if not allowed:
+            self.rejected[route_class] = self.rejected.get(route_class, 0) + 1
+        return RateLimitDecision(allowed, limit, remaining, max(1, math.ceil(reset)), int(self.WINDOW))
+
+    def stats(self) -> dict[str, Any]:
+        stats: dict[str, Any] = {
+            "backend": self.backend.kind,
+            "limits": {"default": self.default_per_minute, **self.limits},
+            "rejected": dict(self.rejected),
+        }
+        if isinstance(self.backend, MemoryBackend):
+            stats.update(tracked_keys=self.backend.rate_keys(), max_keys=self.backend.max_keys, evicted=dict(self.backend.evicted))
+        return stats
+
+
+class LeaseManager:
+    """Holds this worker's leases and renews them every ttl/3 from run()."""
+
+    def __init__(self, backend: SharedBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self._held: set[str] = set()
+
+    @property
+    def owner(self) -> str:
+        return worker_id()
+
+    def holds(self, name: str) -> bool:
+        return name in self._held
+
+    async def acquire(self, name: str) -> bool:
+        ok = await self.backend.acquire(name, self.owner, self.ttl)
+        if ok:
+            self._held.add(name)
+        else:
+            self._held.discard(name)
+        return ok
+
+    async def release(self, name: str) -> None:
+        self._held.discard(name)
+        await self.backend.release(name, self.owner)
+
+    async def run(
+        self,
+        on_tick: Callable[[], Awaitable[None]] | None = None,
+        on_lost: Callable[[str], None] | None = None,
+    ) -> None:
+        """on_lost(name) is called when another owner took a lease over, so the work it
+        guarded can be stopped before two workers run it."""
+        while True:
+            for name in list(self._held):
+                try:
+                    if not await self.acquire(name):
+                        logger.warning("Lost lease %s", name)
+                        if on_lost is not None:
+                            on_lost(name)
+                except Exception as exc:
+                    logger.warning("Lease renewal failed for %s: %s", name, exc)
+            if on_tick is not None:
+                try:
+                    await on_tick()
+                except Exception as exc:
+                    logger.exception("Lease tick failed: %s", exc)
+            await asyncio.sleep(self.ttl / 3)
+
+    async def release_all(self) -> None:
+        for name in list(self._held):
+            try:
+                await self.release(name)
+            except Exception:
+                pass
+
+    def stats(self) -> dict[str, Any]:
+        return {"worker_id": self.owner, "backend": self.backend.kind, "leases": sorted(self._held)}
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one in-flight upstream call.
+
+    The shared call runs as its own task so one caller timing out does not cancel it for
+    the others; it is only cancelled once every waiter has gone away.
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._waiters: dict[str, int] = {}
+        self.counters = {"upstream_calls": 0, "coalesced_calls": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            self.counters["upstream_calls"] += 1
+            task.add_done_callback(lambda _t, k=key: self._forget(k, _t))
+        else:
+            self.counters["coalesced_calls"] += 1
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters.get(key) == 1:
+                task.cancel()
+            raise
+        finally:
+            if key in self._waiters and self._inflight.get(key) is task:
+                self._waiters[key] -= 1
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            self._inflight.pop(key, None)
+            self._waiters.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved when nobody is left awaiting it.
+            task.exception()
+
+    def stats(self) -> dict[str, int]:
+        return {**self.counters, "inflight": len(self._inflight)}
@@ -0,0 +1,230 @@
+"""Rolling story memory: compact, fixed-budget continuation context for long books.
+
+Instead of re-sending raw chapter text, continuation prompts get per-chapter extractive
+summaries, a character/state ledger built from role_cards, and the still-open foreshadows.
+Summaries are cached by chapter content hash, so each update only processes chapters that
+are new or changed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+SENTENCE_PATTERN = re.compile(r"[^。！？!?\n]+[。！？!?]?")
+SUMMARY_CHARS = 160
+TAIL_CHARS = 800
+RESOLVED_MARKERS = {"resolved", "closed", "done", "已回收", "已解决"}
+
+_SUMMARY_CACHE: OrderedDict[str, str] = OrderedDict()
+_SUMMARY_CACHE_MAX = 4096
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+def summarize_chapter(content: str, max_chars: int = SUMMARY_CHARS) -> str:
+    """Extractive summary: opening and closing sentences, which carry setup and hook."""
+    key = f"{max_chars}:{_content_hash(content)}"
+    cached = _SUMMARY_CACHE.get(key)
+    if cached is not None:
+        _SUMMARY_CACHE.move_to_end(key)
+        return cached
+    sentences = [s.strip() for s in SENTENCE_PATTERN.findall(content or "") if len(s.strip()) >= 4]
+    if len(sentences) <= 4:
+        picked = sentences
+    else:
+        picked = sentences[:2] + ["……"] + sentences[-2:]
+    summary = "".join(picked)
+    if len(summary) > max_chars:
+        half = max_chars // 2
+        summary = summary[:half] + "……" + summary[-half:]
+    _SUMMARY_CACHE[key] = summary
+    if len(_SUMMARY_CACHE) > _SUMMARY_CACHE_MAX:
+        _SUMMARY_CACHE.popitem(last=False)
+    return summary
+
+
+def _card_name(card: Any) -> str:
+    if isinstance(card, dict):
+        for key in ("name", "姓名", "名字", "title"):
+            value = card.get(key)
+            if isinstance(value, str) and value.strip():
+                return value.strip()
+        return ""
+    return str(card).strip().split("：")[0].split(":")[0][:20] if card else ""
+
+
+def _foreshadow_text(item: Any) -> tuple[str, bool]:
+    if isinstance(item, dict):
+        text = str(item.get("content") or item.get("description") or item.get("name") or item.get("title") or "").strip()
+        status = str(item.get("status") or "").strip().lower()
+        return text, status in RESOLVED_MARKERS or bool(item.get("resolved"))
+    return str(item or "").strip(), False
+
+
+def _keywords(text: str) -> list[str]:
+    return [w for w in re.findall(r"[\u4e00-\u9fff]{2,4}|[A-Za-z]{3,}", text or "")][:6]
+
+
+@dataclass
+class ChapterMemory:
+    index: int
+    title: str
+    content_hash: str
+    summary: str
+    # What this chapter contributed to the ledger, so an edit can take it back out.
+    mentions: dict[str, int] = field(default_factory=dict)
+    states: dict[str, str] = field(default_factory=dict)
+    threads: set[int] = field(default_factory=set)
+
+
+@dataclass
+class StoryMemory:
+    role_cards: list = field(default_factory=list)
+    foreshadows: list = field(default_factory=list)
+    chapters: list[ChapterMemory] = field(default_factory=list)
+    characters: dict[str, dict[str, Any]] = field(default_factory=dict)
+    threads: list[dict[str, Any]] = field(default_factory=list)
+    last_tail: str = ""
+
+    def __post_init__(self):
+        for card in self.role_cards or []:
+            name = _card_name(card)
+            if name:
+                self.characters.setdefault(name, {"last_seen": 0, "mentions": 0, "state": ""})
+        for item in self.foreshadows or []:
+            text, resolved = _foreshadow_text(item)
+            if text and not resolved:
+                self.threads.append({"text": text, "keywords": _keywords(text), "last_seen": 0})
+
+    def update(self, chapters: list[dict[str, Any]]) -> None:
+        """Bring the memory up to date; unchanged chapters are skipped by content hash.
+
+        A changed or dropped chapter's previous contribution is subtracted before the new
+        one is added, so re-running update over edited chapters does not double count.
+        """
+        changed = False
+        for idx, ch in enumerate(chapters, 1):
+            if not isinstance(ch, dict):
+                continue
+            content = ch.get("content", "") or ""
+            digest = _content_hash(content)
+            if idx <= len(self.chapters) and self.chapters[idx - 1].content_hash == digest:
+                continue
+            entry = ChapterMemory(idx, (ch.get("title") or f"第{idx}章").strip(), digest, summarize_chapter(content))
+            self._track(entry, content)
+            if idx <= len(self.chapters):
+                self._untrack(self.chapters[idx - 1])
+                self.chapters[idx - 1] = entry
+            else:
+                self.chapters.append(entry)
+            changed = True
+        for stale in self.chapters[len(chapters):]:
+            self._untrack(stale)
+            changed = True
+        del self.chapters[len(chapters):]
+        if changed:
+            self._refresh_last_seen()
+        if chapters and isinstance(chapters[-1], dict):
+            self.last_tail = (chapters[-1].get("content", "") or "")[-TAIL_CHARS:]
+
+    def _track(self, entry: ChapterMemory, content: str) -> None:
+        if not content:
+            return
+        for name, info in self.characters.items():
+            count = content.count(name)
+            if not count:
+                continue
+            info["mentions"] += count
+            entry.mentions[name] = count
+            # The last sentence that mentions the character is a cheap "current state".
+            pos = content.rfind(name)
+            start = max(content.rfind("。", 0, pos), content.rfind("\n", 0, pos)) + 1
+            end = content.find("。", pos)
+            entry.states[name] = content[start:(end + 1 if end != -1 else pos + 60)].strip()[:80]
+        for i, thread in enumerate(self.threads):
+            if thread["keywords"] and any(k in content for k in thread["keywords"]):
+                entry.threads.add(i)
+
+    def _untrack(self, entry: ChapterMemory) -> None:
+        for name, count in entry.mentions.items():
+            self.characters[name]["mentions"] -= count
+
+    def _refresh_last_seen(self) -> None:
+        # Latest sightings come from the per-chapter records, so an edit that drops a
+        # character or thread from its last chapter falls back to the previous one.
+        for info in self.characters.values():
+            info["last_seen"], info["state"] = 0, ""
+        for thread in self.threads:
+            thread["last_seen"] = 0
+        for ch in self.chapters:
+            for name in ch.mentions:
+                self.characters[name]["last_seen"] = ch.index
+                self.characters[name]["state"] = ch.states[name]
+            for i in ch.threads:
+                self.threads[i]["last_seen"] = ch.index
+
+    def render(self, budget_chars: int) -> str:
+        """Render the continuation context within budget_chars.
+
+        The previous chapter's ending is always kept; the ledger sections are trimmed
+        next, and the recap of older chapters shrinks to whatever budget remains.
+        """
+        sections = []
+        if self.characters:
+            lines = [
+                f"- {name}：最近出场第{info['last_seen']}章；{info['state'] or '尚未出场'}"
+                for name, info in sorted(self.characters.items(), key=lambda kv: -kv[1]["last_seen"])
+            ]
+            sections.append("【角色状态】\n" + "\n".join(lines[:12]))
+        if self.threads:
+            lines = [
+                f"- {t['text'][:60]}（{'第' + str(t['last_seen']) + '章提及' if t['last_seen'] else '尚未铺垫'}）"
+                for t in self.threads
+            ]
+            sections.append("【未回收伏笔】\n" + "\n".join(lines[:10]))
+        tail = f"【上一章结尾】\n……{self.last_tail}" if self.last_tail else ""
+        ledger = "\n\n".join(sections)[: max(0, budget_chars - len(tail) - 2)]
+        recap_budget = budget_chars - len(ledger) - len(tail) - len("【前情提要】\n") - 4
+        recap = self._render_recap(recap_budget)
+        parts = ([f"【前情提要】\n{recap}"] if recap else []) + ([ledger] if ledger else []) + ([tail] if tail else [])
+        return "\n\n".join(parts)
+
+    def _render_recap(self, budget: int) -> str:
+        if not self.chapters or budget <= 0:
+            return ""
+        full = [f"{c.title}：{c.summary}" for c in self.chapters]
+        if sum(len(x) + 1 for x in full) <= budget:
+            return "\n".join(full)
+        # Keep the opening chapter (book premise) and the most recent chapters in full;
+        # older middle chapters collapse to their titles.
+        head = [full[0][:budget]]
+        recent: list[str] = []
+        used = len(head[0]) + 1
+        for line in reversed(full[1:]):
+            if used + len(line) + 1 > budget * 0.8:
+                break
+            recent.insert(0, line)
+            used += len(line) + 1
+        middle = [c.title for c in self.chapters[1:len(self.chapters) - len(recent)]]
+        middle_line = ("（略）" + "、".join(middle)) if middle else ""
+        if middle_line and used + len(middle_line) + 1 > budget:
+            middle_line = middle_line[: max(0, budget - used - 2)] + "…"
+        return "\n".join(head + ([middle_line] if middle_line else []) + recent)
+
+
+def build_story_context(
+    chapters: list[dict[str, Any]],
+    *,
+    role_cards: list | None = None,
+    foreshadows: list | None = None,
+    budget_chars: int = 6000,
+) -> str:
+    memory = StoryMemory(role_cards=role_cards or [], foreshadows=foreshadows or [])
+    memory.update(chapters or [])
+    return memory.render(budget_chars)
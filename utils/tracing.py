@@ -0,0 +1,190 @@
+"""Lightweight span tracing tied to the request's x-request-id.
+
+The middleware opens a Trace per request (trace id = the request id's 32 hex digits) and
+code marks stages with ``with span("name", key=value):``. Spans nest through a
+ContextVar, so tasks created inside a span (expansion fan-out, hedges) attach to it.
+Outside a request span() is a no-op. Finished traces can be appended to a file as
+OTLP/JSON lines (the OpenTelemetry collector's file format) and summarised for a
+response's ``debug_timings`` field.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Iterator
+
+MAX_SPANS_PER_TRACE = 2000
+
+_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+_span: ContextVar[Span | None] = ContextVar("span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: str | None, attributes: dict[str, Any]):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error = ""
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    def __init__(self, request_id: str, name: str):
+        self.request_id = request_id
+        self.trace_id = request_id.replace("-", "")[:32].ljust(32, "0")
+        self.root = Span(name, None, {"request_id": request_id})
+        self.spans: list[Span] = []
+        self.closed = False
+
+    def add(self, span: Span) -> None:
+        if not self.closed and len(self.spans) < MAX_SPANS_PER_TRACE:
+            self.spans.append(span)
+
+    def close(self) -> None:
+        self.root.end_ns = time.time_ns()
+        self.closed = True
+
+    def timings(self) -> dict[str, Any]:
+        """Per-stage breakdown: every span in start order plus totals per stage name."""
+        depth = {self.root.span_id: 0}
+        stages = []
+        by_stage: dict[str, dict[str, float]] = {}
+        for s in sorted(self.spans, key=lambda s: s.start_ns):
+            d = depth.get(s.parent_id or "", 0) + 1
+            depth[s.span_id] = d
+            stages.append({
+                "name": s.name,
+                "depth": d,
+                "start_ms": round((s.start_ns - self.root.start_ns) / 1e6, 1),
+                "ms": round(s.duration_ms, 1),
+                **({"error": s.error} if s.error else {}),
+                **({"attrs": s.attributes} if s.attributes else {}),
+            })
+            agg = by_stage.setdefault(s.name, {"count": 0, "total_ms": 0.0})
+            agg["count"] += 1
+            agg["total_ms"] = round(agg["total_ms"] + s.duration_ms, 1)
+        return {
+            "request_id": self.request_id,
+            "total_ms": round(self.root.duration_ms, 1),
+            "stages": stages,
+            "by_stage": by_stage,
+        }
+
+
+def begin_trace(request_id: str, name: str) -> tuple[Trace, tuple]:
+    """Open a trace in the current context; detach() the returned token when done here."""
+    trace = Trace(request_id, name)
+    return trace, (_trace.set(trace), _span.set(trace.root))
+
+
+def detach(token: tuple) -> None:
+    trace_token, span_token = token
+    _span.reset(span_token)
+    _trace.reset(trace_token)
+
+
+def current_trace() -> Trace | None:
+    trace = _trace.get()
+    return trace if trace is not None and not trace.closed else None
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    trace = current_trace()
+    if trace is None:
+        yield None
+        return
+    parent = _span.get()
+    s = Span(name, parent.span_id if parent is not None else trace.root.span_id, attributes)
+    token = _span.set(s)
+    try:
+        yield s
+    except BaseException as exc:
+        s.error = exc.__class__.__name__ + (f": {exc}" if str(exc) else "")
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _span.reset(token)
+        trace.add(s)
+
+
+def record_span(name: str, start_ns: int, end_ns: int | None = None, **attributes: Any) -> None:
+    """Add an already-finished span; for stages that straddle generator yields."""
+    trace = current_trace()
+    if trace is None:
+        return
+    parent = _span.get()
+    s = Span(name, parent.span_id if parent is not None else trace.root.span_id, attributes)
+    s.start_ns = start_ns
+    s.end_ns = end_ns or time.time_ns()
+    trace.add(s)
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(trace: Trace, s: Span) -> dict[str, Any]:
+    out: dict[str, Any] = {
+        "traceId": trace.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 2 if s is trace.root else 1,  # SERVER / INTERNAL
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns or time.time_ns()),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+class OtlpJsonFileExporter:
+    """Append each finished trace as one OTLP/JSON ExportTraceServiceRequest line."""
+
+    def __init__(self, path: Path, service_name: str):
+        self.path = Path(path)
+        self.service_name = service_name
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def encode(self, trace: Trace) -> str:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [_otlp_span(trace, s) for s in [trace.root, *trace.spans]],
+                }],
+            }]
+        }
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+    def export(self, trace: Trace) -> None:
+        line = self.encode(trace) + "\n"
+        with self._lock, self.path.open("a", encoding="utf-8") as fh:
+            fh.write(line)
@@ -0,0 +1,322 @@
+"""Provider- and model-aware limiter for upstream LLM calls.
+
+Each provider gets RPM/TPM token buckets and a shared backoff window; each model gets an
+AIMD concurrency limit. A 429/5xx (or timeout) halves the model's concurrency, opens a
+backoff window (Retry-After when the provider sends one, jittered exponential otherwise)
+that every request to that provider/model waits out, and successes grow the limit back
+one slot per round trip. Throughput therefore settles near what the provider actually
+sustains instead of every request retrying on its own schedule.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Mapping
+
+OVERLOAD_STATUSES = {429, 500, 502, 503, 504, 529}
+_CJK = re.compile(r"[\u4e00-\u9fff]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate: ~1 token per CJK char, ~4 chars per token otherwise."""
+    cjk = len(_CJK.findall(text or ""))
+    return cjk + (len(text or "") - cjk) // 4 + 1
+
+
+def parse_retry_after(headers: Mapping[str, str] | None) -> float | None:
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return max(0.0, float(ms) / 1000)
+        except ValueError:
+            pass
+    value = (headers.get("retry-after") or "").strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Reservation-style bucket: callers take tokens now and sleep off any deficit."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def adjust(self, delta: float) -> None:
+        """Charge (positive) or refund (negative) tokens once the real usage is known."""
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class AimdLimit:
+    """Additive-increase / multiplicative-decrease concurrency limit."""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, decrease_cooldown: float = 1.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.in_flight = 0
+        self.decrease_cooldown = decrease_cooldown
+        self._last_decrease = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> None:
+        while self.in_flight >= int(self.limit):
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+                elif fut.done() and not fut.cancelled():
+                    self._wake()
+                raise
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def on_success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def on_overload(self, now: float) -> None:
+        # One burst of 429s should halve the limit once, not once per failed request.
+        if now - self._last_decrease >= self.decrease_cooldown:
+            self.limit = max(self.minimum, self.limit * 0.5)
+            self._last_decrease = now
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+
+
+class Backoff:
+    """Shared backoff window: full-jitter exponential, or the provider's Retry-After."""
+
+    def __init__(self, base: float, cap: float):
+        self.base = base
+        self.cap = cap
+        self.failures = 0
+        self.blocked_until = 0.0
+
+    def on_overload(self, retry_after: float | None, now: float) -> float:
+        self.failures += 1
+        if retry_after is not None:
+            delay = min(retry_after, self.cap)
+        else:
+            delay = random.uniform(0, min(self.cap, self.base * (2 ** self.failures)))
+        self.blocked_until = max(self.blocked_until, now + delay)
+        return delay
+
+    def on_success(self) -> None:
+        self.failures = 0
+
+    def wait_time(self, now: float) -> float:
+        return max(0.0, self.blocked_until - now)
+
+
+class _ProviderState:
+    def __init__(self, rpm: float, tpm: float, backoff: Backoff):
+        self.rpm = TokenBucket(rpm)
+        self.tpm = TokenBucket(tpm)
+        self.backoff = backoff
+
+
+class _ModelState:
+    def __init__(self, aimd: AimdLimit, backoff: Backoff):
+        self.aimd = aimd
+        self.backoff = backoff
+        self.counters = {"ok": 0, "overloaded": 0, "failed": 0, "waited_ms": 0}
+
+
+class UpstreamTicket:
+    """Handle for one upstream attempt; report its outcome exactly once."""
+
+    def __init__(self, limiter: UpstreamLimiter, provider: _ProviderState, model: _ModelState, est_tokens: int):
+        self._limiter = limiter
+        self._provider = provider
+        self._model = model
+        self._est_tokens = est_tokens
+        self.recorded = False
+
+    def ok(self, tokens_used: int | None = None) -> None:
+        if self.recorded:
+            return
+        self.recorded = True
+        if tokens_used:
+            self._provider.tpm.adjust(tokens_used - self._est_tokens)
+        self._model.aimd.on_success()
+        self._model.backoff.on_success()
+        self._provider.backoff.on_success()
+        self._model.counters["ok"] += 1
+
+    def overloaded(self, retry_after: float | None = None) -> None:
+        if self.recorded:
+            return
+        self.recorded = True
+        now = time.monotonic()
+        self._model.aimd.on_overload(now)
+        self._model.backoff.on_overload(retry_after, now)
+        if retry_after is not None:
+            # Retry-After is usually account-wide, so hold the whole provider back.
+            self._provider.backoff.on_overload(retry_after, now)
+        self._model.counters["overloaded"] += 1
+
+    def failed(self) -> None:
+        if not self.recorded:
+            self.recorded = True
+            self._model.counters["failed"] += 1
+
+    def record_status(self, status: int, headers: Mapping[str, str] | None = None) -> None:
+        if status == 200:
+            self.ok()
+        elif status in OVERLOAD_STATUSES:
+            self.overloaded(parse_retry_after(headers))
+        else:
+            self.failed()
+
+
+class UpstreamLimiter:
+    def __init__(
+        self,
+        *,
+        rpm: Mapping[str, float],
+        tpm: Mapping[str, float],
+        max_concurrency: int,
+        min_concurrency: int,
+        backoff_base: float,
+        backoff_cap: float,
+    ):
+        self.rpm = dict(rpm)
+        self.tpm = dict(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._providers: dict[str, _ProviderState] = {}
+        self._models: dict[tuple[str, str], _ModelState] = {}
+
+    def _limit(self, table: Mapping[str, float], provider: str) -> float:
+        return float(table.get(provider, table.get("*", 0)))
+
+    def _provider_state(self, provider: str) -> _ProviderState:
+        state = self._providers.get(provider)
+        if state is None:
+            state = _ProviderState(
+                self._limit(self.rpm, provider),
+                self._limit(self.tpm, provider),
+                Backoff(self.backoff_base, self.backoff_cap),
+            )
+            self._providers[provider] = state
+        return state
+
+    def _model_state(self, provider: str, model_id: str) -> _ModelState:
+        key = (provider, model_id)
+        state = self._models.get(key)
+        if state is None:
+            state = _ModelState(
+                AimdLimit(self.max_concurrency, self.min_concurrency, self.max_concurrency),
+                Backoff(self.backoff_base, self.backoff_cap),
+            )
+            self._models[key] = state
+        return state
+
+    @asynccontextmanager
+    async def slot(self, provider: str, model_id: str, est_tokens: int = 0) -> AsyncIterator[UpstreamTicket]:
+        p = self._provider_state(provider)
+        m = self._model_state(provider, model_id)
+        started = time.monotonic()
+        await m.aimd.acquire()
+        try:
+            # Backoff is checked after taking a concurrency slot, so when a window closes
+            # only `limit` requests go out instead of everything that queued during it.
+            while True:
+                now = time.monotonic()
+                wait = max(p.backoff.wait_time(now), m.backoff.wait_time(now))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            wait = max(p.rpm.reserve(1, now), p.tpm.reserve(est_tokens, now))
+            if wait > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            m.aimd.release()
+            raise
+        m.counters["waited_ms"] += int((time.monotonic() - started) * 1000)
+        ticket = UpstreamTicket(self, p, m, est_tokens)
+        try:
+            yield ticket
+        except (asyncio.TimeoutError, OSError):
+            ticket.overloaded()
+            raise
+        except asyncio.CancelledError:
+            # A cancelled call (e.g. the losing half of a hedge) says nothing about the model.
+            raise
+        except BaseException:
+            ticket.failed()
+            raise
+        finally:
+            m.aimd.release()
+
+    def retry_delay(self, attempt: int) -> float:
+        """Full-jitter delay for retries that are not already gated by a backoff window."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "providers": {
+                name: {
+                    "rpm_limit": s.rpm.capacity,
+                    "tpm_limit": s.tpm.capacity,
+                    "backoff_remaining_sec": round(s.backoff.wait_time(now), 2),
+                }
+                for name, s in self._providers.items()
+            },
+            "models": {
+                f"{provider}:{model_id}": {
+                    "concurrency_limit": round(s.aimd.limit, 2),
+                    "in_flight": s.aimd.in_flight,
+                    "queued": len(s.aimd._waiters),
+                    "backoff_remaining_sec": round(s.backoff.wait_time(now), 2),
+                    **s.counters,
+                }
+                for (provider, model_id), s in self._models.items()
+            },
+        }